@@ -17,6 +17,11 @@ DATETIME_FORMATS = [
     "%Y-%m-%dT%H:%M:%S",
 ]
 DATE_FORMAT = "%Y-%m-%d"
+# Balances are stored as 8 signed limbs of 32 bits each, so the
+# events grabber can increment them atomically. The represented
+# value is the sum of limb_i * 2^(32 * i).
+LIMB_BITS = 32
+LIMB_FIELDS = tuple(f"l{index}" for index in range(8))
 
 
 class MongoDBEnhancedProvider(DefaultJSONProvider):
@@ -55,6 +60,20 @@ def sort_and_page(cursor: Cursor, sort: Optional[Union[dict, list]], skip: Optio
     return cursor
 
 
+def render_balance(balance: dict) -> dict:
+    """
+    Renders the decimal amount of a balance out of its limbs.
+    :param balance: The balance, as stored.
+    :return: The balance, with its amount instead of its limbs.
+    """
+
+    limbs = balance.pop("limbs", None)
+    if limbs is not None:
+        balance["amount"] = str(sum(int(limbs.get(field) or 0) << (LIMB_BITS * index)
+                                    for index, field in enumerate(LIMB_FIELDS)))
+    return balance
+
+
 class CacheApp(Flask):
     """
     The cache app we use.
@@ -190,7 +209,7 @@ def get_brands(session_kwargs: dict):
     if text:
         criteria |= {"$text": {"$search": text}}
     brands = current_app.sort_and_page(
-        current_app.tokens_metadata.find(criteria, **session_kwargs),
+        current_app.tokens_metadata.find(criteria, {"content_hash": 0, "refresh": 0}, **session_kwargs),
         sort=[("metadata.name", ASCENDING)], skip=current_app.get_skip()
     )
     return jsonify({"brands": list(brands)})
@@ -208,7 +227,7 @@ def get_balances(owner: str, session_kwargs: dict):
         current_app.balances.find(criteria, **session_kwargs),
         sort=[("token", ASCENDING)], skip=current_app.get_skip()
     )
-    return jsonify({"balances": list(balances)})
+    return jsonify({"balances": [render_balance(balance) for balance in balances]})
 
 
 @app.route("/deals/<string:dealer>", methods=["GET"])
@@ -293,7 +312,7 @@ def get_tokens(brand: str, session_kwargs: dict):
         tokens = tokens.split(",")
         criteria |= {"token": {"$in": tokens}}
     tokens = current_app.sort_and_page(
-        current_app.tokens_metadata.find(criteria, **session_kwargs),
+        current_app.tokens_metadata.find(criteria, {"content_hash": 0, "refresh": 0}, **session_kwargs),
         sort=[("metadata.name", ASCENDING)], skip=current_app.get_skip()
     )
     return jsonify({"tokens": list(tokens)})
@@ -1,65 +1,94 @@
+from typing import Optional, Union
 from web3 import Web3
-from .abi import METAVERSE_CONTRACT_ABI, SPONSOR_REGISTRY_CONTRACT_ABI, SIGNATURE_VERIFIER_CONTRACT_ABI, \
-    BRAND_REGISTRY_CONTRACT_ABI, ECONOMY_CONTRACT_ABI, CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI, \
-    CURRENCY_MINTING_PLUGIN_CONTRACT_ABI
+from . import abi
+from .multicall import Multicall, MulticallError, MULTICALL3_ADDRESS
 
 
-def get_contracts(web3: Web3, metaverse_contract_address: str):
+def _get_metaverse_contract(web3: Web3, metaverse_contract_address: str):
+    return web3.eth.contract(
+        address=web3.to_checksum_address(metaverse_contract_address),
+        abi=abi.METAVERSE_CONTRACT_ABI
+    )
+
+
+def resolve_contract_addresses(web3: Web3, metaverse_contract_address: str, multicall: Optional[Multicall] = None,
+                               block_identifier: Optional[Union[int, str]] = None) -> dict:
     """
-    Gets all the contracts.
+    Resolves the addresses of all the contracts related to the
+    metaverse, in one round trip.
+    :param web3: The Web3 client to use.
+    :param metaverse_contract_address: The address of the metaverse contract.
+    :param multicall: The -optional- multicall to resolve the addresses with.
+    :param block_identifier: The -optional- block to resolve the addresses at.
+    :return: A dictionary of contract key => address (excluding the metaverse).
+    """
+
+    metaverse_contract = _get_metaverse_contract(web3, metaverse_contract_address)
+    multicall = multicall or Multicall(web3)
+    sponsor_registry_contract_address, signature_verifier_contract_address, brand_registry_contract_address, \
+        economy_contract_address, currency_definition_plugin_contract_address, \
+        currency_minting_plugin_contract_address = multicall.aggregate([
+            metaverse_contract.functions.sponsorRegistry(),
+            metaverse_contract.functions.signatureVerifier(),
+            metaverse_contract.functions.brandRegistry(),
+            metaverse_contract.functions.economy(),
+            metaverse_contract.functions.pluginsList(0),
+            metaverse_contract.functions.pluginsList(1)
+        ], block_identifier)
+    return {
+        "brand_registry": brand_registry_contract_address,
+        "economy": economy_contract_address,
+        "sponsor_registry": sponsor_registry_contract_address,
+        "signature_verifier": signature_verifier_contract_address,
+        "currency_definition_plugin": currency_definition_plugin_contract_address,
+        "currency_minting_plugin": currency_minting_plugin_contract_address
+    }
+
+
+def make_contracts(web3: Web3, metaverse_contract_address: str, addresses: dict):
+    """
+    Makes all the contracts the handlers need, given their already
+    resolved addresses. The signature verifier is not made, since no
+    handler uses it (its address is still resolved, though).
     :param web3: The Web3 client to use.
     :param metaverse_contract_address: The address of the metaverse contract.
+    :param addresses: The addresses, as returned by resolve_contract_addresses.
     :return: The list of connected contracts.
     """
 
     # First, get the metaverse contract.
-    metaverse_contract = web3.eth.contract(
-        address=web3.to_checksum_address(metaverse_contract_address),
-        abi=METAVERSE_CONTRACT_ABI
-    )
+    metaverse_contract = _get_metaverse_contract(web3, metaverse_contract_address)
 
     # Then, get all the other contracts.
 
     # Sponsoring:
-    sponsor_registry_contract_address = metaverse_contract.functions.sponsorRegistry().call()
     sponsor_registry_contract = web3.eth.contract(
-        address=sponsor_registry_contract_address,
-        abi=SPONSOR_REGISTRY_CONTRACT_ABI
-    )
-
-    # Signature verifier:
-    signature_verifier_contract_address = metaverse_contract.functions.signatureVerifier().call()
-    signature_verifier_contract = web3.eth.contract(
-        address=signature_verifier_contract_address,
-        abi=SIGNATURE_VERIFIER_CONTRACT_ABI
+        address=addresses["sponsor_registry"],
+        abi=abi.SPONSOR_REGISTRY_CONTRACT_ABI
     )
 
     # Brand registry:
-    brand_registry_contract_address = metaverse_contract.functions.brandRegistry().call()
     brand_registry_contract = web3.eth.contract(
-        address=brand_registry_contract_address,
-        abi=BRAND_REGISTRY_CONTRACT_ABI
+        address=addresses["brand_registry"],
+        abi=abi.BRAND_REGISTRY_CONTRACT_ABI
     )
 
     # Economy:
-    economy_contract_address = metaverse_contract.functions.economy().call()
     economy_contract = web3.eth.contract(
-        address=economy_contract_address,
-        abi=ECONOMY_CONTRACT_ABI
+        address=addresses["economy"],
+        abi=abi.ECONOMY_CONTRACT_ABI
     )
 
     # Currency definition plug-in:
-    currency_definition_plugin_contract_address = metaverse_contract.functions.pluginsList(0).call()
     currency_definition_plugin_contract = web3.eth.contract(
-        address=currency_definition_plugin_contract_address,
-        abi=CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI
+        address=addresses["currency_definition_plugin"],
+        abi=abi.CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI
     )
 
     # Currency minting plug-in:
-    currency_minting_plugin_contract_address = metaverse_contract.functions.pluginsList(1).call()
     currency_minting_plugin_contract = web3.eth.contract(
-        address=currency_minting_plugin_contract_address,
-        abi=CURRENCY_MINTING_PLUGIN_CONTRACT_ABI
+        address=addresses["currency_minting_plugin"],
+        abi=abi.CURRENCY_MINTING_PLUGIN_CONTRACT_ABI
     )
 
     return {
@@ -67,7 +96,19 @@ def get_contracts(web3: Web3, metaverse_contract_address: str):
         "brand_registry": brand_registry_contract,
         "economy": economy_contract,
         "sponsor_registry": sponsor_registry_contract,
-        "signature_verifier": signature_verifier_contract,
         "currency_definition_plugin": currency_definition_plugin_contract,
         "currency_minting_plugin": currency_minting_plugin_contract
     }
+
+
+def get_contracts(web3: Web3, metaverse_contract_address: str, multicall: Optional[Multicall] = None):
+    """
+    Gets all the contracts.
+    :param web3: The Web3 client to use.
+    :param metaverse_contract_address: The address of the metaverse contract.
+    :param multicall: The -optional- multicall to resolve the addresses with.
+    :return: The list of connected contracts.
+    """
+
+    addresses = resolve_contract_addresses(web3, metaverse_contract_address, multicall)
+    return make_contracts(web3, metaverse_contract_address, addresses)
@@ -1,7 +1,31 @@
-from .metaverse import METAVERSE_CONTRACT_ABI
-from .brand_registry import BRAND_REGISTRY_CONTRACT_ABI
-from .economy import ECONOMY_CONTRACT_ABI
-from .signature_verifier import SIGNATURE_VERIFIER_CONTRACT_ABI
-from .sponsor_registry import SPONSOR_REGISTRY_CONTRACT_ABI
-from .currency_definition_plugin import CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI
-from .currency_minting_plugin import CURRENCY_MINTING_PLUGIN_CONTRACT_ABI
+import importlib
+
+
+# The ABIs are big literals, so each one is imported only when it is
+# first used (e.g. the signature verifier's ABI is never needed).
+_MODULES = {
+    "METAVERSE_CONTRACT_ABI": "metaverse",
+    "BRAND_REGISTRY_CONTRACT_ABI": "brand_registry",
+    "ECONOMY_CONTRACT_ABI": "economy",
+    "SIGNATURE_VERIFIER_CONTRACT_ABI": "signature_verifier",
+    "SPONSOR_REGISTRY_CONTRACT_ABI": "sponsor_registry",
+    "CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI": "currency_definition_plugin",
+    "CURRENCY_MINTING_PLUGIN_CONTRACT_ABI": "currency_minting_plugin",
+    "MULTICALL3_CONTRACT_ABI": "multicall3",
+}
+
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
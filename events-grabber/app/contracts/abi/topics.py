@@ -0,0 +1,61 @@
+import sys
+from typing import Dict, List, Optional
+
+
+# The topics (i.e. the hashed signatures) of the events of each ABI, so
+# they are not hashed on each start. ABIs without events are not listed.
+# They must match the ABIs: tests/test_decoding.py checks they do.
+EVENT_TOPICS: Dict[str, Dict[str, bytes]] = {
+    "METAVERSE_CONTRACT_ABI": {
+        "OwnershipTransferred": bytes.fromhex("8be0079c531659141344cd1fd0a4f28419497f9722a3daafe3b4186f6b6457e0"),
+        "PermissionChanged": bytes.fromhex("24af309445c2eef44ddf2bae5d5064c30788ae79ce92147e1c025c92500cebdb"),
+    },
+    "BRAND_REGISTRY_CONTRACT_ABI": {
+        "BrandPermissionChanged": bytes.fromhex("33b774b0016afe5e5c0a745363d93398f9a388dd53cc99f63af77f80baaa96dd"),
+        "BrandRegistered": bytes.fromhex("fecc98565fe1cef12a209a9e57f11f7798b6a493d33f578fd44d40657e0a32eb"),
+        "BrandRegistrationCostUpdated": bytes.fromhex("c23a57ca62f2d4f1a1e0ff47a10efa60ca13527c86b36bba7e2bbddcdeb397e7"),
+        "BrandRegistrationEarningsReceiverUpdated": bytes.fromhex("10090bf014c7fc6b4d1efbe7e5ab6afbdf9c41abea161f1f1a297ac70528213d"),
+        "BrandSocialCommitmentUpdated": bytes.fromhex("1a9425b12b0cb193f4db2ac1b9bc0712393521978231a7fcf5f0262b847cd549"),
+        "BrandUpdated": bytes.fromhex("7fd1c43abb0471595dcd4d461fdb320d926cbf2b8ba6fa87a78f1b1b0bf3e592"),
+    },
+    "ECONOMY_CONTRACT_ABI": {
+        "ApprovalForAll": bytes.fromhex("17307eab39ab6107e8899845ad3d59bd9653f200f220920489ca2b5937696c31"),
+        "DealAccepted": bytes.fromhex("da900e880533ef699d6aa6d2f335aebbaa3ee39bd882b9e04dd9ec026fedf7b8"),
+        "DealBroken": bytes.fromhex("1337641895a97d35c72fae8dcbc4dcfd7a8fee557697897a00bf7711d9dda10f"),
+        "DealConfirmed": bytes.fromhex("a5fbbfff4decd4f44ed03e28267dd014277bccd985cc2153acfa058f41ae8c07"),
+        "DealStarted": bytes.fromhex("1c882919e2ba75ab4120979204c8cc6957374c1aa5845cd98feacacc9bdb4f0c"),
+        "TransferBatch": bytes.fromhex("4a39dc06d4c0dbc64b70af90fd698a233a518aa5d07e595d983b8c0526c8f7fb"),
+        "TransferSingle": bytes.fromhex("c3d58168c5ae7397731d063d5bbf3d657854427343f4c083240f7aacaa2d0f62"),
+        "URI": bytes.fromhex("6bb7ff708619ba0610cba295a58592e0451dee2622938c8755667688daf3529b"),
+    },
+    "SPONSOR_REGISTRY_CONTRACT_ABI": {
+        "Sponsored": bytes.fromhex("ce6bd22ce68a1cdd94c180d0a3cbe4605f74172837eba2c7305be94919f5758f"),
+    },
+    "CURRENCY_DEFINITION_PLUGIN_CONTRACT_ABI": {
+        "BrandCurrencyDefinitionEarningsReceiverUpdated": bytes.fromhex("6ffb82ca65a5d46a7351340f50eb350c9d72be565c38124a3bcba21b1a732186"),
+        "CurrencyDefined": bytes.fromhex("79661031946efd75ac54d23ab43040b71e17fc0ad0648a4e066a889b884511ee"),
+        "CurrencyDefinitionCostUpdated": bytes.fromhex("64e250f24f1150cf314c62022caf348983d7c567e5fe2b16e6e049d5fa6c2b42"),
+        "CurrencyMetadataUpdated": bytes.fromhex("e7d100c67147a6c7e1705141b41bbf8aa3037f3a84cb2ce2696fade199064bc1"),
+    },
+    "CURRENCY_MINTING_PLUGIN_CONTRACT_ABI": {
+        "BrandCurrencyMintingEarningsReceiverUpdated": bytes.fromhex("cdae7731faaebc6babacd483f50d73e1939fb8a8f14120b870b5dbc94f204741"),
+        "CurrencyMintAmountUpdated": bytes.fromhex("9dee6c195c507e0feb13e9438cab0fb47e71ff863ac21f135971e7e3450129c4"),
+        "CurrencyMintCostUpdated": bytes.fromhex("466e2a6e697187e07bd0aae3021f68b7b21d9cf77c014830637e6b68b1951cb9"),
+    },
+}
+
+
+def shipped_topics(abi: List[dict]) -> Optional[Dict[str, bytes]]:
+    """
+    Gets the precomputed topics of one of the ABIs shipped in this package.
+    Only the ABIs already loaded are checked (none is loaded for this).
+    :param abi: The ABI (it must be the module constant itself).
+    :return: A dictionary of event name => topic, or None if the ABI is
+      not a shipped one.
+    """
+
+    loaded = vars(sys.modules[__package__])
+    for name, topics in EVENT_TOPICS.items():
+        if loaded.get(name) is abi:
+            return topics
+    return None
@@ -0,0 +1,173 @@
+import logging
+from typing import List, Any, Optional, Union
+import requests
+from eth_utils.abi import collapse_if_tuple
+from web3 import Web3
+from web3.contract.contract import ContractFunction
+from rpc import get_client, JsonRpcError
+from .abi import MULTICALL3_CONTRACT_ABI
+
+
+LOGGER = logging.getLogger("grabber:multicall")
+LOGGER.setLevel(logging.INFO)
+
+
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+class MulticallError(Exception):
+    """
+    Raised when a call that was not allowed to fail, failed.
+    """
+
+
+class Multicall:
+    """
+    Resolves many read-only contract calls in a single round trip.
+    When the Multicall3 contract is deployed in the chain, the calls
+    are aggregated with `aggregate3` (which runs them all in the same
+    block). Otherwise (or if `aggregate3` itself fails, e.g. running out
+    of gas), they're sent as a single JSON-RPC batch pinned to a block
+    number or, if the provider can't do that, one by one.
+    """
+
+    def __init__(self, web3: Web3, address: Optional[str] = None, batch_size: int = 200,
+                 timeout: float = 30.0):
+        """
+        Creates the multicall.
+        :param web3: The Web3 client to use.
+        :param address: The -optional- address of the Multicall3 contract.
+          By default, its canonical address.
+        :param batch_size: How many calls to send in a single round trip.
+        :param timeout: The timeout, in seconds, of a JSON-RPC batch.
+        """
+
+        self._web3 = web3
+        self._contract = web3.eth.contract(address=web3.to_checksum_address(address or MULTICALL3_ADDRESS),
+                                           abi=MULTICALL3_CONTRACT_ABI)
+        self._batch_size = max(1, batch_size)
+        self._timeout = timeout
+        self._available = None
+
+    @property
+    def available(self) -> bool:
+        """
+        Tells whether the Multicall3 contract is deployed (checked once).
+        """
+
+        if self._available is None:
+            self._available = len(self._web3.eth.get_code(self._contract.address)) > 0
+            if not self._available:
+                LOGGER.info(f"Multicall3 not found at {self._contract.address}: using JSON-RPC batches instead")
+        return self._available
+
+    def _decode(self, function: ContractFunction, data: bytes) -> Any:
+        """
+        Decodes the return data of a call, like web3 does.
+        :param function: The called function.
+        :param data: The return data.
+        :return: The decoded value (a tuple if there are many outputs).
+        """
+
+        types = [collapse_if_tuple(output) for output in function.abi["outputs"]]
+        values = [self._web3.to_checksum_address(value) if type_ == "address" else value
+                  for type_, value in zip(types, self._web3.codec.decode(types, data))]
+        return values[0] if len(values) == 1 else tuple(values)
+
+    def _try_decode(self, function: ContractFunction, success: bool, data: bytes) -> tuple:
+        """
+        Decodes the return data of a call, if it succeeded.
+        :return: A (success, value) tuple.
+        """
+
+        if not success:
+            return False, None
+        try:
+            return True, self._decode(function, data)
+        except Exception:
+            return False, None
+
+    def _aggregate3(self, calls: List[ContractFunction], block_identifier: Union[int, str]) -> List[tuple]:
+        try:
+            results = self._contract.functions.aggregate3([
+                (call.address, True, call._encode_transaction_data()) for call in calls
+            ]).call(block_identifier=block_identifier)
+        except Exception as e:
+            LOGGER.warning(f"aggregate3 failed ({e}): using a JSON-RPC batch instead")
+            return self._json_rpc_batch(calls, block_identifier)
+        return [self._try_decode(call, success, data) for call, (success, data) in zip(calls, results)]
+
+    def _one_by_one(self, calls: List[ContractFunction], block_identifier: Union[int, str]) -> List[tuple]:
+        results = []
+        for call in calls:
+            try:
+                data = self._web3.eth.call({"to": call.address, "data": call._encode_transaction_data()},
+                                           block_identifier)
+                results.append(self._try_decode(call, True, data))
+            except Exception:
+                results.append((False, None))
+        return results
+
+    def _json_rpc_batch(self, calls: List[ContractFunction], block_identifier: Union[int, str]) -> List[tuple]:
+        block = hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+        client = get_client(self._web3)
+        if client is not None:
+            try:
+                replies = client.batch([("eth_call", [{"to": call.address, "data": call._encode_transaction_data()},
+                                                      block]) for call in calls])
+            except JsonRpcError:
+                # The node does not support batches.
+                return self._one_by_one(calls, block_identifier)
+        else:
+            endpoint = getattr(self._web3.provider, "endpoint_uri", None)
+            if not endpoint:
+                return self._one_by_one(calls, block_identifier)
+            response = requests.post(str(endpoint), json=[{
+                "jsonrpc": "2.0", "id": index, "method": "eth_call",
+                "params": [{"to": call.address, "data": call._encode_transaction_data()}, block]
+            } for index, call in enumerate(calls)], timeout=self._timeout)
+            response.raise_for_status()
+            replies = response.json()
+            if not isinstance(replies, list):
+                # The node does not support batches.
+                return self._one_by_one(calls, block_identifier)
+            replies = {reply.get("id"): reply for reply in replies}
+            replies = [replies.get(index) or {} for index in range(len(calls))]
+        results = []
+        for call, reply in zip(calls, replies):
+            result = reply.get("result")
+            if result is None or "error" in reply:
+                results.append((False, None))
+            else:
+                results.append(self._try_decode(call, True, bytes.fromhex(result[2:])))
+        return results
+
+    def aggregate(self, calls: List[ContractFunction], block_identifier: Optional[Union[int, str]] = None,
+                  allow_failure: bool = False) -> List[Any]:
+        """
+        Resolves many calls, all of them at the same block.
+        :param calls: The calls (e.g. `contract.functions.tokenURI(1)`).
+        :param block_identifier: The -optional- block to run the calls at.
+          By default, the latest one (pinned for all the calls).
+        :param allow_failure: Whether a call may fail. If so, its value is
+          None. Otherwise, a MulticallError is raised.
+        :return: The values, in the same order of the calls.
+        """
+
+        if not calls:
+            return []
+        if self.available:
+            call_batch, block = self._aggregate3, block_identifier or "latest"
+            if len(calls) > self._batch_size and block_identifier is None:
+                block = self._web3.eth.block_number
+        else:
+            call_batch, block = self._json_rpc_batch, block_identifier or self._web3.eth.block_number
+        results = []
+        for index in range(0, len(calls), self._batch_size):
+            results.extend(call_batch(calls[index:index + self._batch_size], block))
+        values = []
+        for call, (success, value) in zip(calls, results):
+            if not success and not allow_failure:
+                raise MulticallError(f"Call failed: {call.fn_name} at {call.address}")
+            values.append(value)
+        return values
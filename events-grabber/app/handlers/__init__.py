@@ -1,7 +1,9 @@
+from typing import Optional
 from pymongo import MongoClient
 from pymongo.client_session import ClientSession
 from web3.contract import Contract
 from .base import ContractEventHandlers
+from .writes import WriteBuffer
 from .metaverse import MetaverseContractEventHandler
 from .brand_registry import BrandRegistryContractEventHandler
 from .currency_definition_plugin import CurrencyDefinitionPluginContractEventHandler
@@ -14,7 +16,12 @@ def make_handlers(client: MongoClient, db_name: str, session_kwargs: dict,
                   metaverse_contract: Contract, brand_registry_contract: Contract,
                   economy_contract: Contract, sponsor_registry_contract: Contract,
                   currency_definition_plugin_contract: Contract,
-                  currency_minting_plugin_contract: Contract) -> ContractEventHandlers:
+                  currency_minting_plugin_contract: Contract,
+                  chunking: Optional[dict] = None,
+                  collection_mode: str = "logs", collection_workers: int = 0,
+                  write_buffer_size: int = 5000,
+                  write_buffer: Optional[WriteBuffer] = None, fetch_ahead: int = 4,
+                  buffer_size: int = 1000) -> ContractEventHandlers:
     """
     Makes a set of contract handlers.
     :param client: The MongoDB client.
@@ -26,17 +33,37 @@ def make_handlers(client: MongoClient, db_name: str, session_kwargs: dict,
     :param sponsor_registry_contract: The sponsor registry contract.
     :param currency_definition_plugin_contract: The currency definition plug-in contract.
     :param currency_minting_plugin_contract: The currency minting plug-in contract.
+    :param chunking: The -optional- settings for the block range chunkers.
+    :param collection_mode: The events collection mode: "logs" or "filters".
+    :param collection_workers: How many handlers can collect events at
+      the same time (0 stands for all of them).
+    :param write_buffer_size: How many writes can be pending in the
+      (shared) write buffer before it flushes by itself.
+    :param write_buffer: The -optional- (shared) write buffer to use instead.
+    :param fetch_ahead: How many fetched windows of logs, per handler,
+      can wait to be decoded.
+    :param buffer_size: How many decoded events, per handler, can wait
+      to be processed.
     :return: The set of contract handlers.
     """
 
-    return ContractEventHandlers(
-        MetaverseContractEventHandler(metaverse_contract, client, db_name, session_kwargs),
-        EconomyContractEventHandler(economy_contract, client, db_name, session_kwargs),
+    if write_buffer is None:
+        write_buffer = WriteBuffer(client[db_name], write_buffer_size)
+
+    handlers = ContractEventHandlers(
+        MetaverseContractEventHandler(metaverse_contract, client, db_name, session_kwargs, write_buffer),
+        EconomyContractEventHandler(economy_contract, client, db_name, session_kwargs, write_buffer),
         BrandRegistryContractEventHandler(brand_registry_contract, metaverse_contract,
-                                          client, db_name, session_kwargs),
-        SponsorRegistryContractEventHandler(sponsor_registry_contract, client, db_name, session_kwargs),
+                                          client, db_name, session_kwargs, write_buffer),
+        SponsorRegistryContractEventHandler(sponsor_registry_contract, client, db_name, session_kwargs,
+                                            write_buffer),
         CurrencyDefinitionPluginContractEventHandler(currency_definition_plugin_contract, metaverse_contract,
-                                                     client, db_name, session_kwargs),
+                                                     client, db_name, session_kwargs, write_buffer),
         CurrencyMintingPluginContractEventHandler(currency_minting_plugin_contract, metaverse_contract,
-                                                  client, db_name, session_kwargs)
+                                                  client, db_name, session_kwargs, write_buffer),
+        collection_workers=collection_workers, fetch_ahead=fetch_ahead, buffer_size=buffer_size
     )
+    handlers.set_collection_mode(collection_mode)
+    if chunking:
+        handlers.configure_chunking(**chunking)
+    return handlers
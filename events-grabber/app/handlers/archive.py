@@ -0,0 +1,369 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+from rpc import LogRecord
+
+
+LOGGER = logging.getLogger("grabber:archive")
+LOGGER.setLevel(logging.INFO)
+
+
+# Each index entry tells the range of blocks a window covers, where
+# its compressed logs are in the data file, and when it was appended.
+_INDEX_ENTRY = struct.Struct("<QQQIQ")
+_DATA_SUFFIX = ".logs"
+_INDEX_SUFFIX = ".index"
+_CONTRACTS_FILE = "contracts.json"
+_STARTS_FILE = "starts.json"
+
+
+class LogArchiveGapError(Exception):
+    """
+    Raised when the archive lacks some of the blocks being read.
+    """
+
+    def __init__(self, address: str, from_block: int, to_block: int):
+        super().__init__(f"The archive of {address} lacks blocks {from_block}:{to_block}")
+        self.address = address
+        self.from_block = from_block
+        self.to_block = to_block
+
+
+class _Segment:
+    """
+    A pair of data / index files being appended by this process.
+    """
+
+    def __init__(self, path: str):
+        self._data = open(path + _DATA_SUFFIX, "ab")
+        self._index = open(path + _INDEX_SUFFIX, "ab")
+
+    def append(self, from_block: int, to_block: int, payload: bytes):
+        # The data goes first: a window is not there until its index
+        # entry is fully written.
+        offset = self._data.tell()
+        self._data.write(payload)
+        self._data.flush()
+        self._index.write(_INDEX_ENTRY.pack(from_block, to_block, offset, len(payload), time.time_ns()))
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class _MappedSegment:
+    """
+    A pair of data / index files being read. The data file is mapped,
+    and mapped again only when its index grows (i.e. when more windows
+    were appended since).
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._index_size = 0
+        self.data = None
+
+    def read_new_entries(self) -> list:
+        """
+        Reads the index entries appended since the last time.
+        :return: The new (from block, to block, appended at, segment,
+          offset, length) entries.
+        """
+
+        try:
+            with open(self._path + _INDEX_SUFFIX, "rb") as f:
+                f.seek(self._index_size)
+                index = f.read()
+        except FileNotFoundError:
+            return []
+        # A trailing partial entry (e.g. being written, or after a
+        # crash) is left for later.
+        index = index[:len(index) - len(index) % _INDEX_ENTRY.size]
+        if not index:
+            return []
+        data = _map(self._path + _DATA_SUFFIX)
+        if data is None:
+            return []
+        self.close()
+        self.data = data
+        entries = []
+        for from_block, to_block, offset, length, appended_at in _INDEX_ENTRY.iter_unpack(index):
+            if offset + length > len(data):
+                break
+            entries.append((from_block, to_block, appended_at, self, offset, length))
+            self._index_size += _INDEX_ENTRY.size
+        return entries
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+class LogArchive:
+    """
+    A local, append-only archive of the raw logs fetched for each
+    contract. Logs are stored per fetched window of blocks, as a
+    compressed record in a data file, and the window is told by an
+    entry in an index file. Each process appends to its own pair of
+    files (a segment) in the contract's directory, so many processes
+    may archive at once. Segments are memory-mapped for reading, once,
+    and their index entries are kept (and read again only when new
+    segments or windows appear).
+
+    Windows may overlap (e.g. a range being fetched again after a
+    crash or a reorg): for each block, the most recently appended
+    window covering it wins.
+    """
+
+    def __init__(self, directory: str, compression_level: int = 6):
+        """
+        Creates the archive.
+        :param directory: The directory of the archive.
+        :param compression_level: The zlib compression level.
+        """
+
+        self._directory = directory
+        self._compression_level = compression_level
+        self._segments: Dict[str, _Segment] = {}
+        self._readers: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _contract_directory(self, address: str) -> str:
+        return os.path.join(self._directory, address.lower())
+
+    def append(self, address: str, from_block: int, to_block: int, logs: List[LogRecord]):
+        """
+        Appends the raw logs of a contract fetched in a window of blocks.
+        All the logs of the contract in the window must be given (even
+        if there are none), since the window is then known as covered.
+        :param address: The address of the contract.
+        :param from_block: The start block of the window.
+        :param to_block: The end block of the window (inclusive).
+        :param logs: The logs.
+        """
+
+        payload = zlib.compress(json.dumps([
+            [log.block_number, log.transaction_index, log.log_index,
+             [log.topic(index).hex() for index in range(log.topic_count)], log.data.hex()]
+            for log in logs
+        ], separators=(",", ":")).encode(), self._compression_level)
+        with self._lock:
+            segment = self._segments.get(address)
+            if segment is None:
+                directory = self._contract_directory(address)
+                os.makedirs(directory, exist_ok=True)
+                segment = self._segments[address] = _Segment(
+                    os.path.join(directory, f"{time.time_ns()}-{os.getpid()}")
+                )
+            segment.append(from_block, to_block, payload)
+
+    def _load_entries(self, address: str) -> list:
+        """
+        Gets the index entries of the segments of a contract, mapping
+        the new segments (and the ones that grew) since the last time.
+        :param address: The address of the contract.
+        :return: The (from block, to block, appended at, segment, offset,
+          length) entries, sorted by start block.
+        """
+
+        directory = self._contract_directory(address)
+        if not os.path.isdir(directory):
+            return []
+        with self._lock:
+            reader = self._readers.setdefault(address.lower(), {"segments": {}, "entries": []})
+            new_entries = []
+            for name in os.listdir(directory):
+                if not name.endswith(_INDEX_SUFFIX):
+                    continue
+                segment = reader["segments"].get(name)
+                if segment is None:
+                    segment = reader["segments"][name] = _MappedSegment(
+                        os.path.join(directory, name[:-len(_INDEX_SUFFIX)])
+                    )
+                new_entries.extend(segment.read_new_entries())
+            if new_entries:
+                reader["entries"] = sorted(reader["entries"] + new_entries, key=lambda entry: entry[0])
+            return reader["entries"]
+
+    def first_block(self, address: str) -> Optional[int]:
+        """
+        Tells the first block archived for a contract.
+        :param address: The address of the contract.
+        :return: The block number, or None if nothing was archived.
+        """
+
+        entries = self._load_entries(address)
+        return entries[0][0] if entries else None
+
+    def last_block(self, address: str) -> Optional[int]:
+        """
+        Tells the last block archived for a contract.
+        :param address: The address of the contract.
+        :return: The block number, or None if nothing was archived.
+        """
+
+        entries = self._load_entries(address)
+        return max(entry[1] for entry in entries) if entries else None
+
+    def iter_logs(self, address: str, start_block: int, end_block: int) -> Iterator[LogRecord]:
+        """
+        Reads the archived logs of a contract in a block range, sorted.
+        :param address: The address of the contract.
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :return: An iterator of logs.
+        """
+
+        entries = [entry for entry in self._load_entries(address)
+                   if entry[0] <= end_block and entry[1] >= start_block]
+        cursor = start_block
+        next_entry = 0
+        active = []
+        decoded_entry, decoded_logs = None, None
+        while cursor <= end_block:
+            while next_entry < len(entries) and entries[next_entry][0] <= cursor:
+                active.append(entries[next_entry])
+                next_entry += 1
+            active = [entry for entry in active if entry[1] >= cursor]
+            if not active:
+                raise LogArchiveGapError(address, cursor, entries[next_entry][0] - 1
+                                         if next_entry < len(entries) else end_block)
+            # The most recent window covering the cursor wins, until
+            # it ends or a more recent one starts.
+            chosen = max(active, key=lambda entry: entry[2])
+            until = min(chosen[1], end_block)
+            for entry in entries[next_entry:]:
+                if entry[0] > until:
+                    break
+                if entry[2] > chosen[2]:
+                    until = entry[0] - 1
+                    break
+            if decoded_entry is not chosen:
+                decoded_entry, decoded_logs = chosen, self._decode(chosen)
+            for log in decoded_logs:
+                if cursor <= log.block_number <= until:
+                    yield log
+            cursor = until + 1
+
+    @staticmethod
+    def _decode(entry: tuple) -> List[LogRecord]:
+        _, _, _, segment, offset, length = entry
+        data = segment.data
+        return [
+            LogRecord(block_number, transaction_index, log_index,
+                      bytes.fromhex("".join(topics)), bytes.fromhex(data_))
+            for block_number, transaction_index, log_index, topics, data_
+            in json.loads(zlib.decompress(data[offset:offset + length]))
+        ]
+
+    def save_contracts(self, metaverse_contract_address: str, addresses: dict):
+        """
+        Stores the addresses of the contracts of a metaverse, so the
+        archive can be replayed without resolving them.
+        :param metaverse_contract_address: The address of the metaverse contract.
+        :param addresses: The addresses of the other contracts, by key.
+        """
+
+        with self._lock:
+            os.makedirs(self._directory, exist_ok=True)
+            path = os.path.join(self._directory, _CONTRACTS_FILE)
+            try:
+                with open(path) as f:
+                    contracts = json.load(f)
+            except FileNotFoundError:
+                contracts = {}
+            contracts[metaverse_contract_address.lower()] = addresses
+            with open(path + ".tmp", "w") as f:
+                json.dump(contracts, f, indent=2)
+            os.replace(path + ".tmp", path)
+
+    def save_start_blocks(self, start_blocks: Dict[str, int]):
+        """
+        Stores the block the archive of each contract must start at to
+        be complete (i.e. the block its events were collected from when
+        archiving them began). Contracts already stored keep theirs.
+        :param start_blocks: A dictionary of address => start block.
+        """
+
+        with self._lock:
+            os.makedirs(self._directory, exist_ok=True)
+            path = os.path.join(self._directory, _STARTS_FILE)
+            try:
+                with open(path) as f:
+                    stored = json.load(f)
+            except FileNotFoundError:
+                stored = {}
+            missing = {address.lower(): block for address, block in start_blocks.items()
+                       if address.lower() not in stored}
+            if not missing:
+                return
+            stored.update(missing)
+            with open(path + ".tmp", "w") as f:
+                json.dump(stored, f, indent=2)
+            os.replace(path + ".tmp", path)
+
+    def load_start_blocks(self) -> Dict[str, int]:
+        """
+        Loads the block the archive of each contract must start at to be
+        complete (see `save_start_blocks`).
+        :return: A dictionary of (lowercase) address => start block.
+        """
+
+        try:
+            with open(os.path.join(self._directory, _STARTS_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load_contracts(self, metaverse_contract_address: str) -> Optional[dict]:
+        """
+        Loads the stored addresses of the contracts of a metaverse.
+        :param metaverse_contract_address: The address of the metaverse contract.
+        :return: The addresses of the other contracts, by key, or None.
+        """
+
+        try:
+            with open(os.path.join(self._directory, _CONTRACTS_FILE)) as f:
+                return json.load(f).get(metaverse_contract_address.lower())
+        except FileNotFoundError:
+            return None
+
+    def close(self):
+        """
+        Closes the segments being appended, and the ones being read.
+        """
+
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+            for reader in self._readers.values():
+                for segment in reader["segments"].values():
+                    segment.close()
+            self._readers = {}
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    """
+    Maps a whole file for reading.
+    :param path: The path of the file.
+    :return: The map, or None if the file is missing or empty.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
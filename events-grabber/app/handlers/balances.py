@@ -0,0 +1,134 @@
+import logging
+from typing import Dict, Tuple, List
+from bson.int64 import Int64
+from pymongo import UpdateOne
+from pymongo.database import Database
+from .writes import CoalescedWrites
+
+
+LOGGER = logging.getLogger("grabber:balances")
+LOGGER.setLevel(logging.INFO)
+
+
+# Amounts are uint256 values, which do not fit any MongoDB numeric
+# type. They're stored as 8 limbs of 32 bits each, in int64 fields,
+# so they can be atomically incremented by signed deltas: a limb may
+# go negative or beyond 32 bits, but the represented value is always
+# the sum of limb_i * 2^(32 * i). Each increment moves a limb by less
+# than 2^32, so it takes more than 2^31 of them to overflow it. The
+# decimal amount is rendered when reading (e.g. by the cache server).
+LIMB_BITS = 32
+LIMB_COUNT = 8
+LIMB_FIELDS = tuple(f"l{index}" for index in range(LIMB_COUNT))
+_LIMB_MASK = (1 << LIMB_BITS) - 1
+
+
+def to_limbs(value: int) -> List[int]:
+    """
+    Splits a signed value into limbs. All the limbs have the
+    sign of the value.
+    :param value: The value.
+    :return: The limbs, least significant first.
+    """
+
+    sign = -1 if value < 0 else 1
+    value = abs(value)
+    return [sign * ((value >> (LIMB_BITS * index)) & _LIMB_MASK) for index in range(LIMB_COUNT)]
+
+
+def from_limbs(limbs: dict) -> int:
+    """
+    Joins the limbs of a stored amount.
+    :param limbs: The limbs, as stored (by field name).
+    :return: The value.
+    """
+
+    return sum(int(limbs.get(field) or 0) << (LIMB_BITS * index) for index, field in enumerate(LIMB_FIELDS))
+
+
+def limbs_document(value: int) -> dict:
+    """
+    Makes the (normalized) limbs document of a value.
+    :param value: The value.
+    :return: The limbs document.
+    """
+
+    return {field: Int64(limb) for field, limb in zip(LIMB_FIELDS, to_limbs(value))}
+
+
+class BalanceDeltas(CoalescedWrites):
+    """
+    Sums the balance changes per (owner, token) in memory. When
+    flushed, each changed balance gets a single atomic server-side
+    increment of its limbs, all of them in the same bulk write.
+    """
+
+    def __init__(self, collection_name: str):
+        """
+        Creates the deltas.
+        :param collection_name: The balances collection name.
+        """
+
+        self._collection_name = collection_name
+        self._deltas: Dict[Tuple[str, str], int] = {}
+        self._extra: Dict[Tuple[str, str], dict] = {}
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def add(self, owner: str, token: str, delta: int, extra: dict = None):
+        """
+        Adds a balance change.
+        :param owner: The owner.
+        :param token: The token id.
+        :param delta: The (signed) change.
+        :param extra: Extra fields to set when the balance is created.
+        """
+
+        key = (owner, token)
+        self._deltas[key] = self._deltas.get(key, 0) + delta
+        if extra and key not in self._extra:
+            self._extra[key] = extra
+
+    def flush(self, db: Database, session_kwargs: dict, journal=None):
+        """
+        Increments the changed balances.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param journal: The -optional- reorg journal to record the changes into.
+        """
+
+        deltas, extra, self._deltas, self._extra = self._deltas, self._extra, {}, {}
+        operations = []
+        for (owner, token), delta in deltas.items():
+            if delta == 0:
+                continue
+            update = {"$inc": {f"limbs.{field}": Int64(limb)
+                               for field, limb in zip(LIMB_FIELDS, to_limbs(delta)) if limb}}
+            if (owner, token) in extra:
+                update["$setOnInsert"] = extra[(owner, token)]
+            operations.append(UpdateOne({"owner": owner, "token": token}, update, upsert=True))
+        if not operations:
+            return
+        LOGGER.info(f"Incrementing {len(operations)} balances")
+        result = db[self._collection_name].bulk_write(operations, ordered=False, **session_kwargs)
+        if journal is not None:
+            journal.record_balances(self._collection_name, deltas, result.upserted_ids.values())
+
+    def merge(self, other: "BalanceDeltas"):
+        """
+        Adds the changes of other deltas. Balance changes commute, so
+        deltas collected in any order can be merged.
+        :param other: The other deltas.
+        """
+
+        for (owner, token), delta in other._deltas.items():
+            self.add(owner, token, delta, other._extra.get((owner, token)))
+
+    def discard(self):
+        """
+        Discards the pending changes.
+        """
+
+        self._deltas = {}
+        self._extra = {}
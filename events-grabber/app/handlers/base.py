@@ -1,72 +1,153 @@
-import json
 import logging
-from typing import Union
+from typing import Union, Dict, Iterable, Iterator, Tuple, Optional, Callable, Sequence
+from eth_utils import encode_hex
 from pymongo import MongoClient
+from pymongo.database import Database
 from web3.contract import Contract
-from web3.datastructures import AttributeDict
-from urllib.request import urlopen
+from .chunking import BlockRangeChunker
+from .archive import LogArchive
+from .decoding import EventDecoder, compile_decoders
+from .streams import pack_position, merge_streams, batched
+from .pipeline import EventPipeline
+from .writes import WriteBuffer, CoalescedWrites
+from metadata.queue import MetadataQueue
+from rpc import BaseJsonRpcClient, LogRecord
 
 
 LOGGER = logging.getLogger("grabber")
 LOGGER.setLevel(logging.INFO)
 
 
-class EventList:
+class ContractEventHandler:
     """
-    An event list, hierarchically sorted.
+    A contract handler is used to collect and process the events of
+    a specified contract. For example, a handler may focus on the
+    TransferSingle/Batch of an ERC-1155 while other handlers might
+    focus on the approval-related events in that contract.
+
+    Events are collected in one of these modes:
+
+    - "logs" (default): A single, stateless, eth_getLogs request per
+      block range is sent for the contract, matching any of the
+      events' topics. Each log is decoded locally.
+    - "filters": A server-side filter is installed per event and
+      block range.
+    - "archive": The logs are read from the local log archive, with
+      no network access at all.
+
+    When a log archive is in use, the "logs" mode fetches all the
+    logs of the contract (not only the relevant ones) and archives
+    them, so they can be replayed later.
     """
 
-    def __init__(self):
-        self._events = {}
+    COLLECTION_MODES = ("logs", "filters", "archive")
+    # How many entries each batch holds, when they're not batched by
+    # window (i.e. in the "filters" and "archive" modes).
+    BATCH_SIZE = 1000
+    # Whether processing the events again, from any block, leaves the
+    # same state (e.g. documents are replaced, not incremented).
+    REPLAYABLE = True
+
+    def __init__(self, contract: Contract):
+        self._contract = contract
+        self._name = "<unnamed>"
+        self._chunker = BlockRangeChunker()
+        self._collection_mode = "logs"
+        self._decoders = None
+        self._archive = None
+        self._rpc = None
+        self._start_block = 0
 
-    def add_event(self, event: dict, handler: "ContractEventHandler"):
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def chunker(self):
         """
-        Adds an event to the structure
-        :param event: The event to add.
-        :param handler: The handler to add.
+        The chunker used to walk block ranges while collecting.
         """
 
-        block_number = int(event["blockNumber"])
-        transaction_index = int(event["transactionIndex"])
-        log_index = int(event["logIndex"])
+        return self._chunker
 
-        self._events.setdefault(block_number, {}).setdefault(transaction_index, {})[log_index] = (
-            event, handler
-        )
+    @chunker.setter
+    def chunker(self, value: BlockRangeChunker):
+        self._chunker = value
 
-    def sorted_events(self):
+    @property
+    def collection_mode(self):
         """
-        Iterates over the events.
-        :return: An iterator over the events.
+        The mode used to collect the events: "logs" or "filters".
         """
 
-        for block_number in sorted(self._events.keys()):
-            block_number_events = self._events[block_number]
-            for transaction_number in sorted(block_number_events.keys()):
-                transaction_number_events = block_number_events[transaction_number]
-                for log_number in sorted(transaction_number_events.keys()):
-                    yield transaction_number_events[log_number]
+        return self._collection_mode
 
+    @collection_mode.setter
+    def collection_mode(self, value: str):
+        if value not in self.COLLECTION_MODES:
+            raise ValueError(f"Invalid collection mode: {value}")
+        self._collection_mode = value
 
-class ContractEventHandler:
-    """
-    A contract handler is used to collect and process the events of
-    a specified contract. For example, a handler may focus on the
-    TransferSingle/Batch of an ERC-1155 while other handlers might
-    focus on the approval-related events in that contract.
-    """
+    @property
+    def archive(self):
+        """
+        The -optional- log archive to fill (or read, in "archive" mode).
+        """
 
-    def __init__(self, contract: Contract):
-        self._contract = contract
-        self._name = "<unnamed>"
+        return self._archive
+
+    @archive.setter
+    def archive(self, value: Optional[LogArchive]):
+        self._archive = value
 
     @property
-    def name(self):
-        return self._name
+    def rpc(self):
+        """
+        The -optional- lean JSON-RPC client to fetch the logs with,
+        instead of web3 (in "logs" mode).
+        """
+
+        return self._rpc
+
+    @rpc.setter
+    def rpc(self, value: Optional[BaseJsonRpcClient]):
+        self._rpc = value
+
+    @property
+    def start_block(self):
+        """
+        The first block that may hold events for this handler (i.e. the
+        block its contract was deployed at). Earlier blocks are skipped.
+        """
+
+        return self._start_block
+
+    @start_block.setter
+    def start_block(self, value: int):
+        self._start_block = max(0, value)
+
+    def get_event_methods(self) -> Dict[str, Tuple[Callable, Sequence[str]]]:
+        """
+        Tells the method processing each event, and the names of the
+        event arguments that method takes (in order). Each name is
+        matched as either `{name}` or `_{name}` in the ABI.
+        :return: A dictionary of event name => (method, argument names).
+        """
 
-    def get_event_names(self):
         raise NotImplementedError
 
+    def get_event_names(self):
+        return list(self.get_event_methods())
+
+    def get_collections(self) -> Tuple[str, ...]:
+        """
+        Tells the collections only this handler writes, which are
+        cleared when the handler is rebuilt from scratch.
+        :return: The names of the collections.
+        """
+
+        return ()
+
     @property
     def contract(self):
         return self._contract
@@ -97,65 +178,195 @@ class ContractEventHandler:
 
         return False
 
-    def _get_arg(self, args: AttributeDict, key: str):
+    def _get_decoders(self) -> Dict[bytes, EventDecoder]:
         """
-        Gets an argument from the args, by trying both `{key}` and `_{key}`
-        as the key to test.
-        :param args: The args to get an argument from.
-        :param key: The key to retrieve.
-        :return:
+        Gets the precompiled decoders of the events this handler
+        processes, taken from the contract's ABI, by topic (i.e.
+        the hashed signature). They're compiled only once.
+        :return: A dictionary of topic => decoder.
         """
 
-        if key in args:
-            return args[key]
+        if self._decoders is None:
+            self._decoders = compile_decoders(self._contract.abi, self.get_event_methods())
+        return self._decoders
+
+    def iter_events(self, start_block: int, end_block: int) -> Iterator[Tuple[int, Callable, tuple]]:
+        """
+        Collects all the relevant events for this handler, as they are
+        retrieved, in the same order they have in the chain.
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :return: An iterator of (position, method, arguments) tuples.
+        """
+
+        for batch in self.iter_batches(start_block, end_block):
+            yield from self.decode_batch(batch)
+
+    def iter_batches(self, start_block: int, end_block: int) -> Iterator[list]:
+        """
+        Fetches the raw entries of all the relevant events for this
+        handler, in batches, in the same order they have in the chain.
+        They're not decoded yet (see `decode_batch`), so fetching and
+        decoding may run in different stages.
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :return: An iterator of batches.
+        """
+
+        start_block = max(start_block, self._start_block)
+        if start_block > end_block:
+            return iter(())
+        if self._collection_mode == "logs":
+            return self._iter_logs(start_block, end_block)
+        elif self._collection_mode == "archive":
+            return self._iter_archive(start_block, end_block)
         else:
-            return args.get("_" + key)
+            return self._iter_filters(start_block, end_block)
 
-    def _prune_event(self, event):
+    def decode_batch(self, batch: list) -> Iterator[Tuple[int, Callable, tuple]]:
         """
-        Keeps only some relevant fields of an event.
-        :param event: The event to prune.
-        :return: The pruned event.
+        Decodes a batch fetched by `iter_batches`.
+        :param batch: The batch.
+        :return: An iterator of (position, method, arguments) tuples.
         """
 
-        return {**{
-            k: v for k, v in event.items() if k in {"blockNumber", "transactionIndex", "logIndex",
-                                                    "args", "event"}
-        }}
+        if self._collection_mode == "filters":
+            return ((position, decoder.method, decoder.from_event(event)) for position, decoder, event in batch)
+        return self._decode_logs(self._get_decoders(), batch)
 
-    def collect_events(self, start_block: int, end_block: int, events: EventList):
+    def _iter_logs(self, start_block: int, end_block: int) -> Iterator[list]:
         """
-        Collects all the relevant events for this handler.
+        Fetches all the relevant logs for this handler with a single
+        eth_getLogs per block range (i.e. one batch per window). The
+        logs come already sorted from the node, and are decoded with
+        the decoder of the event their topic stands for. When archiving,
+        all the logs of the contract are fetched, and each window is
+        archived before being processed.
         """
 
-        for event_name in self.get_event_names():
-            LOGGER.info(f"Processing records for event: {self.name}:{event_name} in range: {start_block}:{end_block}")
-            event_filter = getattr(self._contract.events, event_name).create_filter(
-                fromBlock=start_block, toBlock=end_block
-            )
-            for event in event_filter.get_all_entries():
-                events.add_event(self._prune_event(event), self)
+        LOGGER.info(f"Processing records for events: {self.name}:* in range: {start_block}:{end_block}")
+        archive = self._archive
+        fetcher = self._make_logs_fetcher(None if archive else [encode_hex(topic) for topic in self._get_decoders()])
+        for from_block, to_block, entries in self._chunker.iter_windows(start_block, end_block, fetcher,
+                                                                         f"{self.name}:*"):
+            if archive is not None:
+                archive.append(self._contract.address, from_block, to_block, entries)
+            yield entries
 
-    def process_event(self, event: dict):
+    def _iter_archive(self, start_block: int, end_block: int) -> Iterator[list]:
         """
-        Processes an event accordingly.
-        :param event: The event to process.
+        Reads all the relevant logs for this handler from the log
+        archive, in batches, to be decoded like in the "logs" mode.
         """
 
-        raise NotImplementedError
+        LOGGER.info(f"Replaying records for events: {self.name}:* in range: {start_block}:{end_block}")
+        return batched(self._archive.iter_logs(self._contract.address, start_block, end_block),
+                       self.BATCH_SIZE)
+
+    @staticmethod
+    def _decode_logs(decoders: Dict[bytes, EventDecoder],
+                     logs: Iterable[LogRecord]) -> Iterator[Tuple[int, Callable, tuple]]:
+        """
+        Decodes the logs of the known events, skipping the others.
+        :param decoders: The decoders, by topic.
+        :param logs: The logs.
+        :return: An iterator of (position, method, arguments) tuples.
+        """
+
+        for log in logs:
+            decoder = decoders.get(log.topic(0)) if log.topics else None
+            if decoder is not None:
+                yield pack_position(log.block_number, log.transaction_index, log.log_index), \
+                    decoder.method, decoder.decode(log)
+
+    def _make_logs_fetcher(self, topics: list):
+        """
+        Makes a function that fetches all the logs of this contract,
+        matching any of the given topics, in a given block range.
+        :param topics: The hex-encoded topics to match (in the first
+          topic position, i.e. the event signature), or None to match
+          all the logs.
+        :return: A function taking (from_block, to_block).
+        """
+
+        log_filter = {"address": self._contract.address}
+        if topics is not None:
+            log_filter["topics"] = [topics]
+        rpc = self._rpc
+        web3 = self.web3
+
+        def fetch(from_block: int, to_block: int):
+            window_filter = {**log_filter, "fromBlock": from_block, "toBlock": to_block}
+            if rpc is not None:
+                return rpc.get_logs(window_filter)
+            return [LogRecord.from_log(log) for log in web3.eth.get_logs(window_filter)]
+
+        return fetch
+
+    def _iter_filters(self, start_block: int, end_block: int) -> Iterator[list]:
+        """
+        Collects all the relevant events for this handler by using
+        one filter per event. Each event's entries come sorted, so
+        they are merged into a single sorted stream (and batched).
+        """
+
+        return batched(merge_streams(self._iter_filter(event_name, start_block, end_block)
+                                     for event_name in self.get_event_names()), self.BATCH_SIZE)
+
+    def _iter_filter(self, event_name: str, start_block: int, end_block: int) -> Iterator[tuple]:
+        """
+        Collects the entries of a single event by using a filter, as
+        (position, decoder, entry) tuples.
+        """
+
+        LOGGER.info(f"Processing records for event: {self.name}:{event_name} in range: {start_block}:{end_block}")
+        decoder = next(decoder for decoder in self._get_decoders().values() if decoder.name == event_name)
+        fetcher = self._make_filter_fetcher(event_name)
+        for _, _, entries in self._chunker.iter_windows(start_block, end_block, fetcher,
+                                                         f"{self.name}:{event_name}"):
+            for event in entries:
+                yield pack_position(event["blockNumber"], event["transactionIndex"], event["logIndex"]), \
+                    decoder, event
+
+    def _make_filter_fetcher(self, event_name: str):
+        """
+        Makes a function that fetches all the entries of an event in a
+        given block range by installing a (temporary) filter.
+        :param event_name: The name of the event.
+        :return: A function taking (from_block, to_block).
+        """
+
+        event = getattr(self._contract.events, event_name)
+
+        def fetch(from_block: int, to_block: int):
+            event_filter = event.create_filter(fromBlock=from_block, toBlock=to_block)
+            try:
+                return event_filter.get_all_entries()
+            finally:
+                try:
+                    self.web3.eth.uninstall_filter(event_filter.filter_id)
+                except:
+                    pass
+
+        return fetch
 
 
 class MongoDBContractEventHandler(ContractEventHandler):
     """
-    This contract handler has access to MongoDB features.
+    This contract handler has access to MongoDB features. Writes
+    are meant to be issued through the write buffer, which may be
+    shared among handlers. Handlers that only record their writes
+    (e.g. in a backfill process) may have no client.
     """
 
-    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict):
+    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
         super().__init__(contract)
         self._client = client
         self._session_kwargs = session_kwargs
         self._db_name = db_name
-        self._db = client[db_name]
+        self._db = client[db_name] if client is not None else None
+        self._write_buffer = write_buffer if write_buffer is not None else WriteBuffer(self._db)
 
     @property
     def client(self):
@@ -189,6 +400,72 @@ class MongoDBContractEventHandler(ContractEventHandler):
 
         return self._session_kwargs
 
+    @client_session_kwargs.setter
+    def client_session_kwargs(self, value: dict):
+        self._session_kwargs = value
+
+    @property
+    def write_buffer(self):
+        """
+        The buffer to issue the writes through.
+        """
+
+        return self._write_buffer
+
+
+class MetadataRequests(CoalescedWrites):
+    """
+    Collects the tokens whose metadata must be downloaded, without
+    repetitions, and enqueues them into the metadata queue when the
+    write buffer flushes.
+    """
+
+    def __init__(self):
+        self._token_ids = set()
+
+    def __len__(self):
+        return len(self._token_ids)
+
+    def add(self, token_id: int):
+        """
+        Adds a token.
+        :param token_id: The id of the token.
+        """
+
+        self._token_ids.add(token_id)
+
+    def merge(self, other: "MetadataRequests"):
+        """
+        Adds the tokens requested by others.
+        :param other: The other requests.
+        """
+
+        self._token_ids.update(other._token_ids)
+
+    def flush(self, db: Database, session_kwargs: dict, journal=None):
+        """
+        Enqueues the collected tokens.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param journal: The -optional- reorg journal to record the tokens into.
+        """
+
+        token_ids, self._token_ids = self._token_ids, set()
+        if journal is not None:
+            journal.record_metadata(token_ids)
+        if token_ids:
+            LOGGER.info(f"Requesting the metadata of {len(token_ids)} tokens")
+            db[MetadataQueue.QUEUE].bulk_write([MetadataQueue.enqueue_operation(token_id)
+                                                for token_id in sorted(token_ids)],
+                                               ordered=False, **session_kwargs)
+
+    def discard(self):
+        """
+        Discards the collected tokens.
+        """
+
+        self._token_ids = set()
+
 
 """
 This class has the following requirements in whatever is used as the underlying
@@ -203,83 +480,33 @@ database:
 
 class MetaverseRelatedContractEventHandler(MongoDBContractEventHandler):
     """
-    This subclass allows a contract handler to invoke the Metaverse's
-    `tokenURI` method and retrieve its JSON content. If there's an
-    error trying to retrieve the JSON content, then an incomplete
-    metadata will be returned instead. Also, allows interacting with
-    the metaverse's parameters.
+    This subclass allows a contract handler to request the download
+    of a token's metadata (which is done apart, by the metadata
+    workers, from the Metaverse's `tokenURI` JSON content). Also,
+    allows interacting with the metaverse's parameters.
     """
 
     TOKENS_METADATA = "tokens_metadata"
     METAVERSE_PARAMETERS = "metaverse_parameters"
 
     def __init__(self, contract: Contract, metaverse_contract: Contract,
-                 client: MongoClient, db_name: str, session_kwargs: dict):
-        super().__init__(contract, client, db_name, session_kwargs)
+                 client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
+        super().__init__(contract, client, db_name, session_kwargs, write_buffer)
         self._metaverse_contract = metaverse_contract
-        self._metaverse_parameters = self.db[self.METAVERSE_PARAMETERS]
-        self._tokens_metadata = self.db[self.TOKENS_METADATA]
-
-    def _get_json(self, url: str) -> dict:
-        """
-        Gets the associated JSON content from a URL.
-        :param url: The URL to retrieve.
-        :return: The JSON contents.
-        """
+        self._metadata_requests = MetadataRequests()
+        self._write_buffer.attach(self._metadata_requests)
 
-        try:
-            with urlopen(url) as response:
-                if response.headers["Content-Type"] is None:
-                    raise Exception("Invalid content type")
-                return json.loads(response.read())
-        except:
-            return {"name": "INVALID", "description": "INVALID", "image": "about:blank", "properties": {}}
-
-    def _get_metadata(self, token_id: int):
+    def _request_metadata(self, token_id: int):
         """
-        Gets the associated JSON content from a token id.
-        :param token_id: The token id to retrieve the  metadata from.
-        :return: The JSON contents.
+        Requests the download of the associated JSON content from a
+        token id into the metadata table. Many requests for the same
+        token are merged into a single download.
+        :param token_id: The id of the token whose metadata is being downloaded.
         """
 
-        url = self._metaverse_contract.functions.tokenURI(token_id).call()
-        if url == "":
-            return {"name": "UNKNOWN", "description": "UNKNOWN", "image": "about:blank", "properties": {}}
-        return self._get_json(url)
-
-    def _download_metadata(self, token_id: int):
-        """
-        Downloads the associated JSON content from a token id. The content
-        is downloaded in the metadata table.
-        :param token_id: The id of the token whose metadata is being downloaded.
-        :param token_type: The token type.
-        """
-
-        data = self._get_metadata(token_id)
-        data["name"] = (data.get("name") or "").strip()
-        data["description"] = (data.get("description") or "").strip()
-        data["image"] = (data.get("image") or "").strip()
-        document = {
-            "token": "0x%064x" % token_id,
-            "metadata": data,
-            "token_group": "nft"
-        }
-        token_num = int(token_id)
-        if token_num & (1 << 255):
-            # FTs are associated to the system or to a brand.
-            # So here we extract the brand (where 0x000...000
-            # stands for the SYSTEM, actually).
-            #
-            # Also, the token is marked as FT instead of NFT.
-            brand_num = (token_num >> 64) & ((1 << 160) - 1)
-            document["brand"] = self.contract.w3.to_checksum_address("0x%040x" % brand_num)
-            document["token_group"] = "ft"
-        elif data.get("properties", {}).get("type") == "brand":
-            # We extract the brand itself.
-            document["brand"] = self.contract.w3.to_checksum_address("0x%040x" % token_num)
-        self._tokens_metadata.replace_one({
-            "token": "0x%064x" % token_id
-        }, document, upsert=True, **self.client_session_kwargs)
+        self._metadata_requests.add(token_id)
+        self._write_buffer.flush_if_full()
 
     def _set_parameter(self, key, value):
         """
@@ -288,11 +515,11 @@ class MetaverseRelatedContractEventHandler(MongoDBContractEventHandler):
         :param value: The parameter value. Not a specific type.
         """
 
-        self._metaverse_parameters.replace_one({
+        self._write_buffer.replace_one(self.METAVERSE_PARAMETERS, {
             "key": key
         }, {
             "key": key, "value": value
-        }, upsert=True, **self.client_session_kwargs)
+        }, upsert=True)
 
 
 class ContractEventHandlers:
@@ -301,27 +528,184 @@ class ContractEventHandlers:
     a full lifecycle of event extractions.
     """
 
-    def __init__(self, *args):
+    def __init__(self, *args, collection_workers: int = 0, fetch_ahead: int = 4, buffer_size: int = 1000):
         """
         Creates the instance with a list of handlers.
         :param args: The handlers, one by one, to specify.
+        :param collection_workers: How many handlers can fetch their
+          events at the same time. By default, all of them.
+        :param fetch_ahead: How many fetched batches (e.g. windows of
+          logs), per handler, can wait to be decoded.
+        :param buffer_size: How many decoded events, per handler, can
+          wait to be processed.
         """
 
         self._handlers = args
+        self._collection_workers = collection_workers if collection_workers > 0 else max(1, len(args))
+        self._fetch_ahead = max(1, fetch_ahead)
+        self._buffer_size = buffer_size
+
+    @property
+    def handlers(self):
+        return self._handlers
+
+    def subset(self, handlers: Iterable[ContractEventHandler]) -> "ContractEventHandlers":
+        """
+        Makes a set with some of these handlers (e.g. the ones catching
+        up on their own), with the same settings.
+        :param handlers: The handlers.
+        :return: The new set.
+        """
+
+        return ContractEventHandlers(*handlers, collection_workers=self._collection_workers,
+                                     fetch_ahead=self._fetch_ahead, buffer_size=self._buffer_size)
+
+    def use_session(self, session_kwargs: dict):
+        """
+        Makes all the MongoDB-related handlers use a new session,
+        so the same handlers can be reused among transactions.
+        :param session_kwargs: The -optionally- MongoDB session.
+        """
+
+        for handler in self._handlers:
+            if isinstance(handler, MongoDBContractEventHandler):
+                handler.client_session_kwargs = session_kwargs
+        for write_buffer in self._get_write_buffers():
+            write_buffer.use_session(session_kwargs)
+
+    def use_journal(self, journal):
+        """
+        Makes all the write buffers record their writes into a reorg
+        journal (or stop doing so).
+        :param journal: The journal, or None.
+        """
+
+        for write_buffer in self._get_write_buffers():
+            write_buffer.use_journal(journal)
+
+    def _get_write_buffers(self):
+        """
+        Gets the distinct write buffers used by the handlers.
+        :return: The list of write buffers.
+        """
+
+        write_buffers = []
+        for handler in self._handlers:
+            if isinstance(handler, MongoDBContractEventHandler) and \
+                    not any(handler.write_buffer is b for b in write_buffers):
+                write_buffers.append(handler.write_buffer)
+        return write_buffers
+
+    def flush(self):
+        """
+        Flushes all the pending writes of the handlers. This must be
+        invoked before committing the current session.
+        """
+
+        for write_buffer in self._get_write_buffers():
+            write_buffer.flush()
+
+    def set_collection_mode(self, mode: str):
+        """
+        Sets the collection mode in each handler.
+        :param mode: The mode: "logs" or "filters".
+        """
+
+        for handler in self._handlers:
+            handler.collection_mode = mode
+
+    def use_archive(self, archive: Optional[LogArchive]):
+        """
+        Sets the log archive each handler fills (or reads from).
+        :param archive: The archive, or None.
+        """
+
+        for handler in self._handlers:
+            handler.archive = archive
+
+    def use_start_blocks(self, start_blocks: Dict[str, int]):
+        """
+        Sets the first block each handler collects its events from.
+        :param start_blocks: A dictionary of (lowercase) contract address =>
+          start block (e.g. its deployment block). Missing ones start at 0.
+        """
+
+        for handler in self._handlers:
+            handler.start_block = start_blocks.get(handler.contract.address.lower(), 0)
+
+    @property
+    def start_block(self) -> int:
+        """
+        The first block any of the handlers collects events from.
+        """
+
+        return min((handler.start_block for handler in self._handlers), default=0)
 
-    def process_events(self, start_block: int, end_block: int):
+    def use_rpc(self, rpc: Optional[BaseJsonRpcClient]):
+        """
+        Sets the lean JSON-RPC client each handler fetches its logs with.
+        :param rpc: The client, or None to fetch them through web3.
+        """
+
+        for handler in self._handlers:
+            handler.rpc = rpc
+
+    def configure_chunking(self, **settings):
+        """
+        Gives each handler its own block range chunker, with
+        the given settings.
+        :param settings: The settings for each BlockRangeChunker.
+        """
+
+        for handler in self._handlers:
+            handler.chunker = BlockRangeChunker(**settings)
+
+    def open_pipeline(self, start_block: int, end_block: int) -> EventPipeline:
+        """
+        Starts ingesting the events of all the handlers, from a start
+        block number to the end block number (both inclusive), through
+        concurrent fetch / decode / merge stages. The events are then
+        applied with the pipeline's `process`, in as many calls as
+        needed, while the next ones are being fetched.
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :return: The pipeline, which must be closed.
+        """
+
+        return EventPipeline(self._handlers, start_block, end_block, self._collection_workers,
+                             self._fetch_ahead, self._buffer_size)
+
+    def process_events(self, start_block: int, end_block: int, max_events: int = 0) -> int:
         """
         Processes all the events from a start block number to the
-        end block number, both inclusive.
+        end block number, both inclusive, through a pipeline (see
+        `open_pipeline`) used only for this range.
         :param start_block: The start block index.
         :param end_block: The end block index (both inclusive).
+        :param max_events: When positive, the processing stops at the
+          first block boundary after this amount of events.
+        :return: The last block that was fully processed.
         """
 
-        events = EventList()
-        for handler in self._handlers:
-            LOGGER.info(f"Collecting all the events for handler: {handler.name} in range: {start_block}:{end_block}")
-            handler.collect_events(start_block, end_block, events)
-        for event, handler in events.sorted_events():
-            LOGGER.info(f"Processing event {event['blockNumber']}:{event['transactionIndex']}:{event['logIndex']} "
-                        f"with handler: {handler.name}")
-            handler.process_event(event)
+        pipeline = self.open_pipeline(start_block, end_block)
+        try:
+            return pipeline.process(end_block, max_events)
+        finally:
+            pipeline.close()
+
+    def iter_events(self, start_block: int, end_block: int) -> Iterator[Tuple[int, Callable, tuple,
+                                                                            ContractEventHandler]]:
+        """
+        Collects the events of all the handlers, from a start block
+        number to the end block number (both inclusive), merged by
+        position, through a pipeline (see `open_pipeline`).
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :return: An iterator of (position, method, arguments, handler) tuples.
+        """
+
+        pipeline = self.open_pipeline(start_block, end_block)
+        try:
+            yield from pipeline.events()
+        finally:
+            pipeline.close()
@@ -1,7 +1,9 @@
 import binascii
+from typing import Optional
 from pymongo import MongoClient
 from web3.contract import Contract
 from .base import MetaverseRelatedContractEventHandler
+from .writes import WriteBuffer
 
 
 """
@@ -24,40 +26,45 @@ class BrandRegistryContractEventHandler(MetaverseRelatedContractEventHandler):
     BRAND_PERMISSIONS = "brand_permissions"
 
     def __init__(self, contract: Contract, metaverse_contract: Contract,
-                 client: MongoClient, db_name: str, session_kwargs: dict):
-        super().__init__(contract, metaverse_contract, client, db_name, session_kwargs)
+                 client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
+        super().__init__(contract, metaverse_contract, client, db_name, session_kwargs, write_buffer)
         self._name = "brand-registry"
-        self._permissions = self.db[self.BRAND_PERMISSIONS]
 
-    def get_event_names(self):
+    def get_collections(self):
+        return (self.BRAND_PERMISSIONS,)
+
+    def get_event_methods(self):
         """
         This handler processes the Brand-related events.
-        :return: The handler for the Brand-related events.
+        :return: The methods for the Brand-related events.
         """
 
-        return ["BrandRegistrationCostUpdated", "BrandRegistered", "BrandUpdated",
-                "BrandSocialCommitmentUpdated", "BrandPermissionChanged"]
+        return {
+            "BrandRegistrationCostUpdated": (self._on_registration_cost_updated, ("newCost",)),
+            "BrandRegistered": (self._on_brand_changed, ("brandId",)),
+            "BrandUpdated": (self._on_brand_changed, ("brandId",)),
+            "BrandSocialCommitmentUpdated": (self._on_brand_changed, ("brandId",)),
+            "BrandPermissionChanged": (self._on_permission_changed, ("brandId", "permission", "user", "set")),
+        }
+
+    def _on_registration_cost_updated(self, new_cost: int):
+        self._set_parameter("brand_registration_cost", str(new_cost))
+
+    def _on_brand_changed(self, brand_id: str):
+        self._request_metadata(int(brand_id, 16))
 
-    def process_event(self, event: dict):
+    def _on_permission_changed(self, brand_id: str, permission: bytes, user: str, set_: bool):
         """
-        Processes the brand-related events.
-        :param event: The event to process.
+        Processes a brand permission change.
+        :param brand_id: The brand.
+        :param permission: The permission.
+        :param user: The user.
+        :param set_: Whether the permission is granted or revoked.
         """
 
-        event_name = event['event']
-        args = event['args']
-
-        if event_name == "BrandRegistrationCostUpdated":
-            self._set_parameter("brand_registration_cost", str(self._get_arg(args, "newCost")))
-        elif event_name == "BrandRegistered":
-            self._download_metadata(int(self._get_arg(args, "brandId"), 16))
-        elif event_name == "BrandUpdated" or event_name == "BrandSocialCommitmentUpdated":
-            self._download_metadata(int(self._get_arg(args, "brandId"), 16))
-        elif event_name == "BrandPermissionChanged":
-            brand_id = self._get_arg(args, "brandId")
-            permission = '0x' + binascii.hexlify(self._get_arg(args, 'permission')).decode('utf-8')
-            user = self._get_arg(args, "user")
-            set_ = self._get_arg(args, "set")
-            self._permissions.replace_one({"permission": permission, "user": user, "brand": brand_id},
-                                          {"permission": permission, "user": user, "brand": brand_id,
-                                           "value": set_}, upsert=True)
+        permission = '0x' + binascii.hexlify(permission).decode('utf-8')
+        self._write_buffer.replace_one(self.BRAND_PERMISSIONS,
+                                       {"permission": permission, "user": user, "brand": brand_id},
+                                       {"permission": permission, "user": user, "brand": brand_id,
+                                        "value": set_}, upsert=True)
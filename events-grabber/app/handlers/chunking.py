@@ -0,0 +1,112 @@
+import time
+import socket
+import logging
+from typing import Callable, Iterator, Tuple, List
+from requests.exceptions import Timeout
+
+
+LOGGER = logging.getLogger("grabber:chunking")
+LOGGER.setLevel(logging.INFO)
+
+
+# Fragments of the error messages the RPC nodes send when a logs
+# query covers too many blocks or returns too many results. They
+# differ among node implementations and providers.
+_RANGE_ERROR_MARKERS = (
+    "too many results", "more than", "limit exceeded", "query returned",
+    "response size", "block range", "range too large", "too large",
+    "query timeout", "timed out", "timeout"
+)
+
+
+def is_range_error(error: Exception) -> bool:
+    """
+    Tells whether an error, raised while fetching a block range, is
+    one that could be avoided by querying a smaller range.
+    :param error: The error to test.
+    :return: Whether it is a range-related error (or a timeout).
+    """
+
+    if isinstance(error, (Timeout, socket.timeout, TimeoutError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _RANGE_ERROR_MARKERS)
+
+
+class BlockRangeChunker:
+    """
+    Walks a block range in windows whose size adapts to how the
+    node responds: windows grow while responses are small and fast,
+    and are bisected when the node rejects the query because of
+    too many results or when it times out.
+    """
+
+    def __init__(self, initial_size: int = 2000, min_size: int = 1, max_size: int = 100000,
+                 target_results: int = 5000, target_seconds: float = 5.0):
+        """
+        Creates the chunker.
+        :param initial_size: The initial window size, in blocks.
+        :param min_size: The minimum window size, in blocks.
+        :param max_size: The maximum window size, in blocks.
+        :param target_results: The maximum desired amount of results per window.
+        :param target_seconds: The maximum desired duration of each request.
+        """
+
+        self._min_size = max(1, min_size)
+        self._max_size = max(self._min_size, max_size)
+        self._size = min(max(initial_size, self._min_size), self._max_size)
+        self._target_results = target_results
+        self._target_seconds = target_seconds
+
+    @property
+    def size(self):
+        """
+        The current window size, in blocks.
+        """
+
+        return self._size
+
+    def _adapt(self, results: int, elapsed: float):
+        """
+        Adapts the window size after a successful request.
+        :param results: The amount of results in the response.
+        :param elapsed: The time the request took.
+        """
+
+        if results > self._target_results or elapsed > self._target_seconds:
+            self._size = max(self._min_size, self._size // 2)
+        elif results < self._target_results // 2 and elapsed < self._target_seconds / 2:
+            self._size = min(self._max_size, self._size * 2)
+
+    def iter_windows(self, start_block: int, end_block: int, fetcher: Callable[[int, int], List],
+                     label: str) -> Iterator[Tuple[int, int, List]]:
+        """
+        Fetches a block range, window by window, in ascending order.
+        :param start_block: The start block (inclusive).
+        :param end_block: The end block (inclusive).
+        :param fetcher: A function taking (from_block, to_block), both
+          inclusive, and returning the list of entries in that range.
+        :param label: A label to identify the fetched data in the logs.
+        :return: An iterator of (from_block, to_block, entries) tuples.
+        """
+
+        current = start_block
+        while current <= end_block:
+            to_block = min(end_block, current + self._size - 1)
+            started = time.monotonic()
+            try:
+                entries = fetcher(current, to_block)
+            except Exception as e:
+                if to_block - current + 1 <= self._min_size or not is_range_error(e):
+                    raise
+                # Bisect the current window and try again.
+                self._size = max(self._min_size, min(self._size, to_block - current + 1) // 2)
+                LOGGER.warning(f"Range {current}:{to_block} rejected for {label} after "
+                               f"{time.monotonic() - started:.2f}s ({e}). Window shrunk to: {self._size}")
+                continue
+            elapsed = time.monotonic() - started
+            LOGGER.info(f"Fetched {len(entries)} entries for {label} in range: {current}:{to_block} "
+                        f"(window: {to_block - current + 1}) in {elapsed:.2f}s")
+            self._adapt(len(entries), elapsed)
+            yield current, to_block, entries
+            current = to_block + 1
@@ -10,27 +10,18 @@ class CurrencyDefinitionPluginContractEventHandler(MetaverseRelatedContractEvent
         super().__init__(*args, **kwargs)
         self._name = "currency-definition"
 
-    def get_event_names(self):
+    def get_event_methods(self):
         """
         Returns the list of events: for parameter change, metadata
           update, and first definition.
-        :return: The list of supported events.
+        :return: The methods of the supported events.
         """
 
-        return ["CurrencyDefinitionCostUpdated", "CurrencyDefined", "CurrencyMetadataUpdated"]
+        return {
+            "CurrencyDefinitionCostUpdated": (self._on_definition_cost_updated, ("newCost",)),
+            "CurrencyDefined": (self._request_metadata, ("tokenId",)),
+            "CurrencyMetadataUpdated": (self._request_metadata, ("tokenId",)),
+        }
 
-    def process_event(self, event: dict):
-        """
-        Processes one of the events: definition, update or definition-cost update.
-        :param event: The event to process.
-        """
-
-        event_name = event['event']
-        args = event['args']
-
-        if event_name == "CurrencyDefinitionCostUpdated":
-            self._set_parameter("currency_definition_cost", str(self._get_arg(args, "newCost")))
-        elif event_name == "CurrencyDefined":
-            self._download_metadata(self._get_arg(args, "tokenId"))
-        elif event_name == "CurrencyMetadataUpdated":
-            self._download_metadata(self._get_arg(args, "tokenId"))
+    def _on_definition_cost_updated(self, new_cost: int):
+        self._set_parameter("currency_definition_cost", str(new_cost))
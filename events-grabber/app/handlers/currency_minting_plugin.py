@@ -10,24 +10,19 @@ class CurrencyMintingPluginContractEventHandler(MetaverseRelatedContractEventHan
         super().__init__(*args, **kwargs)
         self._name = "currency-minting"
 
-    def get_event_names(self):
+    def get_event_methods(self):
         """
         Returns the list of events for parameter change.
-        :return: The list of supported events.
+        :return: The methods of the supported events.
         """
 
-        return ["CurrencyMintCostUpdated", "CurrencyMintAmountUpdated"]
+        return {
+            "CurrencyMintCostUpdated": (self._on_mint_cost_updated, ("newCost",)),
+            "CurrencyMintAmountUpdated": (self._on_mint_amount_updated, ("newAmount",)),
+        }
 
-    def process_event(self, event: dict):
-        """
-        Processes the cost/amount update event.
-        :param event: The event being processed.
-        """
-
-        event_name = event['event']
-        args = event['args']
+    def _on_mint_cost_updated(self, new_cost: int):
+        self._set_parameter("currency_minting_cost", str(new_cost))
 
-        if event_name == "CurrencyMintCostUpdated":
-            self._set_parameter("currency_minting_cost", str(self._get_arg(args, "newCost")))
-        elif event_name == "CurrencyMintAmountUpdated":
-            self._set_parameter("currency_minting_amount", str(self._get_arg(args, "newAmount")))
+    def _on_mint_amount_updated(self, new_amount: int):
+        self._set_parameter("currency_minting_amount", str(new_amount))
@@ -0,0 +1,172 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.registry import registry
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from eth_utils.abi import collapse_if_tuple
+from contracts.abi.topics import shipped_topics
+from rpc import LogRecord
+
+
+def _resolve_name(names: Sequence[str], key: str) -> int:
+    """
+    Resolves an argument by trying both `{key}` and `_{key}` as its name.
+    :param names: The names of the event's inputs.
+    :param key: The key to resolve.
+    :return: The index of the input.
+    """
+
+    if key in names:
+        return names.index(key)
+    if "_" + key in names:
+        return names.index("_" + key)
+    raise KeyError(key)
+
+
+def _make_normalizer(type_: str) -> Optional[Callable]:
+    """
+    Makes the function that normalizes a decoded value like web3 does
+    (i.e. checksum addresses). Other values are kept as decoded.
+    :param type_: The ABI type.
+    :return: The function, or None if no normalization is needed.
+    """
+
+    if type_ == "address":
+        return to_checksum_address
+    if type_.startswith("address[") and type_.count("[") == 1:
+        return lambda values: [to_checksum_address(value) for value in values]
+    return None
+
+
+def _is_hashed_in_topic(type_: str) -> bool:
+    """
+    Tells whether an indexed value of this type is stored as its hash.
+    """
+
+    return type_ in ("string", "bytes") or type_.endswith("]") or type_.startswith("(")
+
+
+class EventDecoder:
+    """
+    The precompiled decoder of a single event. It takes a raw log and
+    returns the handler's arguments as a flat tuple, in the order the
+    handler method expects them.
+    """
+
+    __slots__ = ("name", "method", "_topic_count", "_data_decoder", "_getters", "_names")
+
+    def __init__(self, abi: dict, method: Callable, arg_names: Sequence[str]):
+        """
+        Compiles the decoder.
+        :param abi: The ABI entry of the event.
+        :param method: The (bound) handler method.
+        :param arg_names: The names of the arguments the method takes,
+          resolved as `{name}` or `_{name}` against the ABI inputs.
+        """
+
+        self.name = abi["name"]
+        self.method = method
+        inputs = abi["inputs"]
+        names = [entry["name"] for entry in inputs]
+        types = [collapse_if_tuple(entry) for entry in inputs]
+        indexed = [bool(entry.get("indexed")) for entry in inputs]
+        data_types = [type_ for type_, is_indexed in zip(types, indexed) if not is_indexed]
+        self._topic_count = 1 + sum(indexed)
+        self._data_decoder = TupleDecoder(decoders=[registry.get_decoder(type_) for type_ in data_types])
+
+        # Where each input comes from: a topic (decoded on its own) or
+        # an element of the decoded data.
+        sources = []
+        topic_index, data_index = 1, 0
+        for type_, is_indexed in zip(types, indexed):
+            if is_indexed:
+                decoder = None if _is_hashed_in_topic(type_) else registry.get_decoder(type_)
+                sources.append((True, topic_index, decoder, _make_normalizer(type_)))
+                topic_index += 1
+            else:
+                sources.append((False, data_index, None, _make_normalizer(type_)))
+                data_index += 1
+
+        self._names = []
+        self._getters = []
+        for key in arg_names:
+            index = _resolve_name(names, key)
+            self._names.append(names[index])
+            self._getters.append(self._make_getter(*sources[index]))
+
+    @staticmethod
+    def _make_getter(from_topic: bool, index: int, decoder: Optional[Callable],
+                     normalizer: Optional[Callable]) -> Callable:
+        """
+        Makes the function that extracts one argument out of the log's
+        topics and the decoded data.
+        """
+
+        if from_topic:
+            if decoder is None:
+                def get(log, data):
+                    return log.topic(index)
+            else:
+                def get(log, data):
+                    return decoder(ContextFramesBytesIO(log.topic(index)))
+        else:
+            def get(log, data):
+                return data[index]
+
+        if normalizer is None:
+            return get
+        return lambda log, data: normalizer(get(log, data))
+
+    def decode(self, log: LogRecord) -> tuple:
+        """
+        Decodes a raw log.
+        :param log: The log.
+        :return: The arguments, as a flat tuple.
+        """
+
+        if log.topic_count != self._topic_count:
+            raise ValueError(f"Mismatched topics for event {self.name}: {log.topic_count}")
+        data = self._data_decoder(ContextFramesBytesIO(log.data))
+        return tuple(get(log, data) for get in self._getters)
+
+    def from_event(self, event: dict) -> tuple:
+        """
+        Takes the arguments out of an event already decoded by web3.
+        :param event: The event.
+        :return: The arguments, as a flat tuple.
+        """
+
+        args = event["args"]
+        return tuple(args[name] for name in self._names)
+
+
+def event_topics(abi: List[dict]) -> Dict[str, bytes]:
+    """
+    Gets the topics (i.e. the hashed signatures) of the events in an
+    ABI. The shipped ABIs have them precomputed, so they are hashed
+    only for other ABIs.
+    :param abi: The contract's ABI.
+    :return: A dictionary of event name => topic.
+    """
+
+    topics = shipped_topics(abi)
+    if topics is None:
+        topics = {
+            entry["name"]: event_abi_to_log_topic(entry) for entry in abi
+            if entry.get("type") == "event" and not entry.get("anonymous")
+        }
+    return topics
+
+
+def compile_decoders(abi: List[dict], methods: Dict[str, Tuple[Callable, Sequence[str]]]) -> Dict[bytes, EventDecoder]:
+    """
+    Compiles the decoders of some events of a contract's ABI.
+    :param abi: The contract's ABI.
+    :param methods: A dictionary of event name => (bound method, argument names).
+    :return: A dictionary of topic => decoder.
+    """
+
+    topics = event_topics(abi)
+    return {
+        topics[entry["name"]]: EventDecoder(entry, *methods[entry["name"]]) for entry in abi
+        if entry.get("type") == "event" and entry["name"] in topics and entry["name"] in methods
+    }
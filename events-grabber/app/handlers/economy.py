@@ -1,7 +1,9 @@
-from typing import List
+from typing import List, Optional
 from pymongo import MongoClient
 from web3.contract import Contract
 from .base import MongoDBContractEventHandler
+from .writes import WriteBuffer
+from .balances import BalanceDeltas
 
 
 """
@@ -17,6 +19,9 @@ database:
    - non-uniquely by `token` (ordering does not matter).
    - non-uniquely by `owner` (ordering does not matter).
    - uniquely by the pair (`token`, `owner`).
+
+   Each balance keeps its amount as `limbs`, which are incremented
+   (see the balances module), instead of a decimal `amount`.
 """
 
 
@@ -27,85 +32,59 @@ class EconomyContractEventHandler(MongoDBContractEventHandler):
 
     DEALS = "deals"
     BALANCES = "balances"
+    # Balances are incremented, and deals are inserted.
+    REPLAYABLE = False
 
-    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict):
-        super().__init__(contract, client, db_name, session_kwargs)
+    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
+        super().__init__(contract, client, db_name, session_kwargs, write_buffer)
         self._name = "economy"
-        self._deals = self.db[self.DEALS]
-        self._balances = self.db[self.BALANCES]
+        self._balance_deltas = BalanceDeltas(self.BALANCES)
+        self._write_buffer.attach(self._balance_deltas)
+
+    def get_collections(self):
+        return self.DEALS, self.BALANCES
 
-    def get_event_names(self):
+    def get_event_methods(self):
         """
         This handler processes 6 events: Transfer-related and deal-related.
-        :return: The names of the 6 events.
-        """
-
-        return ["TransferSingle", "TransferBatch", "DealStarted", "DealAccepted",
-                "DealConfirmed", "DealBroken"]
-
-    def process_event(self, event: dict):
-        """
-        Processes two types of events: TransferSingle/Batch, and
-        DealStarted/Accepted/Confirmed/Broken. The Data is stored
-        into two different collections.
-        :param event: The event to process.
-        """
-
-        event_name = event['event']
-        args = event['args']
-        from_ = self._get_arg(args, 'from')
-        to = self._get_arg(args, 'to')
-
-        if event_name == 'TransferSingle':
-            id_ = "0x%064x" % (self._get_arg(args, 'id') or 0)
-            value = self._get_arg(args, 'value') or 0
-            self._handle_transfer_single(from_, to, id_, value)
-        elif event_name == 'TransferBatch':
-            ids_ = ["0x%064x" % k for k in self._get_arg(args, 'ids') or []]
-            values = self._get_arg(args, 'values') or []
-            self._handle_transfer_batch(from_, to, ids_, values)
-        elif event_name == 'DealStarted':
-            self._handle_deal_started(self._get_arg(args, 'dealId'),
-                                      self._get_arg(args, 'emitter'),
-                                      self._get_arg(args, 'receiver'),
-                                      self._get_arg(args, 'emitterTokenIds'),
-                                      self._get_arg(args, 'emitterTokenAmounts'))
-        elif event_name == 'DealAccepted':
-            self._handle_deal_accepted(self._get_arg(args, 'dealId'),
-                                       self._get_arg(args, 'receiverTokenIds'),
-                                       self._get_arg(args, 'receiverTokenAmounts'))
-        elif event_name == 'DealConfirmed':
-            self._handle_deal_confirmed(self._get_arg(args, 'dealId'))
-        elif event_name == 'DealBroken':
-            self._handle_deal_broken(self._get_arg(args, 'dealId'))
+        The data is stored into two different collections.
+        :return: The methods of the 6 events.
+        """
+
+        return {
+            "TransferSingle": (self._on_transfer_single, ("from", "to", "id", "value")),
+            "TransferBatch": (self._on_transfer_batch, ("from", "to", "ids", "values")),
+            "DealStarted": (self._handle_deal_started, ("dealId", "emitter", "receiver",
+                                                        "emitterTokenIds", "emitterTokenAmounts")),
+            "DealAccepted": (self._handle_deal_accepted, ("dealId", "receiverTokenIds", "receiverTokenAmounts")),
+            "DealConfirmed": (self._handle_deal_confirmed, ("dealId",)),
+            "DealBroken": (self._handle_deal_broken, ("dealId",)),
+        }
+
+    def _on_transfer_single(self, from_: str, to: str, id_: int, value: int):
+        self._handle_transfer_single(from_, to, "0x%064x" % id_, value)
+
+    def _on_transfer_batch(self, from_: str, to: str, ids: List[int], values: List[int]):
+        self._handle_transfer_batch(from_, to, ["0x%064x" % k for k in ids], values)
 
     def _balance_change(self, from_: str, id_: str, value: int):
         """
-        Decrements the balance of a given (owner, token) entry.
+        Changes the balance of a given (owner, token) entry. The change
+        is coalesced with the other changes of the same entry, and sent
+        when the write buffer flushes.
         :param from_: The owner.
         :param id_: The token id.
+        :param value: The (signed) change.
         """
 
-        from_entry = self._balances.find_one({
-            "owner": from_,
-            "token": id_
-        }, **self.client_session_kwargs) or {}
-        from_balance = int(from_entry.get('amount') or '0')
-        from_balance += value
-        from_balance_str = str(from_balance)
-        data = {
-            "owner": from_,
-            "token": id_,
-            "amount": from_balance_str
-        }
+        extra = None
         id_val = int(id_, 16)
         if id_val & (1 << 255):
             brand_id = "0x%040x" % ((id_val & ((1 << 255) - 1)) >> 64)
-            data["brand"] = brand_id
-        self._balances.replace_one({
-            "owner": from_,
-            "token": id_
-        }, data, upsert=True, **self.client_session_kwargs)
+            extra = {"brand": brand_id}
+        self._balance_deltas.add(from_, id_, value, extra)
+        self._write_buffer.flush_if_full()
 
     def _handle_transfer_single(self, from_: str, to: str, id_: str, value: int):
         """
@@ -149,14 +128,14 @@ class EconomyContractEventHandler(MongoDBContractEventHandler):
         :param emitter_token_amounts: The amounts of the emitter.
         """
 
-        self._deals.insert_one({
+        self._write_buffer.insert_one(self.DEALS, {
             "index": str(deal_index),
             "emitter": emitter,
             "receiver": receiver,
             "emitter_ids": [str(id) for id in emitter_token_ids],
             "emitter_amounts": [str(amount) for amount in emitter_token_amounts],
             "status": "created"
-        }, **self.client_session_kwargs)
+        })
 
     def _handle_deal_accepted(self, deal_index: int, receiver_token_ids: list, receiver_token_amounts: list):
         """
@@ -166,13 +145,13 @@ class EconomyContractEventHandler(MongoDBContractEventHandler):
         :param receiver_token_amounts: The amounts of the emitter.
         """
 
-        self._deals.update_one({
+        self._write_buffer.update_one(self.DEALS, {
             "index": str(deal_index)
         }, {"$set": {
             "receiver_ids": [str(id) for id in receiver_token_ids],
             "receiver_amounts": [str(amount) for amount in receiver_token_amounts],
             "status": "accepted"
-        }}, **self.client_session_kwargs)
+        }})
 
     def _handle_deal_confirmed(self, deal_index: int):
         """
@@ -181,11 +160,11 @@ class EconomyContractEventHandler(MongoDBContractEventHandler):
         :param deal_index: The confirmed deal.
         """
 
-        self._deals.update_one({
+        self._write_buffer.update_one(self.DEALS, {
             "index": str(deal_index)
         }, {"$set": {
             "status": "confirmed"
-        }}, **self.client_session_kwargs)
+        }})
 
     def _handle_deal_broken(self, deal_index: int):
         """
@@ -195,8 +174,8 @@ class EconomyContractEventHandler(MongoDBContractEventHandler):
         :param deal_index: The broken deal.
         """
 
-        self._deals.update_one({
+        self._write_buffer.update_one(self.DEALS, {
             "index": str(deal_index)
         }, {"$set": {
             "status": "rejected"
-        }}, **self.client_session_kwargs)
+        }})
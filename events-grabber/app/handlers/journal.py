@@ -0,0 +1,222 @@
+import logging
+from typing import Dict, Iterable, List, Tuple
+from pymongo import ReplaceOne, DeleteOne
+from pymongo.database import Database
+from metadata.queue import MetadataQueue
+from .balances import BalanceDeltas
+from .writes import filter_key
+
+
+LOGGER = logging.getLogger("grabber:journal")
+LOGGER.setLevel(logging.INFO)
+
+
+"""
+This class has the following requirements in whatever is used as the underlying
+database:
+
+1. "reorg_journal" collection must be indexed:
+   - uniquely by `to_block`.
+"""
+
+
+class ReorgJournal:
+    """
+    Records how to undo the writes done while processing a range of
+    blocks that might still be reorganized. For each document touched
+    by a replace or update, its previous state (or its absence) is
+    kept the first time it's touched in the range. Inserted documents
+    are kept by id. Balance changes are kept as the summed deltas per
+    (owner, token), plus the balances they created. Tokens whose
+    metadata was requested are kept, to request them again.
+
+    The journal is stored, along with the hash of its last block, in
+    the same context (and transaction, if any) of the writes. Rolling
+    it back restores the state before its range.
+    """
+
+    JOURNAL = "reorg_journal"
+
+    def __init__(self, from_block: int):
+        """
+        Creates an empty journal.
+        :param from_block: The first block of the range.
+        """
+
+        self._from_block = from_block
+        self._restore: Dict[Tuple[str, str], dict] = {}
+        self._inserted: List[dict] = []
+        self._balances: Dict[Tuple[str, str, str], int] = {}
+        self._created_balances: List[dict] = []
+        self._tokens = set()
+
+    def capture(self, db: Database, collection_name: str, filter_: dict, session_kwargs: dict):
+        """
+        Captures the current state of a document, the first time it is
+        about to be replaced or updated in the range.
+        :param db: The database.
+        :param collection_name: The collection.
+        :param filter_: The filter of the document.
+        :param session_kwargs: The -optionally- MongoDB session.
+        """
+
+        key = (collection_name, filter_key(filter_))
+        if key not in self._restore:
+            self._restore[key] = {"collection": collection_name, "filter": filter_,
+                                  "previous": db[collection_name].find_one(filter_, **session_kwargs)}
+
+    def capture_insert(self, collection_name: str, document_id):
+        """
+        Records an inserted document.
+        :param collection_name: The collection.
+        :param document_id: The id of the document.
+        """
+
+        self._inserted.append({"collection": collection_name, "id": document_id})
+
+    def record_balances(self, collection_name: str, deltas: Dict[Tuple[str, str], int], created_ids: Iterable):
+        """
+        Records the balance changes that were sent.
+        :param collection_name: The balances collection.
+        :param deltas: The sent deltas, by (owner, token).
+        :param created_ids: The ids of the balances they created.
+        """
+
+        for (owner, token), delta in deltas.items():
+            key = (collection_name, owner, token)
+            self._balances[key] = self._balances.get(key, 0) + delta
+        self._created_balances.extend({"collection": collection_name, "id": id_} for id_ in created_ids)
+
+    def record_metadata(self, token_ids: Iterable[int]):
+        """
+        Records the tokens whose metadata was requested.
+        :param token_ids: The ids of the tokens.
+        """
+
+        self._tokens.update(token_ids)
+
+    def _records(self) -> dict:
+        """
+        Tells how to undo the writes, as stored.
+        """
+
+        return {
+            "restore": list(self._restore.values()),
+            "inserted": self._inserted,
+            "balances": [{"collection": collection_name, "owner": owner, "token": token, "delta": str(delta)}
+                         for (collection_name, owner, token), delta in self._balances.items() if delta],
+            "created_balances": self._created_balances,
+            "tokens": ["0x%064x" % token_id for token_id in sorted(self._tokens)]
+        }
+
+    def commit(self, db: Database, session_kwargs: dict, to_block: int, block_hash: str):
+        """
+        Stores the journal.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param to_block: The last block of the range.
+        :param block_hash: The hash of the last block of the range.
+        """
+
+        db[self.JOURNAL].replace_one({"to_block": to_block}, {
+            "from_block": self._from_block,
+            "to_block": to_block,
+            "block_hash": block_hash,
+            **self._records()
+        }, upsert=True, **session_kwargs)
+
+    def append_to(self, db: Database, session_kwargs: dict, to_block: int):
+        """
+        Adds the journal to an already stored entry (e.g. for handlers
+        processing, later, the same range of blocks).
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param to_block: The last block of the stored entry.
+        """
+
+        records = self._records()
+        tokens = records.pop("tokens")
+        db[self.JOURNAL].update_one({"to_block": to_block}, {
+            "$push": {key: {"$each": values} for key, values in records.items()},
+            "$addToSet": {"tokens": {"$each": tokens}}
+        }, **session_kwargs)
+
+    @classmethod
+    def rollback(cls, db: Database, session_kwargs: dict, entry: dict):
+        """
+        Rolls back a stored journal entry, and removes it.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param entry: The stored journal entry.
+        """
+
+        LOGGER.warning(f"Rolling back blocks: {entry['from_block']}:{entry['to_block']}")
+        balance_deltas = {}
+        for balance in entry["balances"]:
+            deltas = balance_deltas.setdefault(balance["collection"], BalanceDeltas(balance["collection"]))
+            deltas.add(balance["owner"], balance["token"], -int(balance["delta"]))
+        for deltas in balance_deltas.values():
+            deltas.flush(db, session_kwargs)
+
+        deletions = {}
+        for created in entry["created_balances"] + entry["inserted"]:
+            deletions.setdefault(created["collection"], []).append(DeleteOne({"_id": created["id"]}))
+        for collection_name, operations in deletions.items():
+            db[collection_name].bulk_write(operations, ordered=False, **session_kwargs)
+
+        # Documents captured more than once (i.e. by journals appended
+        # later) are restored to their earliest capture: the restores
+        # are sent in reverse, as one ordered bulk write per collection.
+        restores = {}
+        for restore in reversed(entry["restore"]):
+            previous = restore["previous"]
+            if previous is None:
+                operation = DeleteOne(restore["filter"])
+            else:
+                operation = ReplaceOne({"_id": previous["_id"]}, previous, upsert=True)
+            restores.setdefault(restore["collection"], []).append(operation)
+        for collection_name, operations in restores.items():
+            db[collection_name].bulk_write(operations, ordered=True, **session_kwargs)
+
+        if entry["tokens"]:
+            db[MetadataQueue.QUEUE].bulk_write([MetadataQueue.enqueue_operation(int(token, 16))
+                                                for token in entry["tokens"]], ordered=False, **session_kwargs)
+        db[cls.JOURNAL].delete_one({"_id": entry["_id"]}, **session_kwargs)
+
+    @classmethod
+    def strip(cls, db: Database, session_kwargs: dict, collections: Iterable[str]):
+        """
+        Removes the records of some collections from all the entries
+        (e.g. when the collections are cleared to be rebuilt).
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param collections: The collections.
+        """
+
+        collections = list(collections)
+        if collections:
+            db[cls.JOURNAL].update_many({}, {"$pull": {
+                key: {"collection": {"$in": collections}}
+                for key in ("restore", "inserted", "balances", "created_balances")
+            }}, **session_kwargs)
+
+    @classmethod
+    def prune(cls, db: Database, session_kwargs: dict, below_block: int):
+        """
+        Removes the entries that can no longer be reorganized.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param below_block: The entries ending before this block are removed.
+        """
+
+        db[cls.JOURNAL].delete_many({"to_block": {"$lt": below_block}}, **session_kwargs)
+
+    @classmethod
+    def entries(cls, db: Database) -> List[dict]:
+        """
+        Gets the stored entries, newest first.
+        :param db: The database.
+        :return: The entries.
+        """
+
+        return list(db[cls.JOURNAL].find({}).sort("to_block", -1))
@@ -1,7 +1,9 @@
 import binascii
+from typing import Optional
 from pymongo import MongoClient
 from web3.contract import Contract
 from .base import MongoDBContractEventHandler
+from .writes import WriteBuffer
 
 
 """
@@ -22,30 +24,30 @@ class MetaverseContractEventHandler(MongoDBContractEventHandler):
 
     METAVERSE_PERMISSIONS = "metaverse_permissions"
 
-    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict):
-        super().__init__(contract, client, db_name, session_kwargs)
+    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
+        super().__init__(contract, client, db_name, session_kwargs, write_buffer)
         self._name = "metaverse"
-        self._permissions = self.db[self.METAVERSE_PERMISSIONS]
 
-    def get_event_names(self):
+    def get_collections(self):
+        return (self.METAVERSE_PERMISSIONS,)
+
+    def get_event_methods(self):
         """
         This handler only processes a single event: "PermissionChanged".
-        :return: Only the "PermissionChanged" event.
+        :return: The method of the "PermissionChanged" event.
         """
 
-        return ["PermissionChanged"]
+        return {"PermissionChanged": (self._on_permission_changed, ("permission", "user", "set"))}
 
-    def process_event(self, event: dict):
+    def _on_permission_changed(self, permission: bytes, user: str, set_: bool):
         """
         Processes the incoming event: PermissionChanged.
-        :param event: The event to process.
+        :param permission: The permission.
+        :param user: The user.
+        :param set_: Whether the permission is granted or revoked.
         """
 
-        event_name = event['event']
-        args = event['args']
-        if event_name == "PermissionChanged":
-            permission = '0x' + binascii.hexlify(self._get_arg(args, 'permission')).decode('utf-8')
-            user = self._get_arg(args, 'user')
-            set_ = self._get_arg(args, 'set')
-            self._permissions.replace_one({"permission": permission, "user": user},
-                                          {"permission": permission, "user": user, "value": set_}, upsert=True)
+        permission = '0x' + binascii.hexlify(permission).decode('utf-8')
+        self._write_buffer.replace_one(self.METAVERSE_PERMISSIONS, {"permission": permission, "user": user},
+                                       {"permission": permission, "user": user, "value": set_}, upsert=True)
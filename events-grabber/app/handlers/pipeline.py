@@ -0,0 +1,140 @@
+import logging
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+from .streams import unpack_position, merge_streams, BackgroundStream
+
+
+LOGGER = logging.getLogger("grabber:pipeline")
+LOGGER.setLevel(logging.INFO)
+
+
+class EventPipeline:
+    """
+    Ingests the events of a set of handlers in a block range through
+    concurrent stages, connected by bounded queues:
+
+    1. Fetch: each handler fetches its raw batches (e.g. the logs of
+       each window) in its own thread, a few batches ahead.
+    2. Decode: each handler decodes its fetched batches in its own
+       thread, into sorted (position, method, arguments) events.
+    3. Merge: the decoded streams are merged by position in a thread.
+    4. Apply: the merged events are applied, in the caller's thread,
+       by `process`, in as many calls (e.g. checkpoint chunks) as
+       needed.
+
+    Full queues hold the previous stages back, so the fetching keeps
+    ahead of the applying (e.g. while a chunk is being committed) but
+    never too far ahead: the memory stays bounded.
+    """
+
+    def __init__(self, handlers: list, start_block: int, end_block: int, collection_workers: int,
+                 fetch_ahead: int, buffer_size: int):
+        """
+        Creates and starts the pipeline.
+        :param handlers: The handlers.
+        :param start_block: The start block index.
+        :param end_block: The end block index (both inclusive).
+        :param collection_workers: How many handlers can fetch at once.
+        :param fetch_ahead: How many fetched batches, per handler, can
+          wait to be decoded.
+        :param buffer_size: How many decoded events, per handler (and
+          merged), can wait to be applied.
+        """
+
+        self._pending = None
+        slots = threading.Semaphore(collection_workers)
+        self._streams: List[BackgroundStream] = []
+        decoded = []
+        for handler in handlers:
+            fetched = self._start(self._make_fetch(handler, start_block, end_block), fetch_ahead,
+                                  f"fetcher:{handler.name}", slots)
+            decoded.append(self._start(self._make_decode(handler, fetched), buffer_size,
+                                       f"decoder:{handler.name}"))
+        self._merged = iter(self._start(lambda: merge_streams(decoded), buffer_size, "merger"))
+
+    def _start(self, factory: Callable, size: int, name: str,
+               slots: Optional[threading.Semaphore] = None) -> BackgroundStream:
+        stream = BackgroundStream(factory, size, name, slots)
+        self._streams.append(stream)
+        return stream
+
+    @staticmethod
+    def _make_fetch(handler, start_block: int, end_block: int) -> Callable[[], Iterator[list]]:
+        def fetch():
+            LOGGER.info(f"Collecting all the events for handler: {handler.name} in range: {start_block}:{end_block}")
+            return handler.iter_batches(start_block, end_block)
+
+        return fetch
+
+    @staticmethod
+    def _make_decode(handler, fetched: BackgroundStream) -> Callable[[], Iterator[tuple]]:
+        def decode():
+            for batch in fetched:
+                for position, method, args in handler.decode_batch(batch):
+                    yield position, method, args, handler
+
+        return decode
+
+    def _take(self) -> Optional[Tuple[int, Callable, tuple, object]]:
+        """
+        Takes the next merged event (or the one left pending).
+        :return: The (position, method, arguments, handler) event, or None.
+        """
+
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        return next(self._merged, None)
+
+    def events(self) -> Iterator[Tuple[int, Callable, tuple, object]]:
+        """
+        Iterates over all the remaining events, without applying them.
+        :return: An iterator of (position, method, arguments, handler) tuples.
+        """
+
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            yield item
+
+    def process(self, end_block: int, max_events: int = 0) -> int:
+        """
+        Applies the events from the first block not processed yet to
+        the given end block (inclusive), which must be within the range
+        of the pipeline.
+        :param end_block: The end block index.
+        :param max_events: When positive, the processing stops at the
+          first block boundary after this amount of events.
+        :return: The last block that was fully processed.
+        """
+
+        processed = 0
+        last_block_number = None
+        while True:
+            item = self._take()
+            if item is None:
+                break
+            position, method, args, handler = item
+            block_number, transaction_index, log_index = unpack_position(position)
+            if block_number > end_block:
+                self._pending = item
+                break
+            if 0 < max_events <= processed and block_number > last_block_number:
+                LOGGER.info(f"Stopping after {processed} events, at block: {block_number - 1}")
+                self._pending = item
+                return block_number - 1
+            LOGGER.info(f"Processing event {block_number}:{transaction_index}:{log_index} "
+                        f"with handler: {handler.name}")
+            method(*args)
+            last_block_number = block_number
+            processed += 1
+        return end_block
+
+    def close(self):
+        """
+        Stops all the stages, discarding the pending items.
+        """
+
+        for stream in self._streams:
+            stream.close()
@@ -1,6 +1,8 @@
+from typing import Optional
 from pymongo import MongoClient
 from web3.contract import Contract
 from .base import MongoDBContractEventHandler
+from .writes import WriteBuffer
 
 
 """
@@ -21,36 +23,34 @@ class SponsorRegistryContractEventHandler(MongoDBContractEventHandler):
 
     SPONSORS = "sponsors"
 
-    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict):
-        super().__init__(contract, client, db_name, session_kwargs)
+    def __init__(self, contract: Contract, client: MongoClient, db_name: str, session_kwargs: dict,
+                 write_buffer: Optional[WriteBuffer] = None):
+        super().__init__(contract, client, db_name, session_kwargs, write_buffer)
         self._name = "sponsor-registry"
-        self._sponsors = self.db[self.SPONSORS]
 
-    def get_event_names(self):
+    def get_collections(self):
+        return (self.SPONSORS,)
+
+    def get_event_methods(self):
         """
         Returns the only processed event: Sponsored.
         """
 
-        return ["Sponsored"]
+        return {"Sponsored": (self._on_sponsored, ("sponsor", "brandId", "sponsored"))}
 
-    def process_event(self, event: dict):
+    def _on_sponsored(self, sponsor: str, brand_id: str, sponsored: bool):
         """
         Processes the Sponsored event.
-        :param event: The event to process.
+        :param sponsor: The sponsor.
+        :param brand_id: The sponsored brand.
+        :param sponsored: Whether the brand is sponsored or not.
         """
 
-        event_name = event['event']
-        args = event['args']
-
-        if event_name == "Sponsored":
-            sponsor = self._get_arg(args, "sponsor")
-            brand_id = self._get_arg(args, "brandId")
-            sponsored = self._get_arg(args, "sponsored")
-            self._sponsors.replace_one({
-                "sponsor": sponsor,
-                "brand": brand_id
-            }, {
-                "sponsor": sponsor,
-                "brand": brand_id,
-                "sponsored": sponsored
-            }, upsert=True, **self.client_session_kwargs)
+        self._write_buffer.replace_one(self.SPONSORS, {
+            "sponsor": sponsor,
+            "brand": brand_id
+        }, {
+            "sponsor": sponsor,
+            "brand": brand_id,
+            "sponsored": sponsored
+        }, upsert=True)
@@ -0,0 +1,157 @@
+import heapq
+import queue
+import itertools
+import threading
+from typing import Callable, Iterable, Iterator, Optional
+
+
+# Bit widths used to pack an event position into a single integer.
+# They are generous: a block holds far less than 2^24 transactions
+# or logs.
+_TX_BITS = 24
+_LOG_BITS = 24
+
+
+def pack_position(block_number: int, transaction_index: int, log_index: int) -> int:
+    """
+    Packs the position of an event in the chain into a single integer,
+    so positions can be compared as plain integers.
+    :param block_number: The block number.
+    :param transaction_index: The transaction index in the block.
+    :param log_index: The log index in the block.
+    :return: The packed position.
+    """
+
+    return (block_number << (_TX_BITS + _LOG_BITS)) | (transaction_index << _LOG_BITS) | log_index
+
+
+def unpack_position(position: int) -> tuple:
+    """
+    Unpacks a position packed by `pack_position`.
+    :param position: The packed position.
+    :return: A (block_number, transaction_index, log_index) tuple.
+    """
+
+    return (position >> (_TX_BITS + _LOG_BITS),
+            (position >> _LOG_BITS) & ((1 << _TX_BITS) - 1),
+            position & ((1 << _LOG_BITS) - 1))
+
+
+def merge_streams(streams: Iterable[Iterable[tuple]]) -> Iterator[tuple]:
+    """
+    Merges several streams of (position, ...) tuples, each one already
+    sorted by position, into a single sorted stream. Only the head of
+    each stream is kept in memory.
+    :param streams: The streams to merge.
+    :return: The merged stream.
+    """
+
+    return heapq.merge(*streams, key=lambda item: item[0])
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Groups the items of an iterable into lists of up to a given size.
+    :param items: The items.
+    :param size: The maximum size of each list.
+    :return: An iterator of lists.
+    """
+
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+_END = object()
+
+
+class BackgroundStream:
+    """
+    Consumes an iterator in a background thread, keeping up to a
+    given amount of its items in a bounded queue, so the producer
+    works ahead of the consumer but never too far ahead. Errors in
+    the producer are re-raised in the consumer.
+    """
+
+    def __init__(self, factory: Callable[[], Iterable], size: int, name: str,
+                 slots: Optional[threading.Semaphore] = None):
+        """
+        Creates and starts the stream.
+        :param factory: A function returning the iterable to consume.
+        :param size: The maximum amount of items to keep in the queue.
+        :param name: The name of the thread.
+        :param slots: An optional semaphore to hold while retrieving each
+          item from the iterable, to bound how many producers work at once.
+        """
+
+        self._factory = factory
+        self._queue = queue.Queue(maxsize=max(1, size))
+        self._slots = slots
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """
+        Puts an item in the queue, unless the stream gets closed.
+        :param item: The item to put.
+        :return: Whether the item was put.
+        """
+
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _next(self, iterator: Iterator):
+        """
+        Gets the next item from the iterator, holding a slot if needed.
+        :param iterator: The iterator.
+        :return: The next item, or _END.
+        """
+
+        if self._slots is None:
+            return next(iterator, _END)
+        with self._slots:
+            return next(iterator, _END)
+
+    def _run(self):
+        try:
+            iterator = iter(self._factory())
+            while True:
+                item = self._next(iterator)
+                if item is _END or not self._put((True, item)):
+                    break
+        except BaseException as e:
+            self._put((False, e))
+            return
+        self._put((True, _END))
+
+    def __iter__(self):
+        # A closed stream just ends (e.g. when it feeds another stream
+        # being closed as well).
+        while True:
+            try:
+                ok, item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+            if not ok:
+                raise item
+            if item is _END:
+                return
+            yield item
+
+    def close(self):
+        """
+        Stops the producer, discarding the pending items.
+        """
+
+        self._closed.set()
@@ -0,0 +1,317 @@
+import copy
+import logging
+from typing import Dict, List, Tuple
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne, InsertOne
+from pymongo.database import Database
+
+
+LOGGER = logging.getLogger("grabber:writes")
+LOGGER.setLevel(logging.INFO)
+
+
+def filter_key(filter_: dict) -> str:
+    """
+    Makes a hashable key out of a (flat) filter, so writes to the
+    same document can be told apart.
+    :param filter_: The filter.
+    :return: The key.
+    """
+
+    return repr(sorted(filter_.items()))
+
+
+class CoalescedWrites:
+    """
+    Writes that are accumulated (and perhaps combined) in memory,
+    and sent when the write buffer they're attached to flushes.
+    """
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def flush(self, db: Database, session_kwargs: dict, journal=None):
+        """
+        Sends the accumulated writes.
+        :param db: The database.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param journal: The -optional- reorg journal to record the writes into.
+        """
+
+        raise NotImplementedError
+
+    def merge(self, other: "CoalescedWrites"):
+        """
+        Merges the writes accumulated by others of the same kind (e.g.
+        in another process) into these ones.
+        :param other: The other coalesced writes.
+        """
+
+        raise NotImplementedError
+
+    def discard(self):
+        """
+        Discards the accumulated writes.
+        """
+
+        raise NotImplementedError
+
+
+class WriteBuffer:
+    """
+    Collects the write operations of the handlers, per collection,
+    and sends them as ordered bulk writes when flushed. Operations
+    are kept in the order they were added, so writes to the same
+    key are applied in the same order they were issued. The buffer
+    flushes by itself when too many operations are pending. Other
+    coalesced writes may be attached to the buffer, to be flushed
+    (and discarded) along with it. When a reorg journal is in use,
+    it's told about each write so they can be rolled back.
+    """
+
+    def __init__(self, db: Database, max_pending: int = 5000):
+        """
+        Creates the buffer.
+        :param db: The database to write into.
+        :param max_pending: How many operations can be pending before
+          the buffer flushes by itself.
+        """
+
+        self._db = db
+        self._max_pending = max(1, max_pending)
+        self._operations = {}
+        self._pending = 0
+        self._coalesced = []
+        self._session_kwargs = {}
+        self._journal = None
+
+    def __len__(self):
+        return self._pending + sum(len(coalesced) for coalesced in self._coalesced)
+
+    def attach(self, coalesced: CoalescedWrites):
+        """
+        Attaches coalesced writes to this buffer.
+        :param coalesced: The coalesced writes.
+        """
+
+        self._coalesced.append(coalesced)
+
+    def use_session(self, session_kwargs: dict):
+        """
+        Sets the session to flush the writes with. Any pending write
+        (e.g. from an aborted session) is discarded.
+        :param session_kwargs: The -optionally- MongoDB session.
+        """
+
+        self.discard()
+        self._session_kwargs = session_kwargs
+
+    def use_journal(self, journal):
+        """
+        Sets the reorg journal to record the writes into.
+        :param journal: The journal, or None to stop recording.
+        """
+
+        self._journal = journal
+
+    def _add(self, collection_name: str, operation):
+        """
+        Adds an operation, flushing if there are too many pending.
+        :param collection_name: The collection to write into.
+        :param operation: The operation.
+        """
+
+        self._operations.setdefault(collection_name, []).append(operation)
+        self._pending += 1
+        self.flush_if_full()
+
+    def flush_if_full(self):
+        """
+        Flushes, if there are too many pending writes.
+        """
+
+        if len(self) >= self._max_pending:
+            self.flush()
+
+    def replace_one(self, collection_name: str, filter_: dict, document: dict, upsert: bool = False):
+        """
+        Adds a replace_one operation.
+        :param collection_name: The collection to write into.
+        :param filter_: The filter.
+        :param document: The new document.
+        :param upsert: Whether to insert the document if absent.
+        """
+
+        if self._journal is not None:
+            self._journal.capture(self._db, collection_name, filter_, self._session_kwargs)
+        self._add(collection_name, ReplaceOne(filter_, document, upsert=upsert))
+
+    def update_one(self, collection_name: str, filter_: dict, update: dict, upsert: bool = False):
+        """
+        Adds an update_one operation.
+        :param collection_name: The collection to write into.
+        :param filter_: The filter.
+        :param update: The update to apply.
+        :param upsert: Whether to insert a document if absent.
+        """
+
+        if self._journal is not None:
+            self._journal.capture(self._db, collection_name, filter_, self._session_kwargs)
+        self._add(collection_name, UpdateOne(filter_, update, upsert=upsert))
+
+    def insert_one(self, collection_name: str, document: dict):
+        """
+        Adds an insert_one operation.
+        :param collection_name: The collection to write into.
+        :param document: The document to insert.
+        """
+
+        if self._journal is not None:
+            document.setdefault("_id", ObjectId())
+            self._journal.capture_insert(collection_name, document["_id"])
+        self._add(collection_name, InsertOne(document))
+
+    def flush(self):
+        """
+        Sends all the pending operations, one ordered bulk write per
+        collection, and then the attached coalesced writes.
+        """
+
+        if self._pending:
+            LOGGER.info(f"Flushing {self._pending} write operations")
+            operations, self._operations, self._pending = self._operations, {}, 0
+            for collection_name, collection_operations in operations.items():
+                self._db[collection_name].bulk_write(collection_operations, ordered=True, **self._session_kwargs)
+        for coalesced in self._coalesced:
+            coalesced.flush(self._db, self._session_kwargs, self._journal)
+
+    def discard(self):
+        """
+        Discards all the pending operations.
+        """
+
+        self._operations = {}
+        self._pending = 0
+        for coalesced in self._coalesced:
+            coalesced.discard()
+
+
+class RecordedWrites:
+    """
+    The writes recorded by a RecordingWriteBuffer: the operations,
+    per collection and tagged with the position of the event that
+    issued them, and the coalesced writes. Writes recorded in other
+    block ranges can be merged in any order: when replayed, the
+    operations are sorted by position and the ones superseded by a
+    later upserting replace of the same document are skipped, while
+    the coalesced writes (which are commutative) are just merged.
+    """
+
+    def __init__(self, operations: Dict[str, List[tuple]], coalesced: List[CoalescedWrites]):
+        """
+        Creates the recorded writes.
+        :param operations: The (position, kind, filter, payload, upsert)
+          operations, by collection.
+        :param coalesced: The coalesced writes, in attachment order.
+        """
+
+        self.operations = operations
+        self.coalesced = coalesced
+
+    def __len__(self):
+        return sum(len(operations) for operations in self.operations.values()) + \
+            sum(len(coalesced) for coalesced in self.coalesced)
+
+    def merge(self, other: "RecordedWrites"):
+        """
+        Merges other recorded writes into these ones. Both must come
+        from the same set of handlers.
+        :param other: The other recorded writes.
+        """
+
+        for collection_name, operations in other.operations.items():
+            self.operations.setdefault(collection_name, []).extend(operations)
+        for coalesced, other_coalesced in zip(self.coalesced, other.coalesced):
+            coalesced.merge(other_coalesced)
+
+    def replay(self, write_buffer: "WriteBuffer"):
+        """
+        Issues the recorded writes through a write buffer, attaching
+        the coalesced writes to it.
+        :param write_buffer: The write buffer.
+        """
+
+        for coalesced in self.coalesced:
+            write_buffer.attach(coalesced)
+        for collection_name, operations in self.operations.items():
+            operations.sort(key=lambda operation: operation[0])
+            superseded = set()
+            kept = []
+            for operation in reversed(operations):
+                _, kind, filter_, _, upsert = operation
+                if kind != "insert":
+                    key = filter_key(filter_)
+                    if key in superseded:
+                        continue
+                    if kind == "replace" and upsert:
+                        superseded.add(key)
+                kept.append(operation)
+            for _, kind, filter_, payload, upsert in reversed(kept):
+                if kind == "replace":
+                    write_buffer.replace_one(collection_name, filter_, payload, upsert)
+                elif kind == "update":
+                    write_buffer.update_one(collection_name, filter_, payload, upsert)
+                else:
+                    write_buffer.insert_one(collection_name, payload)
+
+
+class RecordingWriteBuffer(WriteBuffer):
+    """
+    A write buffer that sends nothing: it records the operations,
+    tagged with the position of the event being processed, so they
+    can be sent elsewhere (e.g. by another process).
+    """
+
+    def __init__(self):
+        super().__init__(None)
+        self._position = 0
+
+    def at(self, position: int):
+        """
+        Sets the position of the event being processed.
+        :param position: The packed position.
+        """
+
+        self._position = position
+
+    def _record(self, collection_name: str, kind: str, filter_, payload: dict, upsert: bool):
+        self._operations.setdefault(collection_name, []).append((self._position, kind, filter_, payload, upsert))
+        self._pending += 1
+
+    def replace_one(self, collection_name: str, filter_: dict, document: dict, upsert: bool = False):
+        self._record(collection_name, "replace", filter_, document, upsert)
+
+    def update_one(self, collection_name: str, filter_: dict, update: dict, upsert: bool = False):
+        self._record(collection_name, "update", filter_, update, upsert)
+
+    def insert_one(self, collection_name: str, document: dict):
+        self._record(collection_name, "insert", None, document, False)
+
+    def flush_if_full(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def take(self) -> RecordedWrites:
+        """
+        Takes the recorded writes. The coalesced writes are copied
+        and then discarded, since the handlers keep using them.
+        :return: The recorded writes.
+        """
+
+        recorded = RecordedWrites(self._operations, [copy.copy(coalesced) for coalesced in self._coalesced])
+        self._operations, self._pending = {}, 0
+        for coalesced in self._coalesced:
+            coalesced.discard()
+        return recorded
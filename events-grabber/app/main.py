@@ -1,10 +1,14 @@
+import time
+# Taken before the (heavy) imports, to measure the startup time.
+STARTED = time.monotonic()
 import os
 import logging
 from urllib.parse import quote_plus
 from ilock import ILock
 from pymongo import MongoClient
-from web3 import Web3, HTTPProvider
-from runner import run_all
+from rpc import make_web3
+from runner import run_all, run_forever
+from settings import GrabberSettings
 
 
 logging.basicConfig()
@@ -13,23 +17,31 @@ LOGGER.setLevel(logging.INFO)
 
 
 def main(mongodb_server_url: str, db_name: str, gateway_url: str, use_transactions: bool,
-         metaverse_contract_address: str):
+         metaverse_contract_address: str, settings: GrabberSettings):
     """
     The full SemperLand events grabber.
     :param mongodb_server_url: The URL of the MongoDB server.
     :param db_name: The database name
-    :param gateway_url: The URL of the EVM Gateway to use.
+    :param gateway_url: The URL of the EVM Gateway to use (or many URLs,
+      separated by commas, of gateways of the same chain).
     :param use_transactions: Whether to use transactions or not.
     :param metaverse_contract_address: The address of the metaverse contract.
+    :param settings: The grabber settings.
     """
 
     try:
-        LOGGER.info("Started")
+        LOGGER.info(f"Started (imports took {time.monotonic() - STARTED:.2f}s)")
         with ILock("semperland.cache"):
             LOGGER.info("Creating client")
             client = MongoClient(mongodb_server_url)
-            LOGGER.info("Running all the loop")
-            run_all(client, db_name, Web3(HTTPProvider(gateway_url)), use_transactions, metaverse_contract_address)
+            web3 = make_web3(gateway_url, settings.rpc_pool_size, settings.rpc_timeout, settings.rpc_retries,
+                             settings.rpc_hedge_percentile, settings.rpc_max_lag, settings.rpc_head_interval)
+            if settings.run_mode == "daemon":
+                LOGGER.info("Following the head")
+                run_forever(client, db_name, web3, use_transactions, metaverse_contract_address, settings)
+            else:
+                LOGGER.info("Running all the loop")
+                run_all(client, db_name, web3, use_transactions, metaverse_contract_address, settings)
     finally:
         LOGGER.info("Ended")
 
@@ -45,4 +57,4 @@ if __name__ == "__main__":
         )
 
     main(server_url, os.environ["DB_NAME"], os.environ["GATEWAY_URL"], os.getenv('MONGODB_TRANSACTIONS') == 'yes',
-         os.environ["METAVERSE_CONTRACT_ADDRESS"])
+         os.environ["METAVERSE_CONTRACT_ADDRESS"], GrabberSettings.from_environment())
@@ -0,0 +1,6 @@
+from .cache import MetadataHttpCache
+from .hosts import HostPolicy, HostUnavailableError
+from .fetcher import MetadataFetcher
+from .queue import MetadataQueue
+from .workers import MetadataWorkers
+from .refresher import MetadataRefresher
@@ -0,0 +1,60 @@
+from typing import Optional
+from datetime import datetime, timezone
+from pymongo.database import Database
+
+
+"""
+This class has the following requirements in whatever is used as the underlying
+database:
+
+1. "metadata_http_cache" collection must be indexed:
+   - uniquely by `url`.
+"""
+
+
+class MetadataHttpCache:
+    """
+    A persistent cache of the downloaded metadata documents, by URL.
+    It keeps the validators (ETag and Last-Modified) sent by the
+    server, so the documents can be revalidated with conditional
+    requests instead of being downloaded again, and a hash of the
+    content, to tell when it actually changed.
+    """
+
+    HTTP_CACHE = "metadata_http_cache"
+
+    def __init__(self, db: Database):
+        self._collection = db[self.HTTP_CACHE]
+
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Gets the cache entry of a URL.
+        :param url: The URL.
+        :return: The entry (with `etag`, `last_modified`, `content_hash`
+          and `body` fields), or None.
+        """
+
+        return self._collection.find_one({"url": url})
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str, body: bytes):
+        """
+        Stores the cache entry of a URL.
+        :param url: The URL.
+        :param etag: The ETag sent by the server, if any.
+        :param last_modified: The Last-Modified date sent by the server, if any.
+        :param content_hash: The hash of the body.
+        :param body: The body.
+        """
+
+        self._collection.replace_one({"url": url}, {
+            "url": url, "etag": etag, "last_modified": last_modified, "content_hash": content_hash,
+            "body": body, "validated_at": datetime.now(timezone.utc)
+        }, upsert=True)
+
+    def touch(self, url: str):
+        """
+        Marks the entry of a URL as just validated.
+        :param url: The URL.
+        """
+
+        self._collection.update_one({"url": url}, {"$set": {"validated_at": datetime.now(timezone.utc)}})
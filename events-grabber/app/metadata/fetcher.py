@@ -0,0 +1,255 @@
+import json
+import time
+import socket
+import hashlib
+from typing import Optional, Tuple, List, Dict
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from urllib.request import urlopen, Request
+from web3.contract import Contract
+from contracts.multicall import Multicall
+from .cache import MetadataHttpCache
+from .hosts import HostPolicy, HostUnavailableError
+
+
+def invalid_metadata() -> dict:
+    """
+    The metadata to use when the JSON content could not be retrieved.
+    """
+
+    return {"name": "INVALID", "description": "INVALID", "image": "about:blank", "properties": {}}
+
+
+def content_hash(content: bytes) -> str:
+    """
+    Hashes some content.
+    :param content: The content.
+    :return: The hash, in hexadecimal.
+    """
+
+    return hashlib.sha256(content).hexdigest()
+
+
+def unknown_metadata() -> dict:
+    """
+    The metadata to use when the token has no URI.
+    """
+
+    return {"name": "UNKNOWN", "description": "UNKNOWN", "image": "about:blank", "properties": {}}
+
+
+class MetadataFetcher:
+    """
+    Retrieves the metadata of a token by invoking the Metaverse's
+    `tokenURI` method and retrieving its JSON content. If there's an
+    error trying to retrieve the JSON content, then an incomplete
+    metadata will be returned instead. When an HTTP cache is given,
+    the documents are revalidated with conditional requests.
+
+    Requests have a connect deadline and a deadline to read the whole
+    content, and each host is guarded by a host policy (concurrency
+    cap and circuit breaker). While a host is known to be down, its
+    requests fail fast with a HostUnavailableError.
+    """
+
+    def __init__(self, metaverse_contract: Contract, http_cache: Optional[MetadataHttpCache] = None,
+                 host_policy: Optional[HostPolicy] = None, connect_timeout: float = 5.0,
+                 read_timeout: float = 10.0, max_size: int = 1 << 20,
+                 multicall: Optional[Multicall] = None):
+        """
+        Creates the fetcher.
+        :param metaverse_contract: The metaverse contract.
+        :param http_cache: The -optional- HTTP cache.
+        :param host_policy: The -optional- host policy. By default, a new one.
+        :param connect_timeout: The deadline to connect, in seconds.
+        :param read_timeout: The deadline to read the whole content, in seconds.
+        :param max_size: The maximum allowed size of the content.
+        :param multicall: The -optional- multicall to get many token URIs at once.
+        """
+
+        self._metaverse_contract = metaverse_contract
+        self._http_cache = http_cache
+        self._hosts = host_policy or HostPolicy()
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_size = max_size
+        self._multicall = multicall
+
+    @property
+    def counters(self) -> dict:
+        """
+        The counters of the requests' outcomes.
+        """
+
+        return self._hosts.counters
+
+    def _request(self, url: str, headers: dict) -> Tuple[int, dict, bytes]:
+        """
+        Performs a guarded request to the URL's host, with a connect
+        deadline and a deadline for reading the whole body. Client
+        errors (4xx, including 304) are returned, while transport and
+        server errors are raised (and count as host failures).
+        :param url: The URL to retrieve.
+        :param headers: The request headers.
+        :return: A (status, headers, body) tuple.
+        """
+
+        host = urlparse(url).hostname or ""
+        with self._hosts.guard(host, self._read_timeout):
+            started = time.monotonic()
+            try:
+                response = urlopen(Request(url, headers=headers), timeout=self._connect_timeout)
+            except HTTPError as e:
+                if e.code >= 500:
+                    raise
+                return e.code, dict(e.headers or {}), b""
+            with response:
+                chunks = []
+                size = 0
+                while True:
+                    if time.monotonic() - started > self._read_timeout:
+                        raise TimeoutError(f"Read deadline exceeded for: {url}")
+                    # Whatever arrived (up to a limit), rather than
+                    # waiting for the whole limit: the deadline is
+                    # checked while the content trickles in.
+                    chunk = response.read1(65536)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self._max_size:
+                        raise ValueError(f"Content too large for: {url}")
+                    chunks.append(chunk)
+                return response.status, dict(response.headers), b"".join(chunks)
+
+    def _download(self, url: str) -> bytes:
+        """
+        Downloads the content of a URL, revalidating the cached one
+        (if any) by using a conditional request.
+        :param url: The URL to retrieve.
+        :return: The content.
+        """
+
+        if urlparse(url).scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL: {url}")
+        cached = self._http_cache.get(url) if self._http_cache else None
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            status, response_headers, body = self._request(url, headers)
+        except HostUnavailableError:
+            raise
+        except (socket.timeout, TimeoutError) as e:
+            self._hosts.count("timeout")
+            raise e
+        except HTTPError as e:
+            self._hosts.count("server_error")
+            raise e
+        except ValueError as e:
+            self._hosts.count("invalid")
+            raise e
+        except Exception as e:
+            self._hosts.count("connection_error")
+            raise e
+        if status == 304 and cached:
+            self._hosts.count("not_modified")
+            self._http_cache.touch(url)
+            return cached["body"]
+        if status >= 300:
+            self._hosts.count("client_error")
+            raise Exception(f"Unexpected status {status} for: {url}")
+        self._hosts.count("success")
+        if response_headers.get("Content-Type") is None:
+            raise Exception("Invalid content type")
+        etag, last_modified = response_headers.get("ETag"), response_headers.get("Last-Modified")
+        if self._http_cache and (etag or last_modified):
+            hash_ = content_hash(body)
+            if not cached or cached.get("content_hash") != hash_ or cached.get("etag") != etag \
+                    or cached.get("last_modified") != last_modified:
+                self._http_cache.put(url, etag, last_modified, hash_, body)
+            else:
+                self._http_cache.touch(url)
+        return body
+
+    def get_json(self, url: str) -> dict:
+        """
+        Gets the associated JSON content from a URL.
+        :param url: The URL to retrieve.
+        :return: The JSON contents.
+        """
+
+        try:
+            return json.loads(self._download(url))
+        except HostUnavailableError:
+            # The host is known to be down: don't store an
+            # invalid metadata, but try again later.
+            raise
+        except:
+            return invalid_metadata()
+
+    def get_token_uris(self, token_ids: List[int]) -> Dict[int, str]:
+        """
+        Gets the URIs of many tokens, in a single round trip when a
+        multicall is available. Tokens whose URI could not be retrieved
+        are absent in the result.
+        :param token_ids: The token ids.
+        :return: A dictionary of token id => URI.
+        """
+
+        if self._multicall is None or not token_ids:
+            return {}
+        uris = self._multicall.aggregate([self._metaverse_contract.functions.tokenURI(token_id)
+                                          for token_id in token_ids], allow_failure=True)
+        return {token_id: uri for token_id, uri in zip(token_ids, uris) if uri is not None}
+
+    def get_metadata(self, token_id: int, url: Optional[str] = None) -> dict:
+        """
+        Gets the associated JSON content from a token id.
+        :param token_id: The token id to retrieve the  metadata from.
+        :param url: The -optional- already retrieved token URI.
+        :return: The JSON contents.
+        """
+
+        if url is None:
+            url = self._metaverse_contract.functions.tokenURI(token_id).call()
+        if url == "":
+            return unknown_metadata()
+        return self.get_json(url)
+
+    def make_document(self, token_id: int, url: Optional[str] = None) -> dict:
+        """
+        Makes the document to store in the metadata table for a token,
+        with the downloaded JSON content. The document includes a hash
+        of its own content, to tell whether it changed.
+        :param token_id: The id of the token whose metadata is being downloaded.
+        :param url: The -optional- already retrieved token URI.
+        :return: The document.
+        """
+
+        data = self.get_metadata(token_id, url)
+        data["name"] = (data.get("name") or "").strip()
+        data["description"] = (data.get("description") or "").strip()
+        data["image"] = (data.get("image") or "").strip()
+        document = {
+            "token": "0x%064x" % token_id,
+            "metadata": data,
+            "token_group": "nft"
+        }
+        w3 = self._metaverse_contract.w3
+        token_num = int(token_id)
+        if token_num & (1 << 255):
+            # FTs are associated to the system or to a brand.
+            # So here we extract the brand (where 0x000...000
+            # stands for the SYSTEM, actually).
+            #
+            # Also, the token is marked as FT instead of NFT.
+            brand_num = (token_num >> 64) & ((1 << 160) - 1)
+            document["brand"] = w3.to_checksum_address("0x%040x" % brand_num)
+            document["token_group"] = "ft"
+        elif data.get("properties", {}).get("type") == "brand":
+            # We extract the brand itself.
+            document["brand"] = w3.to_checksum_address("0x%040x" % token_num)
+        document["content_hash"] = content_hash(json.dumps(document, sort_keys=True).encode("utf-8"))
+        return document
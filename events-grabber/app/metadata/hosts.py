@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+import contextlib
+from collections import Counter
+
+
+LOGGER = logging.getLogger("grabber:metadata-hosts")
+LOGGER.setLevel(logging.INFO)
+
+
+class HostUnavailableError(Exception):
+    """
+    Raised when a host is known to be down (its circuit is open),
+    or when it is too busy, so the request is not even attempted.
+    """
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Host unavailable: {host} (retry after {retry_after:.1f}s)")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class _HostState:
+    """
+    The state of a single host: its concurrency slots and its circuit.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+
+class HostPolicy:
+    """
+    Bounds how metadata hosts are used: each host has a cap on the
+    concurrent requests and a circuit breaker. After a given amount
+    of consecutive failures the circuit opens, and requests to that
+    host fail fast until a reset timeout elapses. Then, a single
+    probe request is allowed: if it succeeds, the circuit closes, and
+    otherwise it opens again. Each outcome is counted.
+    """
+
+    def __init__(self, max_concurrency: int = 2, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        Creates the policy.
+        :param max_concurrency: How many requests a host can serve at once.
+        :param failure_threshold: How many consecutive failures open the circuit.
+        :param reset_timeout: How many seconds the circuit stays open.
+        """
+
+        self._max_concurrency = max(1, max_concurrency)
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def _get_state(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self._max_concurrency)
+            return state
+
+    def count(self, outcome: str):
+        """
+        Counts an outcome.
+        :param outcome: The outcome (e.g. "success", "timeout").
+        """
+
+        with self._lock:
+            self._counters[outcome] += 1
+
+    @property
+    def counters(self) -> dict:
+        """
+        A snapshot of the outcome counters.
+        """
+
+        with self._lock:
+            return dict(self._counters)
+
+    def _admit(self, host: str, state: _HostState):
+        """
+        Tells whether a request to a host may be attempted, according
+        to its circuit. Raises HostUnavailableError otherwise.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if state.failures < self._failure_threshold:
+                return
+            if now < state.open_until or state.probing:
+                self._counters["short_circuited"] += 1
+                raise HostUnavailableError(host, max(0.0, state.open_until - now) or self._reset_timeout)
+            # Half-open: this request is the probe.
+            state.probing = True
+
+    def _record(self, host: str, state: _HostState, success: bool):
+        with self._lock:
+            state.probing = False
+            if success:
+                state.failures = 0
+            else:
+                state.failures += 1
+                if state.failures >= self._failure_threshold:
+                    state.open_until = time.monotonic() + self._reset_timeout
+                    LOGGER.warning(f"Circuit opened for host: {host} after {state.failures} failures")
+
+    @contextlib.contextmanager
+    def guard(self, host: str, wait: float):
+        """
+        Guards a request to a host: checks its circuit, takes one of
+        its concurrency slots, and records the outcome. The body must
+        raise on failure.
+        :param host: The host.
+        :param wait: How many seconds to wait for a free slot.
+        """
+
+        state = self._get_state(host)
+        self._admit(host, state)
+        if not state.slots.acquire(timeout=wait):
+            with self._lock:
+                state.probing = False
+                self._counters["busy"] += 1
+            raise HostUnavailableError(host, wait)
+        try:
+            yield
+        except BaseException:
+            self._record(host, state, False)
+            raise
+        else:
+            self._record(host, state, True)
+        finally:
+            state.slots.release()
@@ -0,0 +1,111 @@
+import logging
+from typing import Optional, Iterable
+from datetime import datetime, timezone, timedelta
+from pymongo import UpdateOne, ASCENDING, ReturnDocument
+from pymongo.database import Database
+
+
+LOGGER = logging.getLogger("grabber:metadata-queue")
+LOGGER.setLevel(logging.INFO)
+
+
+"""
+This class has the following requirements in whatever is used as the underlying
+database:
+
+1. "metadata_queue" collection must be indexed:
+   - uniquely by `token`.
+   - non-uniquely by (`status`, `not_before`) (ordering does not matter).
+2. Updates with aggregation pipelines must be supported (MongoDB 4.2+).
+"""
+
+
+class MetadataQueue:
+    """
+    A persistent queue of the tokens whose metadata must be (again)
+    downloaded. Each token is present at most once: enqueuing it
+    again while claimed does nothing but bumping its version (it's
+    not claimable by others meanwhile), so the download being done
+    at that time is done again later (see `complete`).
+    Entries are claimed for a while (lease), and the claims expire
+    if the claiming worker dies.
+    """
+
+    QUEUE = "metadata_queue"
+
+    def __init__(self, db: Database, lease_seconds: float = 60.0):
+        """
+        Creates the queue.
+        :param db: The database.
+        :param lease_seconds: How much time a claim lasts.
+        """
+
+        self._collection = db[self.QUEUE]
+        self._lease = timedelta(seconds=lease_seconds)
+
+    @classmethod
+    def enqueue_operation(cls, token_id: int, delay: float = 0) -> UpdateOne:
+        """
+        Makes the operation that enqueues a token.
+        :param token_id: The id of the token.
+        :param delay: How many seconds to wait before the token can be claimed.
+        :return: The operation, to be run in the QUEUE collection.
+        """
+
+        now = datetime.now(timezone.utc)
+        # A pipeline update, so a claimed entry stays claimed.
+        return UpdateOne({"token": "0x%064x" % token_id}, [{"$set": {
+            "status": {"$cond": [{"$eq": ["$status", "claimed"]}, "claimed", "pending"]},
+            "enqueued_at": now,
+            "not_before": now + timedelta(seconds=delay),
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+        }}], upsert=True)
+
+    def enqueue(self, token_ids: Iterable[int], delay: float = 0):
+        """
+        Enqueues many tokens, outside any transaction.
+        :param token_ids: The ids of the tokens.
+        :param delay: How many seconds to wait before they can be claimed.
+        """
+
+        operations = [self.enqueue_operation(token_id, delay) for token_id in token_ids]
+        if operations:
+            self._collection.bulk_write(operations, ordered=False)
+
+    def claim(self) -> Optional[dict]:
+        """
+        Claims the oldest claimable entry.
+        :return: The claimed entry, or None if there's none.
+        """
+
+        now = datetime.now(timezone.utc)
+        return self._collection.find_one_and_update({
+            "not_before": {"$lte": now},
+            "$or": [{"status": "pending"}, {"status": "claimed", "claimed_until": {"$lt": now}}]
+        }, {"$set": {"status": "claimed", "claimed_until": now + self._lease}},
+            sort=[("enqueued_at", ASCENDING)], return_document=ReturnDocument.AFTER)
+
+    def complete(self, entry: dict):
+        """
+        Removes a claimed entry or, if the token was enqueued again
+        while it was claimed, makes it pending again.
+        :param entry: The claimed entry.
+        """
+
+        if not self._collection.delete_one({"_id": entry["_id"], "version": entry["version"]}).deleted_count:
+            # Unless the claim expired and the entry was claimed again.
+            self._collection.update_one({"_id": entry["_id"], "status": "claimed",
+                                         "claimed_until": entry["claimed_until"]},
+                                        {"$set": {"status": "pending"}, "$unset": {"claimed_until": ""}})
+
+    def release(self, entry: dict, delay: float):
+        """
+        Releases a claimed entry so it can be claimed again later.
+        :param entry: The claimed entry.
+        :param delay: How many seconds to wait before it can be claimed.
+        """
+
+        self._collection.update_one({"_id": entry["_id"], "status": "claimed",
+                                     "claimed_until": entry["claimed_until"]}, {"$set": {
+            "status": "pending", "not_before": datetime.now(timezone.utc) + timedelta(seconds=delay)
+        }})
@@ -0,0 +1,118 @@
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from pymongo import UpdateOne
+from pymongo.database import Database
+from .queue import MetadataQueue
+
+
+LOGGER = logging.getLogger("grabber:metadata-refresher")
+LOGGER.setLevel(logging.INFO)
+
+
+# The names of the placeholder metadata documents stored when the
+# metadata could not be retrieved (see invalid_metadata() and
+# unknown_metadata() in the fetcher).
+BROKEN_NAMES = ("INVALID", "UNKNOWN")
+
+
+class MetadataRefresher:
+    """
+    Periodically looks for tokens whose stored metadata is a placeholder
+    (INVALID or UNKNOWN) and enqueues them again in the metadata queue,
+    so broken entries fix themselves without replaying events.
+
+    Each token backs off exponentially: its attempts and the time of its
+    next attempt are kept in the `refresh` field of its metadata document.
+    The workers keep this field when they store a placeholder again (even
+    a different one), so it survives while the metadata stays broken, and
+    disappears as soon as a good metadata is stored. Also, a global budget
+    bounds how many tokens are enqueued per second.
+    """
+
+    def __init__(self, db: Database, queue: MetadataQueue, tokens_metadata_collection: str,
+                 interval: float = 60.0, rate: float = 1.0, base_delay: float = 300.0,
+                 max_delay: float = 86400.0):
+        """
+        Creates the refresher (not started).
+        :param db: The database.
+        :param queue: The metadata queue.
+        :param tokens_metadata_collection: The name of the metadata collection.
+        :param interval: How many seconds to wait between two scans.
+        :param rate: How many tokens, per second, can be enqueued again.
+        :param base_delay: The delay, in seconds, after the first attempt.
+          It doubles after each attempt.
+        :param max_delay: The maximum delay, in seconds, between attempts.
+        """
+
+        self._tokens_metadata = db[tokens_metadata_collection]
+        self._queue = queue
+        self._interval = interval
+        self._budget = max(1, int(rate * interval))
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """
+        Starts the refresher thread. The first scan is done right away.
+        """
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="metadata:refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the refresher thread and waits for it.
+        """
+
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                LOGGER.exception(f"Error while refreshing the broken metadata: {e}")
+            self._stopping.wait(self._interval)
+
+    def _delay(self, attempts: int) -> float:
+        """
+        Computes the delay after a given amount of attempts.
+        :param attempts: The attempts so far (at least 1).
+        :return: The delay, in seconds.
+        """
+
+        return min(self._max_delay, self._base_delay * (2 ** min(attempts - 1, 32)))
+
+    def refresh_once(self) -> int:
+        """
+        Enqueues again the broken tokens that are due, up to the budget.
+        :return: How many tokens were enqueued.
+        """
+
+        now = datetime.now(timezone.utc)
+        entries = list(self._tokens_metadata.find({
+            "metadata.name": {"$in": list(BROKEN_NAMES)},
+            "refresh.after": {"$not": {"$gt": now}}
+        }, {"token": 1, "refresh": 1}).limit(self._budget))
+        if not entries:
+            return 0
+
+        # The next attempt is scheduled before enqueuing, so a worker
+        # storing a good metadata always wipes it.
+        operations = []
+        for entry in entries:
+            attempts = (entry.get("refresh") or {}).get("attempts", 0) + 1
+            operations.append(UpdateOne({"_id": entry["_id"]}, {"$set": {"refresh": {
+                "attempts": attempts, "after": now + timedelta(seconds=self._delay(attempts))
+            }}}))
+        self._tokens_metadata.bulk_write(operations, ordered=False)
+        self._queue.enqueue(int(entry["token"], 16) for entry in entries)
+        LOGGER.info(f"Enqueued {len(entries)} tokens with broken metadata")
+        return len(entries)
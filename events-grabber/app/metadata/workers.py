@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+from typing import Optional
+from pymongo.database import Database
+from .fetcher import MetadataFetcher
+from .queue import MetadataQueue
+from .hosts import HostUnavailableError
+from .refresher import BROKEN_NAMES
+
+
+LOGGER = logging.getLogger("grabber:metadata-workers")
+LOGGER.setLevel(logging.INFO)
+
+
+class MetadataWorkers:
+    """
+    A pool of threads that take tokens from the metadata queue,
+    download their metadata and store it. They work apart from
+    the events processing, so a slow metadata host never stalls
+    the ingestion.
+    """
+
+    def __init__(self, db: Database, queue: MetadataQueue, fetcher: MetadataFetcher,
+                 tokens_metadata_collection: str, workers: int = 4,
+                 idle_interval: float = 2.0, retry_delay: float = 30.0, claim_batch: int = 8):
+        """
+        Creates the pool (not started).
+        :param db: The database.
+        :param queue: The metadata queue.
+        :param fetcher: The metadata fetcher.
+        :param tokens_metadata_collection: The name of the collection to
+          store the metadata into.
+        :param workers: The amount of threads.
+        :param idle_interval: How many seconds to wait when the queue is empty.
+        :param retry_delay: How many seconds to wait before retrying a
+          token whose processing failed.
+        :param claim_batch: How many tokens a thread claims at once (their
+          URIs are retrieved in a single round trip).
+        """
+
+        self._tokens_metadata = db[tokens_metadata_collection]
+        self._queue = queue
+        self._fetcher = fetcher
+        self._workers = max(1, workers)
+        self._idle_interval = idle_interval
+        self._retry_delay = retry_delay
+        self._claim_batch = max(1, claim_batch)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._draining = threading.Event()
+
+    def start(self):
+        """
+        Starts the threads.
+        """
+
+        self._stopping.clear()
+        self._draining.clear()
+        self._threads = [threading.Thread(target=self._run, name=f"metadata:{index}", daemon=True)
+                         for index in range(self._workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, drain: bool = False):
+        """
+        Stops the threads and waits for them.
+        :param drain: If true, the threads keep working until the queue
+          has no claimable tokens. Otherwise, they stop after their
+          current token.
+        """
+
+        if drain:
+            self._draining.set()
+        else:
+            self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        LOGGER.info(f"Metadata requests outcomes: {self._fetcher.counters}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.process_batch():
+                    continue
+            except Exception as e:
+                LOGGER.exception(f"Error while processing the metadata queue: {e}")
+            if self._draining.is_set():
+                return
+            self._stopping.wait(self._idle_interval)
+
+    def process_batch(self) -> int:
+        """
+        Claims some tokens, gets their URIs at once, and then downloads
+        and stores their metadata.
+        :return: How many tokens were claimed.
+        """
+
+        entries = []
+        while len(entries) < self._claim_batch:
+            entry = self._queue.claim()
+            if entry is None:
+                break
+            entries.append(entry)
+        if not entries:
+            return 0
+        try:
+            uris = self._fetcher.get_token_uris([int(entry["token"], 16) for entry in entries])
+        except Exception as e:
+            LOGGER.warning(f"Could not get the URIs of {len(entries)} tokens at once ({e})")
+            uris = {}
+        for entry in entries:
+            self._process(entry, uris.get(int(entry["token"], 16)))
+        return len(entries)
+
+    def _process(self, entry: dict, url: Optional[str]):
+        """
+        Downloads and stores the metadata of a claimed token.
+        :param entry: The claimed entry.
+        :param url: The -optional- already retrieved token URI.
+        """
+
+        token_id = int(entry["token"], 16)
+        try:
+            started = time.monotonic()
+            document = self._fetcher.make_document(token_id, url)
+            current = self._tokens_metadata.find_one({"token": entry["token"]}, {"content_hash": 1, "refresh": 1})
+            if current and current.get("content_hash") == document["content_hash"]:
+                LOGGER.info(f"Metadata unchanged for token: {entry['token']} in {time.monotonic() - started:.2f}s")
+            else:
+                # A placeholder replacing another one keeps the refresh
+                # attempts, so the backoff of the token goes on.
+                if current and current.get("refresh") and document["metadata"]["name"] in BROKEN_NAMES:
+                    document["refresh"] = current["refresh"]
+                self._tokens_metadata.replace_one({"token": entry["token"]}, document, upsert=True)
+                LOGGER.info(f"Metadata stored for token: {entry['token']} in {time.monotonic() - started:.2f}s")
+            self._queue.complete(entry)
+        except HostUnavailableError as e:
+            LOGGER.info(f"Metadata postponed for token: {entry['token']} ({e})")
+            self._queue.release(entry, e.retry_after)
+        except Exception as e:
+            LOGGER.warning(f"Metadata failed for token: {entry['token']} ({e}). Retrying later")
+            self._queue.release(entry, self._retry_delay)
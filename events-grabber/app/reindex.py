@@ -0,0 +1,52 @@
+import time
+# Taken before the (heavy) imports, to measure the startup time.
+STARTED = time.monotonic()
+import os
+import logging
+from urllib.parse import quote_plus
+from ilock import ILock
+from pymongo import MongoClient
+from runner import run_reindex
+from settings import GrabberSettings
+
+
+logging.basicConfig()
+LOGGER = logging.getLogger("grabber:reindex")
+LOGGER.setLevel(logging.INFO)
+
+
+def main(mongodb_server_url: str, db_name: str, use_transactions: bool,
+         metaverse_contract_address: str, settings: GrabberSettings):
+    """
+    Rebuilds the cache from the local log archive (LOG_ARCHIVE_DIR),
+    with no access to the EVM Gateway. Typically, into an empty (or
+    dropped) database.
+    :param mongodb_server_url: The URL of the MongoDB server.
+    :param db_name: The database name
+    :param use_transactions: Whether to use transactions or not.
+    :param metaverse_contract_address: The address of the metaverse contract.
+    :param settings: The grabber settings.
+    """
+
+    try:
+        LOGGER.info(f"Started (imports took {time.monotonic() - STARTED:.2f}s)")
+        with ILock("semperland.cache"):
+            LOGGER.info("Creating client")
+            client = MongoClient(mongodb_server_url)
+            run_reindex(client, db_name, use_transactions, metaverse_contract_address, settings)
+    finally:
+        LOGGER.info("Ended")
+
+
+if __name__ == "__main__":
+    server_url = os.getenv("MONGODB_URL")
+    if not server_url:
+        server_url = "mongodb://%s:%s@%s:%s" % (
+            quote_plus(os.environ["MONGODB_USER"]),
+            quote_plus(os.environ["MONGODB_PASSWORD"]),
+            os.getenv("MONGODB_HOST", "localhost"),
+            os.getenv("MONGODB_PORT", "27017")
+        )
+
+    main(server_url, os.environ["DB_NAME"], os.getenv('MONGODB_TRANSACTIONS') == 'yes',
+         os.environ["METAVERSE_CONTRACT_ADDRESS"], GrabberSettings.from_environment())
@@ -0,0 +1,50 @@
+import os
+import sys
+import logging
+from typing import Optional
+from urllib.parse import quote_plus
+from pymongo import MongoClient
+from runner.checkpoints import HandlerCheckpoints
+
+
+logging.basicConfig()
+LOGGER = logging.getLogger("grabber:reset")
+LOGGER.setLevel(logging.INFO)
+
+
+def main(mongodb_server_url: str, db_name: str, handler_name: str, block: Optional[int]):
+    """
+    Requests a handler (e.g. "sponsor-registry") to be reset. The
+    grabber applies the request on its next cycle: the handler either
+    processes its events again since the given block or, by default,
+    is rebuilt from scratch, catching up on its own while the other
+    handlers keep following the head.
+    :param mongodb_server_url: The URL of the MongoDB server.
+    :param db_name: The database name
+    :param handler_name: The name of the handler.
+    :param block: The -optional- block to process the handler again from.
+    """
+
+    client = MongoClient(mongodb_server_url)
+    if HandlerCheckpoints(client, db_name).request_reset(handler_name, block):
+        LOGGER.info(f"Reset requested for the handler {handler_name}")
+    else:
+        LOGGER.warning(f"Reset requested for the handler {handler_name}, which has no checkpoints yet: "
+                       f"it applies when a handler with that name first runs")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: {sys.argv[0]} <handler-name> [block]")
+        sys.exit(1)
+
+    server_url = os.getenv("MONGODB_URL")
+    if not server_url:
+        server_url = "mongodb://%s:%s@%s:%s" % (
+            quote_plus(os.environ["MONGODB_USER"]),
+            quote_plus(os.environ["MONGODB_PASSWORD"]),
+            os.getenv("MONGODB_HOST", "localhost"),
+            os.getenv("MONGODB_PORT", "27017")
+        )
+
+    main(server_url, os.environ["DB_NAME"], sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else None)
@@ -0,0 +1,55 @@
+from typing import Optional
+from web3 import Web3
+from .client import BaseJsonRpcClient, JsonRpcClient, JsonRpcError
+from .router import RoutedJsonRpcClient
+from .provider import LeanHTTPProvider
+from .records import LogRecord
+
+
+def make_client(endpoint_uris: str, pool_size: int = 10, timeout: float = 30.0, retries: int = 3,
+                hedge_percentile: float = 0.9, max_lag: int = 3, head_interval: float = 5.0) -> BaseJsonRpcClient:
+    """
+    Makes a lean JSON-RPC client for one or many endpoints. With many
+    endpoints, the requests are routed among them (and each endpoint
+    does not retry by itself: failing requests go to other endpoints).
+    :param endpoint_uris: The URL of the node or, separated by commas,
+      the URLs of many nodes of the same chain.
+    :param pool_size: How many connections are kept alive, per endpoint.
+    :param timeout: The timeout, in seconds, of each request.
+    :param retries: How many times a request is retried after a transient failure.
+    :param hedge_percentile: The percentile (0 to 1) of the latencies a request
+      may take before being hedged to another endpoint. 0 disables hedging.
+    :param max_lag: How many blocks an endpoint may lag behind the others before
+      being skipped.
+    :param head_interval: How many seconds the heads of the endpoints are trusted.
+    :return: The client.
+    """
+
+    uris = [uri.strip() for uri in endpoint_uris.split(",") if uri.strip()]
+    if len(uris) == 1:
+        return JsonRpcClient(uris[0], pool_size, timeout, retries)
+    return RoutedJsonRpcClient([JsonRpcClient(uri, pool_size, timeout, 0) for uri in uris],
+                               hedge_percentile, max_lag, head_interval, retries)
+
+
+def make_web3(endpoint_uris: str, pool_size: int = 10, timeout: float = 30.0, retries: int = 3,
+              hedge_percentile: float = 0.9, max_lag: int = 3, head_interval: float = 5.0) -> Web3:
+    """
+    Makes a Web3 client sending its requests through a lean JSON-RPC
+    client (see make_client for the arguments).
+    :return: The Web3 client.
+    """
+
+    return Web3(LeanHTTPProvider(make_client(endpoint_uris, pool_size, timeout, retries,
+                                             hedge_percentile, max_lag, head_interval)))
+
+
+def get_client(web3: Web3) -> Optional[BaseJsonRpcClient]:
+    """
+    Gets the lean JSON-RPC client a Web3 client sends its requests through.
+    :param web3: The Web3 client.
+    :return: The JSON-RPC client, or None if web3 uses another provider.
+    """
+
+    provider = web3.provider
+    return provider.client if isinstance(provider, LeanHTTPProvider) else None
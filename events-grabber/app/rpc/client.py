@@ -0,0 +1,241 @@
+import json
+import time
+import random
+import logging
+import itertools
+import threading
+from typing import Any, List, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from .records import LogRecord
+
+
+LOGGER = logging.getLogger("grabber:rpc")
+LOGGER.setLevel(logging.INFO)
+
+
+class JsonRpcError(Exception):
+    """
+    Raised when the node answers a request with an error.
+    """
+
+    def __init__(self, code: Optional[int], message: str, data: Any = None):
+        super().__init__(f"JSON-RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class BaseJsonRpcClient:
+    """
+    A lean JSON-RPC client, for the hot calls of the grabber. Many
+    requests may be sent in a single batch. Errors sent by the node
+    itself are raised as JsonRpcError. How the requests are sent is
+    up to each subclass.
+
+    The logs are formatted only as much as the handlers need: they're
+    turned into compact LogRecord objects (with no AttributeDict nor
+    HexBytes wrapping).
+    """
+
+    def __init__(self):
+        self._ids = itertools.count()
+        self._ids_lock = threading.Lock()
+
+    @property
+    def endpoint_uri(self) -> str:
+        raise NotImplementedError
+
+    def send(self, body: bytes, method: Optional[str] = None) -> Union[dict, list]:
+        """
+        Sends an already encoded request (or batch).
+        :param body: The encoded request.
+        :param method: The -optional- method of the request, if known.
+        :return: The decoded response.
+        """
+
+        raise NotImplementedError
+
+    def _next_id(self) -> int:
+        with self._ids_lock:
+            return next(self._ids)
+
+    def _encode(self, method: str, params: Any) -> dict:
+        return {"jsonrpc": "2.0", "id": self._next_id(), "method": method, "params": params}
+
+    def request(self, method: str, params: Any) -> dict:
+        """
+        Sends a request.
+        :param method: The method.
+        :param params: The (JSON-serializable) parameters.
+        :return: The whole response (with either a result or an error).
+        """
+
+        return self.send(json.dumps(self._encode(method, params), separators=(",", ":")).encode(), method)
+
+    def call(self, method: str, params: Any) -> Any:
+        """
+        Sends a request, and tells its result.
+        :param method: The method.
+        :param params: The (JSON-serializable) parameters.
+        :return: The result.
+        """
+
+        return self._result(self.request(method, params))
+
+    @staticmethod
+    def _result(response: dict) -> Any:
+        error = response.get("error")
+        if error is not None:
+            if isinstance(error, dict):
+                raise JsonRpcError(error.get("code"), error.get("message", ""), error.get("data"))
+            raise JsonRpcError(None, str(error))
+        return response.get("result")
+
+    def batch(self, requests_: List[Tuple[str, Any]]) -> List[dict]:
+        """
+        Sends many requests in a single batch.
+        :param requests_: The (method, parameters) requests.
+        :return: The whole responses, in the same order of the requests
+          (a missing response is told as an error).
+        :raise JsonRpcError: If the node does not support batches.
+        """
+
+        if not requests_:
+            return []
+        encoded = [self._encode(method, params) for method, params in requests_]
+        methods = {method for method, _ in requests_}
+        responses = self.send(json.dumps(encoded, separators=(",", ":")).encode(),
+                              methods.pop() if len(methods) == 1 else None)
+        if not isinstance(responses, list):
+            # Nodes not supporting batches answer with a single error.
+            self._result(responses)
+            raise JsonRpcError(None, "The node does not support batches")
+        by_id = {response.get("id"): response for response in responses if isinstance(response, dict)}
+        return [by_id.get(request["id"]) or {"error": {"code": None, "message": "Missing response"}}
+                for request in encoded]
+
+    def block_number(self) -> int:
+        """
+        Gets the current block number.
+        :return: The block number.
+        """
+
+        return int(self.call("eth_blockNumber", []), 16)
+
+    def get_logs(self, log_filter: dict) -> List[LogRecord]:
+        """
+        Gets the logs matching a filter.
+        :param log_filter: The filter, like web3's (block numbers may be integers).
+        :return: The logs, as records.
+        """
+
+        params = dict(log_filter)
+        for key in ("fromBlock", "toBlock"):
+            if isinstance(params.get(key), int):
+                params[key] = hex(params[key])
+        return [
+            LogRecord(int(log["blockNumber"], 16), int(log["transactionIndex"], 16), int(log["logIndex"], 16),
+                      bytes.fromhex("".join(topic[2:] for topic in log["topics"])), bytes.fromhex(log["data"][2:]))
+            for log in self.call("eth_getLogs", [params])
+        ]
+
+    def eth_call(self, to: str, data: str, block_identifier: Union[int, str] = "latest") -> bytes:
+        """
+        Runs a read-only call.
+        :param to: The address of the contract.
+        :param data: The hex-encoded call data.
+        :param block_identifier: The block to run the call at.
+        :return: The returned data.
+        """
+
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+        return bytes.fromhex(self.call("eth_call", [{"to": to, "data": data}, block_identifier])[2:])
+
+
+class JsonRpcClient(BaseJsonRpcClient):
+    """
+    A lean JSON-RPC client over HTTP, talking to a single node.
+    Connections are kept alive in a pool, responses may come gzip
+    compressed, and transient failures (connection errors, time outs
+    and 429 / 502 / 503 / 504 responses) are retried with a full
+    jitter exponential backoff.
+    """
+
+    TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, endpoint_uri: str, pool_size: int = 10, timeout: float = 30.0, retries: int = 3,
+                 backoff_base: float = 0.25, backoff_max: float = 5.0):
+        """
+        Creates the client.
+        :param endpoint_uri: The URL of the node.
+        :param pool_size: How many connections are kept alive.
+        :param timeout: The timeout, in seconds, of each request.
+        :param retries: How many times a request is retried after a
+          transient failure.
+        :param backoff_base: The maximum delay, in seconds, before the
+          first retry. It doubles for each retry.
+        :param backoff_max: The maximum delay, in seconds, before a retry.
+        """
+
+        super().__init__()
+        self._endpoint_uri = endpoint_uri
+        self._timeout = timeout
+        self._retries = max(0, retries)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+    @property
+    def endpoint_uri(self):
+        return self._endpoint_uri
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        """
+        Computes the delay before a retry: a random one up to the
+        (exponentially growing) backoff, or the one the node tells.
+        """
+
+        delay = random.uniform(0, min(self._backoff_max, self._backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(self._backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def send(self, body: bytes, method: Optional[str] = None) -> Union[dict, list]:
+        """
+        Sends an already encoded request (or batch), retrying it on
+        transient failures.
+        :param body: The encoded request.
+        :param method: The -optional- method of the request, if known.
+        :return: The decoded response.
+        """
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = self._session.post(self._endpoint_uri, data=body, timeout=self._timeout)
+                if response.status_code not in self.TRANSIENT_STATUSES:
+                    response.raise_for_status()
+                    return json.loads(response.content)
+                retry_after = response.headers.get("Retry-After")
+                error = requests.HTTPError(f"{response.status_code} from the node", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= self._retries:
+                raise error
+            delay = self._delay(attempt, retry_after)
+            LOGGER.warning(f"Retrying a JSON-RPC request in {delay:.2f}s after: {error}")
+            time.sleep(delay)
+            attempt += 1
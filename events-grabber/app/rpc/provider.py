@@ -0,0 +1,35 @@
+from typing import Any
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+from .client import BaseJsonRpcClient
+
+
+class LeanHTTPProvider(JSONBaseProvider):
+    """
+    A web3 provider sending its requests through a lean client, so
+    web3 and the hot calls issued directly through the client share
+    the same pool of connections and retry policy.
+    """
+
+    def __init__(self, client: BaseJsonRpcClient):
+        """
+        Creates the provider.
+        :param client: The client to send the requests through.
+        """
+
+        super().__init__()
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def endpoint_uri(self):
+        return self._client.endpoint_uri
+
+    def __str__(self):
+        return f"LeanHTTPProvider({self._client.endpoint_uri})"
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self._client.send(self.encode_rpc_request(method, params), method)
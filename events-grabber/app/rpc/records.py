@@ -0,0 +1,59 @@
+from typing import Union
+
+
+def _to_bytes(value: Union[bytes, str]) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value) if isinstance(value, str) else bytes(value)
+
+
+class LogRecord:
+    """
+    A compact raw log: only what the handlers need of it (its position
+    in the chain, topics and data), with no dict nor AttributeDict /
+    HexBytes wrapping. Logs are kept in this form, by the million while
+    catching up, between being fetched and being decoded.
+
+    The topics are kept concatenated (32 bytes each) in a single bytes
+    object, rather than one object per topic.
+    """
+
+    __slots__ = ("block_number", "transaction_index", "log_index", "topics", "data")
+
+    def __init__(self, block_number: int, transaction_index: int, log_index: int,
+                 topics: bytes, data: bytes):
+        self.block_number = block_number
+        self.transaction_index = transaction_index
+        self.log_index = log_index
+        self.topics = topics
+        self.data = data
+
+    @classmethod
+    def from_log(cls, log: dict) -> "LogRecord":
+        """
+        Makes a record out of a log like the ones of web3's get_logs.
+        :param log: The log.
+        :return: The record.
+        """
+
+        return cls(log["blockNumber"], log["transactionIndex"], log["logIndex"],
+                   b"".join(_to_bytes(topic) for topic in log["topics"]), _to_bytes(log["data"]))
+
+    @property
+    def topic_count(self) -> int:
+        return len(self.topics) // 32
+
+    def topic(self, index: int) -> bytes:
+        """
+        Gets a topic.
+        :param index: The index of the topic.
+        :return: The topic (32 bytes).
+        """
+
+        return self.topics[32 * index:32 * (index + 1)]
+
+    def __eq__(self, other):
+        return isinstance(other, LogRecord) and \
+            (self.block_number, self.transaction_index, self.log_index, self.topics, self.data) == \
+            (other.block_number, other.transaction_index, other.log_index, other.topics, other.data)
+
+    def __repr__(self):
+        return f"LogRecord({self.block_number}:{self.transaction_index}:{self.log_index})"
@@ -0,0 +1,365 @@
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional, Union
+import requests
+from .client import BaseJsonRpcClient, JsonRpcClient
+
+
+LOGGER = logging.getLogger("grabber:rpc-router")
+LOGGER.setLevel(logging.INFO)
+
+
+class _Endpoint:
+    """
+    An endpoint and what's observed about it: the (smoothed) latency
+    and error rate of its requests, how many requests it is serving,
+    and its head.
+    """
+
+    # The weight of each new observation in the smoothed figures.
+    ALPHA = 0.2
+    # How much each unit of error rate multiplies the latency.
+    ERROR_PENALTY = 10.0
+
+    def __init__(self, client: JsonRpcClient):
+        self.client = client
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.head = None
+
+    def score(self) -> float:
+        """
+        The lower, the better. Endpoints with no observed latency yet
+        score best (so they get tried) unless they failed.
+        """
+
+        latency = self.latency if self.latency is not None else (1.0 if self.error_rate else 0.0)
+        return latency * (1 + self.in_flight) * (1 + self.ERROR_PENALTY * self.error_rate)
+
+    def observe(self, latency: Optional[float]):
+        """
+        Records the outcome of a request.
+        :param latency: The latency, in seconds, or None if it failed.
+        """
+
+        if latency is None:
+            self.error_rate += self.ALPHA * (1 - self.error_rate)
+        else:
+            self.error_rate -= self.ALPHA * self.error_rate
+            self.latency = latency if self.latency is None else self.latency + self.ALPHA * (latency - self.latency)
+
+    def recover(self):
+        """
+        Records a successful health check, which lowers the error rate
+        (so endpoints that are not picked because of failing can still
+        be picked again).
+        """
+
+        self.error_rate -= self.ALPHA * self.error_rate
+
+
+class RoutedJsonRpcClient(BaseJsonRpcClient):
+    """
+    A JSON-RPC client spreading the requests among many endpoints
+    (i.e. nodes of the same chain). Each request goes to the best of
+    two random endpoints, scored by their observed latency, error rate
+    and requests in flight. A request failing in an endpoint is sent
+    to another one, and once all of them failed the whole round is
+    retried after a full jitter exponential backoff. Endpoints whose
+    head lags too far behind the best known head are skipped (unless
+    all of them lag). Requests bounded to a block (e.g. eth_getLogs up
+    to a block, or eth_call at a block) only go to endpoints known to
+    have reached it, since lagging nodes may silently answer with less
+    (e.g. only the logs up to their own head). The heads are refreshed
+    in the background, and asking for them also tells whether failing
+    endpoints got healthy again.
+
+    Slow requests of the hedged methods (e.g. eth_getLogs, eth_call)
+    are hedged: once a request takes longer than a percentile of the
+    latencies observed for its method, it's also sent to another
+    endpoint, and the first response wins.
+    """
+
+    HEDGED_METHODS = ("eth_getLogs", "eth_call")
+    # The methods whose requests may be bounded to a block, by the
+    # index of the parameter holding it (and, for filters, its key).
+    BLOCK_BOUNDED_METHODS = {
+        "eth_getLogs": (0, "toBlock"),
+        "eth_call": (1, None),
+        "eth_getCode": (1, None),
+        "eth_getBalance": (1, None),
+        "eth_getBlockByNumber": (0, None),
+    }
+    # How many latencies are kept, per method, to tell the percentile,
+    # and how many are needed before hedging.
+    LATENCY_SAMPLES = 200
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(self, clients: List[JsonRpcClient], hedge_percentile: float = 0.9, max_lag: int = 3,
+                 head_interval: float = 5.0, retries: int = 3, backoff_base: float = 0.25, backoff_max: float = 5.0):
+        """
+        Creates the client.
+        :param clients: The clients of each endpoint.
+        :param hedge_percentile: The percentile (0 to 1) of the latencies
+          a request may take before being hedged. 0 disables hedging.
+        :param max_lag: How many blocks an endpoint may lag behind the best
+          known head before being skipped.
+        :param head_interval: How many seconds the heads of the endpoints
+          are trusted before asking them again.
+        :param retries: How many times a request is retried after failing
+          in all the endpoints.
+        :param backoff_base: The maximum delay, in seconds, before the first
+          retry. It doubles for each retry.
+        :param backoff_max: The maximum delay, in seconds, before a retry.
+        """
+
+        super().__init__()
+        self._endpoints = [_Endpoint(client) for client in clients]
+        self._hedge_percentile = hedge_percentile
+        self._max_lag = max_lag
+        self._head_interval = head_interval
+        self._retries = max(0, retries)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._heads_at = None
+        self._heads_lock = threading.Lock()
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._executor = ThreadPoolExecutor(max(16, 8 * len(clients)), thread_name_prefix="rpc-router")
+
+    @property
+    def endpoint_uri(self):
+        return ",".join(endpoint.client.endpoint_uri for endpoint in self._endpoints)
+
+    def _refresh_heads(self):
+        """
+        Asks every endpoint for its head. Only one thread does it at
+        once: the others wait for it.
+        """
+
+        with self._heads_lock:
+            futures = {self._executor.submit(endpoint.client.block_number): endpoint
+                       for endpoint in self._endpoints}
+            done, _ = wait(futures, timeout=self._head_interval)
+            for future in done:
+                endpoint = futures[future]
+                try:
+                    head = future.result()
+                except Exception as e:
+                    LOGGER.warning(f"Could not get the head of {endpoint.client.endpoint_uri}: {e}")
+                    with self._lock:
+                        endpoint.observe(None)
+                else:
+                    with self._lock:
+                        endpoint.head = head
+                        endpoint.recover()
+            self._heads_at = time.monotonic()
+
+    def _refresh_heads_soon(self):
+        """
+        Refreshes the heads in the background, if they're too old. The
+        requests go on with the known heads meanwhile.
+        """
+
+        with self._lock:
+            if self._refreshing or (self._heads_at is not None and
+                                    time.monotonic() - self._heads_at < self._head_interval):
+                return
+            self._refreshing = True
+        self._executor.submit(self._refresh_heads_in_background)
+
+    def _refresh_heads_in_background(self):
+        try:
+            self._refresh_heads()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    @classmethod
+    def _required_block(cls, body: bytes, method: Optional[str]) -> Optional[int]:
+        """
+        Tells the block a request (or batch) is bounded to, if any: an
+        endpoint must have reached it to answer the request in full.
+        :param body: The encoded request.
+        :param method: The -optional- method of the request, if known.
+        :return: The block, or None.
+        """
+
+        if method is not None and method not in cls.BLOCK_BOUNDED_METHODS:
+            return None
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        blocks = []
+        for request in payload if isinstance(payload, list) else [payload]:
+            bound = cls.BLOCK_BOUNDED_METHODS.get(request.get("method")) if isinstance(request, dict) else None
+            params = request.get("params") if bound else None
+            if not isinstance(params, list) or len(params) <= bound[0]:
+                continue
+            value = params[bound[0]]
+            if bound[1] is not None:
+                value = value.get(bound[1]) if isinstance(value, dict) else None
+            if isinstance(value, str) and value.startswith("0x"):
+                blocks.append(int(value, 16))
+        return max(blocks, default=None)
+
+    def _reached(self, block: Optional[int]) -> bool:
+        """
+        Tells whether any endpoint is known to have reached a block.
+        """
+
+        with self._lock:
+            return block is None or any(endpoint.head is not None and endpoint.head >= block
+                                        for endpoint in self._endpoints)
+
+    def _candidates(self, excluded: list, block: Optional[int]) -> List[_Endpoint]:
+        """
+        Tells the endpoints a request may go to: the ones not lagging
+        behind (nor already tried) and, if the request is bounded to a
+        block, the ones known to have reached it.
+        """
+
+        endpoints = [endpoint for endpoint in self._endpoints if endpoint not in excluded]
+        if block is not None:
+            endpoints = [endpoint for endpoint in endpoints if endpoint.head is not None and endpoint.head >= block]
+        heads = [endpoint.head for endpoint in endpoints if endpoint.head is not None]
+        if heads:
+            best_head = max(heads)
+            synced = [endpoint for endpoint in endpoints
+                      if endpoint.head is not None and endpoint.head >= best_head - self._max_lag]
+            if synced:
+                return synced
+        return endpoints
+
+    def _pick(self, excluded: list, block: Optional[int]) -> Optional[_Endpoint]:
+        """
+        Picks the best of two random candidates.
+        """
+
+        with self._lock:
+            candidates = self._candidates(excluded, block)
+            if not candidates:
+                return None
+            if len(candidates) > 1:
+                candidates = random.sample(candidates, 2)
+            endpoint = min(candidates, key=lambda candidate: candidate.score())
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _send_to(self, endpoint: _Endpoint, body: bytes, method: Optional[str]) -> Union[dict, list]:
+        """
+        Sends a request to a (picked) endpoint, and records how it went.
+        """
+
+        started = time.monotonic()
+        try:
+            response = endpoint.client.send(body, method)
+        except Exception:
+            with self._lock:
+                endpoint.in_flight -= 1
+                endpoint.observe(None)
+            raise
+        latency = time.monotonic() - started
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.observe(latency)
+            if method is not None:
+                self._latencies.setdefault(method, deque(maxlen=self.LATENCY_SAMPLES)).append(latency)
+            # The head an endpoint tells is the most recent one known.
+            if method == "eth_blockNumber" and isinstance(response, dict) and \
+                    isinstance(response.get("result"), str):
+                endpoint.head = max(endpoint.head or 0, int(response["result"], 16))
+        return response
+
+    def _hedge_delay(self, method: Optional[str]) -> Optional[float]:
+        """
+        Tells how long a request may take before being hedged.
+        :return: The delay, or None if the request is not hedged.
+        """
+
+        if method not in self.HEDGED_METHODS or self._hedge_percentile <= 0 or len(self._endpoints) < 2:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(method)
+            if not latencies or len(latencies) < self.MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(latencies)
+        return latencies[min(len(latencies) - 1, int(self._hedge_percentile * len(latencies)))]
+
+    def send(self, body: bytes, method: Optional[str] = None) -> Union[dict, list]:
+        """
+        Sends an already encoded request (or batch), to the best
+        endpoint. It's sent to another endpoint if it fails, or also
+        sent to another endpoint if it's slow and hedged.
+        :param body: The encoded request.
+        :param method: The -optional- method of the request, if known.
+        :return: The decoded response.
+        """
+
+        self._refresh_heads_soon()
+        block = self._required_block(body, method)
+        if not self._reached(block):
+            # The known heads may be too old (e.g. the block comes from
+            # a head just told by an endpoint): they're asked again.
+            self._refresh_heads()
+            if not self._reached(block):
+                raise requests.ConnectionError(f"No endpoint has reached block {block}")
+        hedge_delay = self._hedge_delay(method)
+        tried = []
+        error = None
+        rounds = 0
+
+        def next_endpoint() -> _Endpoint:
+            nonlocal tried, rounds
+            endpoint_ = self._pick(tried, block)
+            if endpoint_ is None:
+                if rounds >= self._retries or error is None:
+                    raise error or requests.ConnectionError("No endpoint is available")
+                delay = random.uniform(0, min(self._backoff_max, self._backoff_base * (2 ** rounds)))
+                LOGGER.warning(f"Retrying a JSON-RPC request in {delay:.2f}s after failing in all the endpoints")
+                time.sleep(delay)
+                tried, rounds = [], rounds + 1
+                endpoint_ = self._pick(tried, block)
+            tried.append(endpoint_)
+            return endpoint_
+
+        if hedge_delay is None:
+            while True:
+                endpoint = next_endpoint()
+                try:
+                    return self._send_to(endpoint, body, method)
+                except Exception as e:
+                    LOGGER.warning(f"Request failed in {endpoint.client.endpoint_uri}: {e}")
+                    error = e
+
+        pending = {}
+        while True:
+            if not pending:
+                endpoint = next_endpoint()
+                pending[self._executor.submit(self._send_to, endpoint, body, method)] = endpoint
+            timeout = hedge_delay if len(pending) == 1 and hedge_delay is not None else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    LOGGER.warning(f"Request failed in {endpoint.client.endpoint_uri}: {e}")
+                    error = e
+            if not done:
+                # The request is slow: it's also sent to another endpoint.
+                endpoint = self._pick(tried, block)
+                if endpoint is not None:
+                    LOGGER.info(f"Hedging a slow {method} request to {endpoint.client.endpoint_uri}")
+                    tried.append(endpoint)
+                    pending[self._executor.submit(self._send_to, endpoint, body, method)] = endpoint
+                else:
+                    hedge_delay = None
@@ -1,11 +1,27 @@
+import copy
+import time
 import logging
 import contextlib
-from typing import Optional
+from typing import Dict, Optional
+from eth_utils import encode_hex
 from web3 import Web3
+from web3.exceptions import BlockNotFound
 from pymongo import MongoClient
-from .prepare import make_indices
+from .prepare import make_indices, migrate_balances
 from handlers import make_handlers
-from contracts import get_contracts
+from handlers.archive import LogArchive
+from handlers.base import ContractEventHandlers, MetaverseRelatedContractEventHandler
+from handlers.journal import ReorgJournal
+from handlers.writes import WriteBuffer
+from metadata import MetadataFetcher, MetadataQueue, MetadataWorkers, MetadataHttpCache, HostPolicy, \
+    MetadataRefresher
+from contracts import Multicall, make_contracts
+from rpc import get_client
+from .contracts import ContractsResolver
+from .deployments import DeploymentBlocks
+from .checkpoints import HandlerCheckpoints
+from .backfill import iter_backfill
+from settings import GrabberSettings
 
 
 LOGGER = logging.getLogger("runner")
@@ -44,8 +60,113 @@ def run_in_context(client: MongoClient, use_transactions: bool):
             LOGGER.info("Context [with no transaction] ended")
 
 
+def get_start_blocks(client: MongoClient, db_name: str, web3: Web3, contracts: dict,
+                     settings: GrabberSettings) -> Dict[str, int]:
+    """
+    Gets the first block worth collecting events from, for each one
+    of the resolved contracts: the block it was deployed at, if the
+    discovery is enabled (see `DeploymentBlocks`).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param contracts: The resolved contracts.
+    :param settings: The grabber settings.
+    :return: A dictionary of (lowercase) address => start block.
+    """
+
+    if not settings.discover_deployments:
+        return {}
+    return DeploymentBlocks(client, db_name, web3).get(contract.address for contract in contracts.values())
+
+
+def make_all_handlers(client: MongoClient, db_name: str, contracts: dict,
+                      settings: GrabberSettings, session_kwargs: dict,
+                      start_blocks: Optional[Dict[str, int]] = None) -> ContractEventHandlers:
+    """
+    Makes all the handlers for the resolved contracts. When a log
+    archive is configured, the handlers fill it (and the addresses
+    of the contracts, and the blocks their archives must start at,
+    are stored in it).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param contracts: The resolved contracts.
+    :param settings: The grabber settings.
+    :param session_kwargs: The -optionally- MongoDB session.
+    :param start_blocks: The -optional- first block each handler collects
+      events from, by (lowercase) contract address (see `get_start_blocks`).
+    :return: The handlers.
+    """
+
+    handlers = make_handlers(
+        client, db_name, session_kwargs, contracts["metaverse"],
+        contracts["brand_registry"], contracts["economy"],
+        contracts["sponsor_registry"], contracts["currency_definition_plugin"],
+        contracts["currency_minting_plugin"], settings.chunking, settings.collection_mode,
+        settings.collection_workers, settings.write_buffer_size,
+        fetch_ahead=settings.pipeline_fetch_ahead, buffer_size=settings.pipeline_buffer_size
+    )
+    handlers.use_rpc(get_client(contracts["metaverse"].w3))
+    handlers.use_start_blocks(start_blocks or {})
+    if settings.log_archive_dir:
+        archive = LogArchive(settings.log_archive_dir)
+        if settings.collection_mode != "archive":
+            archive.save_contracts(contracts["metaverse"].address, {
+                key: contract.address for key, contract in contracts.items() if key != "metaverse"
+            })
+            # The archive is complete if it goes back to the first block
+            # each contract's events are collected from (a contract being
+            # archived since later, e.g. after enabling the archive on an
+            # existing database, can't be replayed).
+            archive.save_start_blocks({handler.contract.address: handler.start_block
+                                       for handler in handlers.handlers})
+        handlers.use_archive(archive)
+    return handlers
+
+
+def make_metadata_workers(client: MongoClient, db_name: str, contracts: dict,
+                          settings: GrabberSettings, multicall: Optional[Multicall] = None) -> MetadataWorkers:
+    """
+    Makes the pool of metadata workers (not started).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param contracts: The resolved contracts.
+    :param settings: The grabber settings.
+    :param multicall: The -optional- multicall to get many token URIs at once.
+    :return: The metadata workers.
+    """
+
+    db = client[db_name]
+    host_policy = HostPolicy(settings.metadata_host_concurrency, settings.metadata_breaker_failures,
+                             settings.metadata_breaker_reset)
+    fetcher = MetadataFetcher(contracts["metaverse"], MetadataHttpCache(db), host_policy,
+                              settings.metadata_connect_timeout, settings.metadata_read_timeout,
+                              multicall=multicall)
+    return MetadataWorkers(db, MetadataQueue(db, settings.metadata_lease), fetcher,
+                           MetaverseRelatedContractEventHandler.TOKENS_METADATA, settings.metadata_workers,
+                           claim_batch=settings.metadata_claim_batch)
+
+
+def make_metadata_refresher(client: MongoClient, db_name: str,
+                            settings: GrabberSettings) -> Optional[MetadataRefresher]:
+    """
+    Makes the refresher of broken metadata (not started).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param settings: The grabber settings.
+    :return: The refresher, or None if the refresh is disabled.
+    """
+
+    if settings.metadata_refresh_interval <= 0:
+        return None
+    db = client[db_name]
+    return MetadataRefresher(db, MetadataQueue(db, settings.metadata_lease),
+                             MetaverseRelatedContractEventHandler.TOKENS_METADATA,
+                             settings.metadata_refresh_interval, settings.metadata_refresh_rate,
+                             settings.metadata_refresh_base_delay, settings.metadata_refresh_max_delay)
+
+
 def run_all(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
-            metaverse_contract_address: str):
+            metaverse_contract_address: str, settings: Optional[GrabberSettings] = None):
     """
     Runs a whole cycle of events retrieval.
     :param client: The client to use.
@@ -53,27 +174,500 @@ def run_all(client: MongoClient, db_name: str, web3: Web3, use_transactions: boo
     :param web3: The Web3 client to use.
     :param use_transactions: Whether to use transactions or not.
     :param metaverse_contract_address: The address of the metaverse contract.
+    :param settings: The -optional- grabber settings.
     """
 
+    settings = settings or GrabberSettings()
+    started = time.monotonic()
     make_indices(client, db_name)
+    migrate_balances(client, db_name)
+    multicall = Multicall(web3, settings.multicall_address)
+    contracts = ContractsResolver(client, db_name, web3, metaverse_contract_address, multicall,
+                                  settings.contracts_verify_interval).get_contracts()
+    start_blocks = get_start_blocks(client, db_name, web3, contracts, settings)
+    handlers = make_all_handlers(client, db_name, contracts, settings, {}, start_blocks)
+    metadata_workers = make_metadata_workers(client, db_name, contracts, settings, multicall)
+    metadata_refresher = make_metadata_refresher(client, db_name, settings)
+    LOGGER.info(f"Prepared in {time.monotonic() - started:.2f}s")
+    # Metadata is downloaded while the events are processed, and
+    # whatever remains in the queue is downloaded before leaving.
+    # Broken metadata due for a refresh is enqueued once, as well.
+    metadata_workers.start()
+    if metadata_refresher:
+        metadata_refresher.start()
+    try:
+        run_backfill(client, db_name, web3, use_transactions, contracts, handlers, settings)
+        run_cycle(client, db_name, web3, use_transactions, handlers, settings)
+    finally:
+        if metadata_refresher:
+            metadata_refresher.stop()
+        metadata_workers.stop(drain=True)
+
+
+def run_reindex(client: MongoClient, db_name: str, use_transactions: bool,
+                metaverse_contract_address: str, settings: GrabberSettings):
+    """
+    Processes the events stored in the log archive, with no network
+    access at all, since the last processed block (typically, into
+    an empty database) and up to the last archived block. Metadata
+    requests are just enqueued, to be downloaded by the grabber.
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param metaverse_contract_address: The address of the metaverse contract.
+    :param settings: The grabber settings (the log archive directory is mandatory).
+    """
+
+    if not settings.log_archive_dir:
+        raise ValueError("No log archive directory is configured")
+    started = time.monotonic()
+    archive = LogArchive(settings.log_archive_dir)
+    addresses = archive.load_contracts(metaverse_contract_address)
+    if addresses is None:
+        raise ValueError(f"The log archive has no contracts for the metaverse: {metaverse_contract_address}")
+    settings = copy.copy(settings)
+    settings.collection_mode = "archive"
+    settings.reorg_depth = 0
+    make_indices(client, db_name)
+    migrate_balances(client, db_name)
+    # The Web3 client has no provider: it's only used to build the
+    # contracts (i.e. their ABIs).
+    web3 = Web3()
+    contracts = make_contracts(web3, metaverse_contract_address, addresses)
+    last_blocks = [archive.last_block(contract.address) for contract in contracts.values()]
+    if any(last_block is None for last_block in last_blocks):
+        raise ValueError("The log archive lacks the logs of some contracts")
+    # Each contract is replayed since the block its archive must start
+    # at (e.g. its deployment block), which must be archived.
+    start_blocks = {}
+    stored_start_blocks = archive.load_start_blocks()
+    for contract in contracts.values():
+        address = contract.address.lower()
+        first_block = archive.first_block(address)
+        start_block = stored_start_blocks.get(address)
+        if start_block is None:
+            LOGGER.warning(f"The log archive does not tell where the archive of {address} must start: it's "
+                           f"replayed since its first archived block ({first_block}), which may be incomplete")
+            start_block = first_block
+        elif first_block > start_block:
+            raise ValueError(f"The log archive of {address} starts at block {first_block}, but its events are "
+                             f"collected since block {start_block}: the archive is incomplete")
+        start_blocks[address] = start_block
+    handlers = make_all_handlers(client, db_name, contracts, settings, {}, start_blocks)
+    end_block = min(last_blocks)
+    LOGGER.info(f"Prepared in {time.monotonic() - started:.2f}s. Replaying the archive up to block {end_block}")
+    run_cycle(client, db_name, web3, use_transactions, handlers, settings, end_block)
+    LOGGER.info(f"Reindexed in {time.monotonic() - started:.2f}s")
+
+
+def run_cycle(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+              handlers: ContractEventHandlers, settings: GrabberSettings, end_block: Optional[int] = None) -> bool:
+    """
+    Processes all the events since the last processed block and
+    up to the given end block (or the current head). The range is
+    processed in chunks bounded by the checkpoint settings, each one
+    in its own context and advancing the last processed block, so a
+    failure only loses the current chunk and a later run resumes from
+    the last committed one.
+
+    When a reorg depth is set, the blocks that close to the head are
+    processed one chunk per block, journaling how to undo their writes.
+    Before processing, reorganized blocks are rolled back.
+
+    Only the handlers whose checkpoint is the last processed block move
+    along with it. The lagging ones (e.g. new or reset handlers) catch
+    up on their own first (see `_catch_up`).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param handlers: The handlers to use.
+    :param settings: The grabber settings.
+    :param end_block: The -optional- end block. By default, the current head.
+    :return: Whether any block was processed (or rolled back).
+    """
+
+    rolled_back = settings.reorg_depth > 0 and _rollback_reorgs(client, db_name, web3, use_transactions, handlers)
+    checkpoints = HandlerCheckpoints(client, db_name)
+    last_block = _get_last_processed_block_number(client, db_name, {})
     with run_in_context(client, use_transactions) as session_kwargs:
-        last_block = _get_last_processed_block_number(client, db_name, session_kwargs)
-        start_block = 0 if last_block is None else last_block + 1
-        # Also get the end block.
+        if last_block is not None:
+            checkpoints.migrate(session_kwargs, handlers.handlers, last_block)
+        reset = checkpoints.apply_resets(session_kwargs, handlers.handlers)
+    if last_block is None:
+        caught_up = False
+        start_block = handlers.start_block
+    else:
+        caught_up = _catch_up(client, db_name, web3, use_transactions, handlers, checkpoints, settings, last_block)
+        positions = checkpoints.positions(handlers.handlers, last_block)
+        handlers = handlers.subset(handler for handler in handlers.handlers
+                                   if positions[checkpoints.key(handler)] == last_block)
+        start_block = last_block + 1
+    # Also get the end block.
+    if end_block is None:
         end_block = web3.eth.block_number
+    if start_block > end_block or not handlers.handlers:
+        LOGGER.info(f"No new blocks to process (last processed block: {last_block})")
+        return rolled_back or caught_up or bool(reset)
+    # The last block that can't be reorganized (if reorgs are
+    # taken into account).
+    safe_block = end_block - settings.reorg_depth if settings.reorg_depth > 0 else end_block
+
+    # The blocks that can't be reorganized go through a single
+    # pipeline: the next chunks are fetched while each one is being
+    # processed and committed.
+    if start_block <= safe_block:
+        start_block = _process_range(client, db_name, use_transactions, handlers, checkpoints, settings,
+                                     start_block, safe_block, True) + 1
+    if start_block <= end_block:
+        _process_journaled_range(client, db_name, web3, use_transactions, handlers, checkpoints, settings,
+                                 start_block, end_block)
+    return True
+
+
+def _process_journaled_range(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+                             handlers: ContractEventHandlers, checkpoints: HandlerCheckpoints,
+                             settings: GrabberSettings, start_block: int, end_block: int):
+    """
+    Processes a range of blocks that might still be reorganized through
+    a single pipeline, one chunk per block. Each block is committed in
+    its own context, along with the journal telling how to undo it, the
+    last processed block and the checkpoints of the handlers.
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param handlers: The handlers to use (all of them in lockstep).
+    :param checkpoints: The checkpoints of the handlers.
+    :param settings: The grabber settings.
+    :param start_block: The start block index.
+    :param end_block: The end block index (both inclusive).
+    """
+
+    # The hashes are taken before the logs: if a block is reorganized
+    # meanwhile, the next cycle will tell.
+    block_hashes = [_get_block_hash(web3, block) for block in range(start_block, end_block + 1)]
+    db = client[db_name]
+    pipeline = handlers.open_pipeline(start_block, end_block)
+    try:
+        for block, block_hash in enumerate(block_hashes, start_block):
+            journal = ReorgJournal(block)
+            with run_in_context(client, use_transactions) as session_kwargs:
+                handlers.use_session(session_kwargs)
+                handlers.use_journal(journal)
+                pipeline.process(block)
+                handlers.flush()
+                handlers.use_journal(None)
+                journal.commit(db, session_kwargs, block, block_hash)
+                ReorgJournal.prune(db, session_kwargs, end_block - settings.reorg_depth)
+
+                # Set the new last block.
+                _set_last_processed_block(client, db_name, session_kwargs, block)
+                checkpoints.set(session_kwargs, handlers.handlers, block)
+            LOGGER.info(f"Checkpoint: {block} (target: {end_block})")
+    finally:
+        pipeline.close()
+
+
+def _process_range(client: MongoClient, db_name: str, use_transactions: bool, handlers: ContractEventHandlers,
+                   checkpoints: HandlerCheckpoints, settings: GrabberSettings, start_block: int, end_block: int,
+                   advance_last_block: bool) -> int:
+    """
+    Processes a range of blocks that can't be reorganized through a
+    single pipeline, in chunks bounded by the checkpoint settings. Each
+    chunk is committed in its own context, along with the checkpoints
+    of the handlers (and, perhaps, the last processed block).
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param handlers: The handlers to use.
+    :param checkpoints: The checkpoints of the handlers.
+    :param settings: The grabber settings.
+    :param start_block: The start block index.
+    :param end_block: The end block index (both inclusive).
+    :param advance_last_block: Whether to move the last processed block
+      as well (i.e. whether these are all the handlers in lockstep).
+    :return: The last processed block (i.e. the end block).
+    """
+
+    pipeline = handlers.open_pipeline(start_block, end_block)
+    try:
+        while start_block <= end_block:
+            chunk_end_block = end_block
+            if settings.checkpoint_blocks > 0:
+                chunk_end_block = min(end_block, start_block + settings.checkpoint_blocks - 1)
+            with run_in_context(client, use_transactions) as session_kwargs:
+                handlers.use_session(session_kwargs)
+                # Process the events between start and end block,
+                # both limits inclusive. The processing may stop
+                # earlier, at a block boundary, if too many events
+                # were processed.
+                processed_block = pipeline.process(chunk_end_block, settings.checkpoint_events)
+                handlers.flush()
+
+                # Set the new last block.
+                if advance_last_block:
+                    _set_last_processed_block(client, db_name, session_kwargs, processed_block)
+                checkpoints.set(session_kwargs, handlers.handlers, processed_block)
+            LOGGER.info(f"Checkpoint: {processed_block} (target: {end_block})")
+            start_block = processed_block + 1
+    finally:
+        pipeline.close()
+    return end_block
+
+
+def _catch_up(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+              handlers: ContractEventHandlers, checkpoints: HandlerCheckpoints, settings: GrabberSettings,
+              last_block: int) -> bool:
+    """
+    Processes the handlers lagging behind the last processed block on
+    their own, until they reach it. The ones with the lowest checkpoint
+    go first, up to the next lagging ones, which they join. The blocks
+    still in the reorg journal are processed entry by entry, appending
+    the writes to each entry. Up to `catch_up_blocks` blocks are caught
+    up per cycle, so the other handlers keep following the head.
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param handlers: The handlers to use.
+    :param checkpoints: The checkpoints of the handlers.
+    :param settings: The grabber settings.
+    :param last_block: The last processed block.
+    :return: Whether any block was processed.
+    """
+
+    db = client[db_name]
+    entries = sorted(ReorgJournal.entries(db), key=lambda entry: entry["from_block"])
+    remaining = settings.catch_up_blocks if settings.catch_up_blocks > 0 else None
+    processed = False
+    while remaining is None or remaining > 0:
+        positions = checkpoints.positions(handlers.handlers, last_block)
+        lagging = sorted({position for position in positions.values() if position < last_block})
+        if not lagging:
+            break
+        group = handlers.subset(handler for handler in handlers.handlers
+                                if positions[checkpoints.key(handler)] == lagging[0])
+        start_block = lagging[0] + 1
+        end_block = lagging[1] if len(lagging) > 1 else last_block
+        if remaining is not None:
+            end_block = min(end_block, start_block + remaining - 1)
+        LOGGER.info(f"Catching up {', '.join(sorted({handler.name for handler in group.handlers}))} "
+                    f"in range: {start_block}:{end_block}")
+        entry = next((entry for entry in entries if entry["to_block"] >= start_block), None)
+        if entry is None or start_block < entry["from_block"]:
+            if entry is not None:
+                end_block = min(end_block, entry["from_block"] - 1)
+            end_block = _process_range(client, db_name, use_transactions, group, checkpoints, settings,
+                                       start_block, end_block, False)
+        else:
+            # The journaled blocks are appended to their entries, so
+            # they're rolled back along with them. An entry whose
+            # block was reorganized is left for the next cycle.
+            try:
+                block_hash = _get_block_hash(web3, entry["to_block"])
+            except BlockNotFound:
+                block_hash = None
+            if block_hash != entry["block_hash"]:
+                LOGGER.warning(f"The block {entry['to_block']} was reorganized: catching up later")
+                break
+            end_block = min(end_block, entry["to_block"])
+            journal = ReorgJournal(start_block)
+            with run_in_context(client, use_transactions) as session_kwargs:
+                group.use_session(session_kwargs)
+                group.use_journal(journal)
+                group.process_events(start_block, end_block)
+                group.flush()
+                group.use_journal(None)
+                journal.append_to(db, session_kwargs, entry["to_block"])
+                checkpoints.set(session_kwargs, group.handlers, end_block)
+        processed = True
+        if remaining is not None:
+            remaining -= end_block - start_block + 1
+    return processed
+
+
+def run_backfill(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+                 contracts: dict, handlers: ContractEventHandlers, settings: GrabberSettings,
+                 end_block: Optional[int] = None) -> bool:
+    """
+    Catches up with the chain by processing the blocks since the last
+    processed block in parallel processes (see `iter_backfill`), when
+    enabled and worth it (i.e. more than one shard per process). Each
+    merged group of shards is sent in its own context, advancing the
+    last processed block. The blocks that may still be reorganized
+    are left for `run_cycle`, and so are the lagging handlers.
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param contracts: The resolved contracts.
+    :param handlers: The handlers (see `make_all_handlers`).
+    :param settings: The grabber settings.
+    :param end_block: The -optional- end block. By default, the current head.
+    :return: Whether any block was processed.
+    """
+
+    if settings.backfill_processes <= 1:
+        return False
+    checkpoints = HandlerCheckpoints(client, db_name)
+    last_block = _get_last_processed_block_number(client, db_name, {})
+    if last_block is None:
+        start_block = handlers.start_block
+    else:
+        start_block = last_block + 1
+        with run_in_context(client, use_transactions) as session_kwargs:
+            checkpoints.migrate(session_kwargs, handlers.handlers, last_block)
+        positions = checkpoints.positions(handlers.handlers, last_block)
+        handlers = handlers.subset(handler for handler in handlers.handlers
+                                   if positions[checkpoints.key(handler)] == last_block)
+    keys = [checkpoints.key(handler) for handler in handlers.handlers]
+    if end_block is None:
+        end_block = web3.eth.block_number
+    end_block -= max(0, settings.reorg_depth)
+    if not keys or end_block - start_block + 1 <= settings.backfill_processes * settings.backfill_shard_blocks:
+        return False
+
+    start_blocks = {handler.contract.address.lower(): handler.start_block for handler in handlers.handlers}
+    started = time.monotonic()
+    for group_end_block, recorded in iter_backfill(web3, contracts, settings, start_block, end_block,
+                                                   start_blocks, keys):
+        with run_in_context(client, use_transactions) as session_kwargs:
+            write_buffer = WriteBuffer(client[db_name], settings.write_buffer_size)
+            write_buffer.use_session(session_kwargs)
+            recorded.replay(write_buffer)
+            write_buffer.flush()
+            _set_last_processed_block(client, db_name, session_kwargs, group_end_block)
+            checkpoints.set(session_kwargs, handlers.handlers, group_end_block)
+        LOGGER.info(f"Backfill checkpoint: {group_end_block} (target: {end_block})")
+    LOGGER.info(f"Backfilled blocks {start_block}:{end_block} in {time.monotonic() - started:.2f}s")
+    return True
+
+
+def _get_block_hash(web3: Web3, block_number: int) -> Optional[str]:
+    """
+    Gets the hash of a block.
+    :param web3: The Web3 client to use.
+    :param block_number: The block number.
+    :return: The hash (hex-encoded), or None if the block is not there.
+    """
+
+    block = web3.eth.get_block(block_number)
+    return encode_hex(bytes(block["hash"])) if block else None
+
+
+def _rollback_reorgs(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+                     handlers: ContractEventHandlers) -> bool:
+    """
+    Tells whether the journaled blocks were reorganized and, if so,
+    rolls back the journal entries, newest first, until the one whose
+    last block is still in the chain (i.e. the fork point). Each entry
+    is rolled back in its own context, along with moving the last
+    processed block back. If no entry is still in the chain, the fork
+    point is not known (the blocks before the journal may be stale as
+    well), so the handlers are rebuilt from scratch.
+    :param client: The MongoDB client.
+    :param db_name: The database name.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param handlers: The handlers to rebuild, if needed.
+    :return: Whether any entry was rolled back.
+    """
+
+    db = client[db_name]
+    entries = ReorgJournal.entries(db)
+    reorganized = []
+    for entry in entries:
+        try:
+            block_hash = _get_block_hash(web3, entry["to_block"])
+        except BlockNotFound:
+            block_hash = None
+        if block_hash == entry["block_hash"]:
+            break
+        reorganized.append(entry)
+    if not reorganized:
+        return False
+    checkpoints = HandlerCheckpoints(client, db_name)
+    if len(reorganized) == len(entries):
+        # The requests are stored before rolling back, so they are
+        # not lost if the grabber stops meanwhile.
+        LOGGER.error(f"The reorg is deeper than the journal: blocks before {entries[-1]['from_block']} "
+                     f"may hold stale data, so the handlers will be rebuilt")
+        for handler_name in sorted({handler.name for handler in handlers.handlers}):
+            checkpoints.request_reset(handler_name)
+    for entry in reorganized:
+        with run_in_context(client, use_transactions) as session_kwargs:
+            ReorgJournal.rollback(db, session_kwargs, entry)
+            _set_last_processed_block(client, db_name, session_kwargs, entry["from_block"] - 1)
+            checkpoints.clamp(session_kwargs, entry["from_block"] - 1)
+    LOGGER.warning(f"Reorg detected: {len(reorganized)} blocks were rolled back")
+    return True
+
+
+def run_forever(client: MongoClient, db_name: str, web3: Web3, use_transactions: bool,
+                metaverse_contract_address: str, settings: GrabberSettings):
+    """
+    Keeps following the head of the chain, processing each new range
+    of blocks as soon as it appears. The indices, contracts and
+    handlers are prepared only once. The head is polled with an
+    interval that resets to its minimum when new blocks appear, and
+    doubles (up to its maximum) while no new blocks appear.
+    :param client: The client to use.
+    :param db_name: The name of the database to use.
+    :param web3: The Web3 client to use.
+    :param use_transactions: Whether to use transactions or not.
+    :param metaverse_contract_address: The address of the metaverse contract.
+    :param settings: The grabber settings.
+    """
+
+    started = time.monotonic()
+    make_indices(client, db_name)
+    migrate_balances(client, db_name)
+    multicall = Multicall(web3, settings.multicall_address)
+    resolver = ContractsResolver(client, db_name, web3, metaverse_contract_address, multicall,
+                                 settings.contracts_verify_interval)
+    contracts = resolver.get_contracts()
+    start_blocks = get_start_blocks(client, db_name, web3, contracts, settings)
+    handlers = make_all_handlers(client, db_name, contracts, settings, {}, start_blocks)
+    make_metadata_workers(client, db_name, contracts, settings, multicall).start()
+    metadata_refresher = make_metadata_refresher(client, db_name, settings)
+    if metadata_refresher:
+        metadata_refresher.start()
+    LOGGER.info(f"Prepared in {time.monotonic() - started:.2f}s")
+    run_backfill(client, db_name, web3, use_transactions, contracts, handlers, settings)
+    interval = settings.poll_min_interval
+    while True:
+        try:
+            # The handlers are made again if the contracts changed.
+            if resolver.due:
+                current_contracts = resolver.get_contracts()
+                if current_contracts is not contracts:
+                    contracts = current_contracts
+                    start_blocks = get_start_blocks(client, db_name, web3, contracts, settings)
+                    handlers = make_all_handlers(client, db_name, contracts, settings, {}, start_blocks)
+            head = web3.eth.block_number
+            last_block = _get_last_processed_block_number(client, db_name, {})
+            # With reorgs taken into account, the journaled blocks
+            # must be checked even if the head did not advance.
+            if last_block is None or head > last_block or settings.reorg_depth > 0:
+                if last_block is None or head > last_block:
+                    LOGGER.info(f"New head: {head} (last processed block: {last_block})")
+                if run_cycle(client, db_name, web3, use_transactions, handlers, settings, head):
+                    interval = settings.poll_min_interval
+                else:
+                    interval = min(settings.poll_max_interval, interval * 2)
+            else:
+                interval = min(settings.poll_max_interval, interval * 2)
+        except Exception as e:
+            LOGGER.exception(f"Error while following the head: {e}")
+            interval = min(settings.poll_max_interval, interval * 2)
+        time.sleep(interval)
 
-        # Process the events between start and end block,
-        # both limits inclusive.
-        contracts = get_contracts(web3, metaverse_contract_address)
-        make_handlers(
-            client, db_name, session_kwargs, contracts["metaverse"],
-            contracts["brand_registry"], contracts["economy"],
-            contracts["sponsor_registry"], contracts["currency_definition_plugin"],
-            contracts["currency_minting_plugin"]
-        ).process_events(start_block, end_block)
 
-        # Set the new last block.
-        _set_last_processed_block(client, db_name, session_kwargs, end_block)
+# The state collection holds other documents as well (e.g. the
+# resolved contract addresses), so the last block is looked up
+# by its own field.
+_LAST_BLOCK_KEY = {"last_block": {"$exists": True}}
 
 
 def _get_last_processed_block_number(client: MongoClient, db_name: str, session_kwargs: dict) -> Optional[int]:
@@ -86,7 +680,7 @@ def _get_last_processed_block_number(client: MongoClient, db_name: str, session_
     """
 
     collection = client[db_name]["state"]
-    record = collection.find_one(**session_kwargs)
+    record = collection.find_one(_LAST_BLOCK_KEY, **session_kwargs)
     if not record:
         return None
     last_block = record.get("last_block")
@@ -105,5 +699,5 @@ def _set_last_processed_block(client: MongoClient, db_name: str, session_kwargs:
     """
 
     collection = client[db_name]["state"]
-    collection.replace_one({}, {"last_block": str(block_number)},
+    collection.replace_one(_LAST_BLOCK_KEY, {"last_block": str(block_number)},
                            upsert=True, **session_kwargs)
@@ -0,0 +1,135 @@
+import logging
+import multiprocessing
+from collections import deque
+from typing import Dict, Iterator, List, Tuple
+from web3 import Web3
+from contracts import make_contracts
+from handlers import make_handlers
+from handlers.archive import LogArchive
+from handlers.writes import RecordingWriteBuffer, RecordedWrites
+from rpc import make_web3, get_client
+from settings import GrabberSettings
+from .checkpoints import HandlerCheckpoints
+
+
+LOGGER = logging.getLogger("grabber:backfill")
+LOGGER.setLevel(logging.INFO)
+
+
+# The handlers of the current worker process, and the buffer they
+# record their writes into.
+_worker = {}
+
+
+def _init_worker(endpoint_uri: str, contract_addresses: dict, settings: GrabberSettings,
+                 start_blocks: Dict[str, int], keys: List[str]):
+    """
+    Prepares a worker process: its own Web3 client, contracts and
+    handlers, which record their writes instead of sending them (and
+    fill their own segments of the log archive, if any). Only the
+    given handlers are kept.
+    :param endpoint_uri: The URL(s) of the EVM Gateway(s) to use.
+    :param contract_addresses: The addresses of the contracts, by key.
+    :param settings: The grabber settings.
+    :param start_blocks: The first block each contract's events are
+      collected from, by (lowercase) address.
+    :param keys: The checkpoint keys of the handlers to keep
+      (see `HandlerCheckpoints.key`).
+    """
+
+    logging.basicConfig()
+    web3 = make_web3(endpoint_uri, settings.rpc_pool_size, settings.rpc_timeout, settings.rpc_retries,
+                     settings.rpc_hedge_percentile, settings.rpc_max_lag, settings.rpc_head_interval)
+    contracts = make_contracts(web3, contract_addresses["metaverse"], contract_addresses)
+    write_buffer = RecordingWriteBuffer()
+    _worker["write_buffer"] = write_buffer
+    handlers = make_handlers(
+        None, None, {}, contracts["metaverse"],
+        contracts["brand_registry"], contracts["economy"],
+        contracts["sponsor_registry"], contracts["currency_definition_plugin"],
+        contracts["currency_minting_plugin"], settings.chunking, settings.collection_mode,
+        settings.collection_workers, write_buffer=write_buffer,
+        fetch_ahead=settings.pipeline_fetch_ahead, buffer_size=settings.pipeline_buffer_size
+    )
+    _worker["handlers"] = handlers.subset(handler for handler in handlers.handlers
+                                          if HandlerCheckpoints.key(handler) in keys)
+    _worker["handlers"].use_rpc(get_client(web3))
+    _worker["handlers"].use_start_blocks(start_blocks)
+    if settings.log_archive_dir:
+        _worker["handlers"].use_archive(LogArchive(settings.log_archive_dir))
+
+
+def _process_shard(shard: Tuple[int, int]) -> RecordedWrites:
+    """
+    Fetches, decodes and processes the events of a shard, in the
+    current worker process.
+    :param shard: The (start block, end block) of the shard.
+    :return: The recorded writes.
+    """
+
+    start_block, end_block = shard
+    write_buffer = _worker["write_buffer"]
+    for position, method, args, _ in _worker["handlers"].iter_events(start_block, end_block):
+        write_buffer.at(position)
+        method(*args)
+    return write_buffer.take()
+
+
+def iter_backfill(web3: Web3, contracts: dict, settings: GrabberSettings,
+                  start_block: int, end_block: int,
+                  start_blocks: Dict[str, int], keys: List[str]) -> Iterator[Tuple[int, RecordedWrites]]:
+    """
+    Processes a block range split in shards, in parallel worker
+    processes. Each shard is fetched, decoded and processed by its
+    own worker, and the shards finish in any order. As soon as a run
+    of consecutive shards (one per process) is done, their writes are
+    merged and yielded, so the caller can send them and move the last
+    processed block. The result is the same as processing the range
+    sequentially: balance deltas are summed, and the other writes are
+    ordered by the position of their events.
+    :param web3: The Web3 client in use (its endpoint is used by the workers).
+    :param contracts: The resolved contracts.
+    :param settings: The grabber settings.
+    :param start_block: The start block index.
+    :param end_block: The end block index (both inclusive).
+    :param start_blocks: The first block each contract's events are
+      collected from, by (lowercase) address.
+    :param keys: The checkpoint keys of the handlers to process
+      (see `HandlerCheckpoints.key`).
+    :return: An iterator of (last block, merged writes) tuples.
+    """
+
+    processes = settings.backfill_processes
+    shard_blocks = max(1, settings.backfill_shard_blocks)
+    shards = iter([(block, min(end_block, block + shard_blocks - 1))
+                   for block in range(start_block, end_block + 1, shard_blocks)])
+    contract_addresses = {key: contract.address for key, contract in contracts.items()}
+    LOGGER.info(f"Backfilling blocks {start_block}:{end_block} with {processes} processes")
+    # Spawned (not forked) processes: the parent has threads running
+    # (e.g. the metadata workers) and open connections.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, _init_worker, (web3.provider.endpoint_uri, contract_addresses, settings,
+                                                           start_blocks, keys)) as pool:
+        # Up to two shards per process are in flight, so the processes
+        # never idle while a group is sent, and the pending results
+        # stay bounded.
+        in_flight = deque()
+        group, group_size = None, 0
+        while True:
+            while len(in_flight) < 2 * processes:
+                shard = next(shards, None)
+                if shard is None:
+                    break
+                in_flight.append((shard, pool.apply_async(_process_shard, (shard,))))
+            if not in_flight:
+                break
+            (_, shard_end_block), result = in_flight.popleft()
+            recorded = result.get()
+            if group is None:
+                group = recorded
+            else:
+                group.merge(recorded)
+            group_size += 1
+            if group_size >= processes or not in_flight:
+                yield shard_end_block, group
+                group, group_size = None, 0
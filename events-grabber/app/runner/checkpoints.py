@@ -0,0 +1,154 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+from pymongo import MongoClient, UpdateOne
+from handlers.base import ContractEventHandler
+from handlers.journal import ReorgJournal
+
+
+LOGGER = logging.getLogger("grabber:checkpoints")
+LOGGER.setLevel(logging.INFO)
+
+
+class HandlerCheckpoints:
+    """
+    Tracks the last processed block of each handler (and contract) in
+    the `state` collection, keyed by `{handler name}:{contract address}`.
+    Handlers whose checkpoint is the global last processed block move
+    in lockstep. The others (e.g. new handlers, or handlers that were
+    reset) catch up on their own until they reach it.
+
+    Resetting a handler is requested by storing the request in the
+    `state` collection (see `request_reset`), and applied by the
+    grabber on its next cycle (see `apply_resets`).
+    """
+
+    STATE = "state"
+
+    def __init__(self, client: MongoClient, db_name: str):
+        """
+        Creates the instance.
+        :param client: The MongoDB client.
+        :param db_name: The database name.
+        """
+
+        self._db = client[db_name]
+        self._collection = self._db[self.STATE]
+
+    @staticmethod
+    def key(handler: ContractEventHandler) -> str:
+        """
+        Tells the key of a handler's checkpoint.
+        :param handler: The handler.
+        :return: The key.
+        """
+
+        return f"{handler.name}:{handler.contract.address.lower()}"
+
+    def migrate(self, session_kwargs: dict, handlers: Iterable[ContractEventHandler], last_block: int):
+        """
+        Puts all the handlers at the global last processed block, if
+        there are no checkpoints at all (i.e. they were not tracked
+        yet). Otherwise, the handlers would be told as new.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param handlers: The handlers.
+        :param last_block: The global last processed block.
+        """
+
+        if self._collection.find_one({"checkpoint_of": {"$exists": True}}, **session_kwargs) is None:
+            LOGGER.info(f"Tracking the handlers' checkpoints since block {last_block}")
+            self.set(session_kwargs, list(handlers), last_block)
+
+    def positions(self, handlers: Iterable[ContractEventHandler], last_block: int) -> Dict[str, int]:
+        """
+        Gets the last processed block of each handler. Handlers with no
+        checkpoint are new, and start before their start block.
+        :param handlers: The handlers.
+        :param last_block: The global last processed block.
+        :return: A dictionary of key => last processed block.
+        """
+
+        handlers = list(handlers)
+        keys = [self.key(handler) for handler in handlers]
+        records = {record["checkpoint_of"]: record
+                   for record in self._collection.find({"checkpoint_of": {"$in": keys}})}
+        return {key: min(last_block, records[key]["block"] if key in records else handler.start_block - 1)
+                for key, handler in zip(keys, handlers)}
+
+    def set(self, session_kwargs: dict, handlers: List[ContractEventHandler], block: int):
+        """
+        Sets the last processed block of some handlers.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param handlers: The handlers.
+        :param block: The last processed block.
+        """
+
+        if handlers:
+            self._collection.bulk_write([UpdateOne({"checkpoint_of": self.key(handler)}, {
+                "$set": {"handler": handler.name, "block": block}
+            }, upsert=True) for handler in handlers], **session_kwargs)
+
+    def clamp(self, session_kwargs: dict, block: int):
+        """
+        Moves back the checkpoints beyond a block (e.g. after rolling
+        back a reorg) to that block.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param block: The block.
+        """
+
+        self._collection.update_many({"checkpoint_of": {"$exists": True}, "block": {"$gt": block}},
+                                     {"$set": {"block": block}}, **session_kwargs)
+
+    def request_reset(self, handler_name: str, block: Optional[int] = None) -> bool:
+        """
+        Requests a handler to be reset, for all its contracts. The
+        request also applies to a handler that did not run yet.
+        :param handler_name: The name of the handler.
+        :param block: The block to process the handler again from. By
+          default (or if the handler can't replay its events), the
+          handler is rebuilt from scratch: its collections are cleared.
+        :return: Whether the handler has checkpoints already.
+        """
+
+        self._collection.replace_one({"reset_of": handler_name}, {"reset_of": handler_name, "block": block},
+                                     upsert=True)
+        return self._collection.find_one({"checkpoint_of": {"$exists": True}, "handler": handler_name}) is not None
+
+    def apply_resets(self, session_kwargs: dict, handlers: Iterable[ContractEventHandler]) -> List[str]:
+        """
+        Applies the requested resets of these handlers. Replayable
+        handlers reset to a block just move their checkpoints back.
+        Otherwise, the handler's collections are cleared (and their
+        records are removed from the reorg journal) and its checkpoint
+        moves back to its start block.
+        :param session_kwargs: The -optionally- MongoDB session.
+        :param handlers: The handlers.
+        :return: The keys of the handlers that were reset.
+        """
+
+        handlers = list(handlers)
+        names = sorted({handler.name for handler in handlers})
+        reset = []
+        for request in self._collection.find({"reset_of": {"$in": names}}, **session_kwargs):
+            for handler in handlers:
+                if handler.name != request["reset_of"]:
+                    continue
+                block = request.get("block")
+                if block is not None and not handler.REPLAYABLE:
+                    LOGGER.warning(f"The handler {handler.name} can't replay its events: it will be rebuilt instead")
+                    block = None
+                if block is None:
+                    collections = handler.get_collections()
+                    LOGGER.warning(f"Rebuilding the handler {handler.name}: clearing {', '.join(collections) or '-'}")
+                    for collection_name in collections:
+                        self._db[collection_name].delete_many({}, **session_kwargs)
+                    ReorgJournal.strip(self._db, session_kwargs, collections)
+                    block = handler.start_block
+                else:
+                    LOGGER.warning(f"Resetting the handler {handler.name} to block {block}")
+                key = self.key(handler)
+                record = self._collection.find_one({"checkpoint_of": key}, **session_kwargs)
+                block = max(handler.start_block, block) - 1
+                self.set(session_kwargs, [handler], block if record is None else min(record["block"], block))
+                reset.append(key)
+            self._collection.delete_one({"_id": request["_id"]}, **session_kwargs)
+        return reset
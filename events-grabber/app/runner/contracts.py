@@ -0,0 +1,107 @@
+import time
+import logging
+from typing import Optional
+from datetime import datetime, timezone, timedelta
+from web3 import Web3
+from pymongo import MongoClient
+from contracts import resolve_contract_addresses, make_contracts, Multicall
+
+
+LOGGER = logging.getLogger("grabber:contracts")
+LOGGER.setLevel(logging.INFO)
+
+
+class ContractsResolver:
+    """
+    Resolves the contracts related to a metaverse, persisting their
+    addresses (and the block they were resolved at) in the `state`
+    collection, keyed by the metaverse address. On startup, stored
+    addresses are reused as they are, so no call is needed before
+    fetching logs. The metaverse emits no event when an address is
+    changed, so they're resolved again once the verify interval
+    elapses since they were last verified.
+    """
+
+    STATE = "state"
+
+    def __init__(self, client: MongoClient, db_name: str, web3: Web3, metaverse_contract_address: str,
+                 multicall: Optional[Multicall] = None, verify_interval: float = 3600.0):
+        """
+        Creates the resolver.
+        :param client: The MongoDB client.
+        :param db_name: The database name.
+        :param web3: The Web3 client to use.
+        :param metaverse_contract_address: The address of the metaverse contract.
+        :param multicall: The -optional- multicall to resolve the addresses with.
+        :param verify_interval: How many seconds the resolved addresses are
+          trusted before resolving them again.
+        """
+
+        self._collection = client[db_name][self.STATE]
+        self._web3 = web3
+        self._metaverse_contract_address = metaverse_contract_address
+        self._key = {"contracts_for": metaverse_contract_address.lower()}
+        self._multicall = multicall
+        self._verify_interval = verify_interval
+        self._addresses = None
+        self._verified_at = None
+        self._contracts = None
+        self._contracts_addresses = None
+
+    def _load(self):
+        """
+        Loads the stored addresses, if any.
+        """
+
+        record = self._collection.find_one(self._key)
+        if record:
+            self._addresses = record["addresses"]
+            verified_at = record["verified_at"]
+            if verified_at.tzinfo is None:
+                verified_at = verified_at.replace(tzinfo=timezone.utc)
+            self._verified_at = verified_at
+            LOGGER.info(f"Using the contract addresses resolved at block {record['block']}")
+
+    def _verify(self):
+        """
+        Resolves the addresses again, and stores them.
+        """
+
+        block = self._web3.eth.block_number
+        addresses = resolve_contract_addresses(self._web3, self._metaverse_contract_address,
+                                               self._multicall, block)
+        if self._addresses is not None and addresses != self._addresses:
+            LOGGER.warning(f"The contract addresses changed at block {block}: {self._addresses} -> {addresses}")
+        self._addresses = addresses
+        self._verified_at = datetime.now(timezone.utc)
+        self._collection.replace_one(self._key, {
+            **self._key, "addresses": addresses, "block": block, "verified_at": self._verified_at
+        }, upsert=True)
+
+    @property
+    def due(self) -> bool:
+        """
+        Tells whether the addresses must be resolved again.
+        """
+
+        return self._verified_at is None or \
+            datetime.now(timezone.utc) - self._verified_at >= timedelta(seconds=self._verify_interval)
+
+    def get_contracts(self) -> dict:
+        """
+        Gets the contracts, resolving their addresses again if due.
+        The same contracts are returned while their addresses don't
+        change, so callers can tell a change by identity.
+        :return: The contracts.
+        """
+
+        if self._addresses is None:
+            self._load()
+        if self.due:
+            started = time.monotonic()
+            self._verify()
+            LOGGER.info(f"Contract addresses verified in {time.monotonic() - started:.2f}s")
+        if self._contracts is None or self._contracts_addresses != self._addresses:
+            self._contracts = make_contracts(self._web3, self._metaverse_contract_address, self._addresses)
+            self._contracts_addresses = self._addresses
+        return self._contracts
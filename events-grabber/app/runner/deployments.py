@@ -0,0 +1,98 @@
+import time
+import logging
+from typing import Dict, Iterable, Optional
+from web3 import Web3
+from pymongo import MongoClient
+
+
+LOGGER = logging.getLogger("grabber:deployments")
+LOGGER.setLevel(logging.INFO)
+
+
+def find_deployment_block(web3: Web3, address: str, head: int) -> Optional[int]:
+    """
+    Finds the block a contract was deployed at, by binary-searching
+    the first block where it has code. This requires the node to keep
+    the historical state (i.e. an archive node). The result is checked
+    by asking for the code right before and at the found block again.
+    :param web3: The Web3 client to use.
+    :param address: The address of the contract.
+    :param head: The current head.
+    :return: The block number, or None if the contract has no code at
+      the head (or the historical state is not available).
+    """
+
+    def has_code(block_number: int) -> bool:
+        return len(web3.eth.get_code(address, block_number)) > 0
+
+    try:
+        if not has_code(head):
+            LOGGER.warning(f"The contract {address} has no code at block {head}")
+            return None
+        low, high = 0, head
+        while low < high:
+            middle = (low + high) // 2
+            if has_code(middle):
+                high = middle
+            else:
+                low = middle + 1
+        # Nodes lacking the historical state may answer with no code,
+        # instead of failing: the code must be there at the found
+        # block, and the state before it must be served (and empty).
+        if low > 0 and (has_code(low - 1) or not has_code(low)):
+            LOGGER.warning(f"The node does not consistently serve the code of {address} around block {low}")
+            return None
+        return low
+    except Exception as e:
+        LOGGER.warning(f"Could not find the deployment block of {address} ({e})")
+        return None
+
+
+class DeploymentBlocks:
+    """
+    Tells the block each contract was deployed at, so its events are
+    not looked for in the blocks before it. Deployment blocks are found
+    once (see `find_deployment_block`) and persisted in the `state`
+    collection, keyed by the contract address. Contracts whose block
+    can't be found start at block 0 (and are tried again next time).
+    """
+
+    STATE = "state"
+
+    def __init__(self, client: MongoClient, db_name: str, web3: Web3):
+        """
+        Creates the instance.
+        :param client: The MongoDB client.
+        :param db_name: The database name.
+        :param web3: The Web3 client to use.
+        """
+
+        self._collection = client[db_name][self.STATE]
+        self._web3 = web3
+
+    def get(self, addresses: Iterable[str]) -> Dict[str, int]:
+        """
+        Gets the deployment blocks of some contracts, finding the ones
+        that are not stored yet.
+        :param addresses: The addresses of the contracts.
+        :return: A dictionary of (lowercase) address => deployment block.
+        """
+
+        addresses = sorted({address.lower() for address in addresses})
+        blocks = {record["deployment_of"]: record["block"]
+                  for record in self._collection.find({"deployment_of": {"$in": addresses}})}
+        missing = [address for address in addresses if address not in blocks]
+        if missing:
+            started = time.monotonic()
+            head = self._web3.eth.block_number
+            for address in missing:
+                block = find_deployment_block(self._web3, Web3.to_checksum_address(address), head)
+                if block is None:
+                    blocks[address] = 0
+                    continue
+                LOGGER.info(f"The contract {address} was deployed at block {block}")
+                self._collection.replace_one({"deployment_of": address},
+                                             {"deployment_of": address, "block": block}, upsert=True)
+                blocks[address] = block
+            LOGGER.info(f"Deployment blocks found in {time.monotonic() - started:.2f}s")
+        return blocks
@@ -1,6 +1,9 @@
 from typing import List
-from pymongo import MongoClient, ASCENDING, TEXT, DESCENDING
+from pymongo import MongoClient, ASCENDING, TEXT, DESCENDING, UpdateOne
 from pymongo.collection import Collection
+from handlers.balances import limbs_document
+from handlers.journal import ReorgJournal
+from metadata import MetadataQueue, MetadataHttpCache
 from handlers.base import MetaverseRelatedContractEventHandler
 from handlers import BrandRegistryContractEventHandler, EconomyContractEventHandler, \
     MetaverseContractEventHandler, SponsorRegistryContractEventHandler
@@ -78,3 +81,37 @@ def make_indices(client: MongoClient, db_name: str):
     _make_index(sponsors, "for_brand", False, [("brand", ASCENDING)])
     _make_index(sponsors, "full_match", True,
                 [("sponsor", ASCENDING), ("brand", ASCENDING)])
+
+    # Indices for the metadata queue.
+    metadata_queue = db[MetadataQueue.QUEUE]
+    _make_index(metadata_queue, "for_token", True, [("token", ASCENDING)])
+    _make_index(metadata_queue, "for_claim", False, [("status", ASCENDING), ("not_before", ASCENDING)])
+
+    # Indices for the reorg journal.
+    reorg_journal = db[ReorgJournal.JOURNAL]
+    _make_index(reorg_journal, "for_to_block", True, [("to_block", ASCENDING)])
+
+    # Indices for the metadata HTTP cache.
+    metadata_http_cache = db[MetadataHttpCache.HTTP_CACHE]
+    _make_index(metadata_http_cache, "for_url", True, [("url", ASCENDING)])
+
+
+def migrate_balances(client: MongoClient, db_name: str):
+    """
+    Gives limbs to the balances that only have their decimal amount
+    (i.e. the ones stored by former versions of the grabber), so they
+    can be incremented. The decimal amounts are removed, since they
+    are no longer kept up to date.
+    :param client: The MongoDB client.
+    :param db_name: The database name.
+    """
+
+    balances = client[db_name][EconomyContractEventHandler.BALANCES]
+    operations = [
+        UpdateOne({"_id": entry["_id"]}, {"$set": {"limbs": limbs_document(int(entry.get("amount") or "0"))},
+                                          "$unset": {"amount": ""}})
+        for entry in balances.find({"limbs": {"$exists": False}}, {"amount": 1})
+    ]
+    if operations:
+        balances.bulk_write(operations, ordered=False)
+    balances.update_many({"amount": {"$exists": True}}, {"$unset": {"amount": ""}})
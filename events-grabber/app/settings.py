@@ -0,0 +1,217 @@
+import os
+from typing import Optional, Callable, Any
+
+
+def _get_env(name: str, type_: Callable[[str], Any], default: Any = None):
+    """
+    Gets and converts an environment variable, if present.
+    :param name: The name of the variable.
+    :param type_: The conversion function.
+    :param default: The value to use when the variable is absent.
+    :return: The converted value, or the default one.
+    """
+
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return type_(value)
+
+
+class GrabberSettings:
+    """
+    The tuning settings of the events grabber. All of them have
+    defaults, and may be overridden from environment variables.
+    """
+
+    def __init__(self, chunking: Optional[dict] = None, collection_mode: str = "logs",
+                 collection_workers: int = 0, run_mode: str = "once",
+                 poll_min_interval: float = 1.0, poll_max_interval: float = 30.0,
+                 checkpoint_blocks: int = 0, checkpoint_events: int = 0, write_buffer_size: int = 5000,
+                 metadata_workers: int = 4, metadata_lease: float = 60.0,
+                 metadata_connect_timeout: float = 5.0, metadata_read_timeout: float = 10.0,
+                 metadata_host_concurrency: int = 2, metadata_breaker_failures: int = 5,
+                 metadata_breaker_reset: float = 60.0, metadata_refresh_interval: float = 60.0,
+                 metadata_refresh_rate: float = 1.0, metadata_refresh_base_delay: float = 300.0,
+                 metadata_refresh_max_delay: float = 86400.0, metadata_claim_batch: int = 8,
+                 multicall_address: Optional[str] = None, contracts_verify_interval: float = 3600.0,
+                 reorg_depth: int = 0, backfill_processes: int = 0, backfill_shard_blocks: int = 10000,
+                 log_archive_dir: Optional[str] = None, rpc_pool_size: int = 10, rpc_timeout: float = 30.0,
+                 rpc_retries: int = 3, rpc_hedge_percentile: float = 0.9, rpc_max_lag: int = 3,
+                 rpc_head_interval: float = 5.0, pipeline_fetch_ahead: int = 4, pipeline_buffer_size: int = 1000,
+                 discover_deployments: bool = False, catch_up_blocks: int = 100000):
+        """
+        Creates the settings.
+        :param chunking: The -optional- settings for the block range chunkers.
+        :param collection_mode: The events collection mode: "logs" or "filters".
+        :param collection_workers: How many handlers can collect events at
+          the same time (0 stands for all of them).
+        :param run_mode: "once" to process up to the current head and exit,
+          or "daemon" to keep following the head.
+        :param poll_min_interval: The minimum interval, in seconds, between
+          two head checks in daemon mode.
+        :param poll_max_interval: The maximum interval, in seconds, between
+          two head checks in daemon mode.
+        :param checkpoint_blocks: When positive, the range is processed and
+          committed in chunks spanning up to this amount of blocks.
+        :param checkpoint_events: When positive, a chunk is committed as soon
+          as this amount of events is processed (at a block boundary).
+        :param write_buffer_size: How many writes can be pending before
+          being sent as bulk writes (they're always sent per chunk).
+        :param metadata_workers: How many threads download metadata.
+        :param metadata_lease: How many seconds a metadata worker can hold
+          a token before others may claim it.
+        :param metadata_connect_timeout: The deadline, in seconds, to connect
+          to a metadata host.
+        :param metadata_read_timeout: The deadline, in seconds, to read a
+          whole metadata document.
+        :param metadata_host_concurrency: How many metadata requests a single
+          host can serve at once.
+        :param metadata_breaker_failures: How many consecutive failures of a
+          metadata host make it be skipped for a while.
+        :param metadata_breaker_reset: How many seconds a failing metadata
+          host is skipped.
+        :param metadata_refresh_interval: How many seconds to wait between two
+          scans for broken (INVALID / UNKNOWN) metadata. 0 disables the scans.
+        :param metadata_refresh_rate: How many tokens with broken metadata, per
+          second, can be downloaded again.
+        :param metadata_refresh_base_delay: The delay, in seconds, before retrying
+          a broken metadata the first time. It doubles after each attempt.
+        :param metadata_refresh_max_delay: The maximum delay, in seconds, before
+          retrying a broken metadata.
+        :param metadata_claim_batch: How many tokens a metadata worker claims
+          at once (their URIs are retrieved in a single round trip).
+        :param multicall_address: The -optional- address of the Multicall3
+          contract. By default, its canonical address.
+        :param contracts_verify_interval: How many seconds the stored contract
+          addresses are trusted before resolving them again.
+        :param reorg_depth: When positive, how many blocks below the head may
+          still be reorganized. Those blocks are processed one by one, with a
+          journal to roll them back if a reorg is detected.
+        :param backfill_processes: When above 1, how many processes fetch and
+          process the blocks in parallel while catching up with the chain.
+        :param backfill_shard_blocks: How many blocks each backfill process
+          takes at once.
+        :param log_archive_dir: The -optional- directory of the local archive
+          of raw logs. When set, all the fetched logs are archived, so they
+          can be replayed (see reindex.py) without the network.
+        :param rpc_pool_size: How many connections to the EVM Gateway are
+          kept alive.
+        :param rpc_timeout: The timeout, in seconds, of each request to the
+          EVM Gateway.
+        :param rpc_retries: How many times a request to the EVM Gateway is
+          retried after a transient failure.
+        :param rpc_hedge_percentile: When many EVM Gateways are given, the
+          percentile (0 to 1) of the observed latencies a eth_getLogs or
+          eth_call may take before being also sent to another one. 0
+          disables hedging.
+        :param rpc_max_lag: How many blocks an EVM Gateway may lag behind the
+          others before being skipped.
+        :param rpc_head_interval: How many seconds the heads of the EVM
+          Gateways are trusted before asking them again.
+        :param pipeline_fetch_ahead: How many fetched windows of logs, per
+          handler, can wait to be decoded.
+        :param pipeline_buffer_size: How many decoded events, per handler,
+          can wait to be processed.
+        :param discover_deployments: Whether to find out the block each
+          contract was deployed at (which requires an archive node), so
+          its events are not looked for in the blocks before it. Only
+          enable it with nodes serving the whole historical state.
+        :param catch_up_blocks: How many blocks the lagging handlers (e.g.
+          new or reset ones) catch up per cycle, so the others keep
+          following the head meanwhile (0 stands for no limit).
+        """
+
+        self.chunking = chunking or {}
+        self.collection_mode = collection_mode
+        self.collection_workers = collection_workers
+        self.run_mode = run_mode
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = max(poll_min_interval, poll_max_interval)
+        self.checkpoint_blocks = checkpoint_blocks
+        self.checkpoint_events = checkpoint_events
+        self.write_buffer_size = write_buffer_size
+        self.metadata_workers = metadata_workers
+        self.metadata_lease = metadata_lease
+        self.metadata_connect_timeout = metadata_connect_timeout
+        self.metadata_read_timeout = metadata_read_timeout
+        self.metadata_host_concurrency = metadata_host_concurrency
+        self.metadata_breaker_failures = metadata_breaker_failures
+        self.metadata_breaker_reset = metadata_breaker_reset
+        self.metadata_refresh_interval = metadata_refresh_interval
+        self.metadata_refresh_rate = metadata_refresh_rate
+        self.metadata_refresh_base_delay = metadata_refresh_base_delay
+        self.metadata_refresh_max_delay = metadata_refresh_max_delay
+        self.metadata_claim_batch = metadata_claim_batch
+        self.multicall_address = multicall_address
+        self.contracts_verify_interval = contracts_verify_interval
+        self.reorg_depth = reorg_depth
+        self.backfill_processes = backfill_processes
+        self.backfill_shard_blocks = backfill_shard_blocks
+        self.log_archive_dir = log_archive_dir
+        self.rpc_pool_size = rpc_pool_size
+        self.rpc_timeout = rpc_timeout
+        self.rpc_retries = rpc_retries
+        self.rpc_hedge_percentile = rpc_hedge_percentile
+        self.rpc_max_lag = rpc_max_lag
+        self.rpc_head_interval = rpc_head_interval
+        self.pipeline_fetch_ahead = pipeline_fetch_ahead
+        self.pipeline_buffer_size = pipeline_buffer_size
+        self.discover_deployments = discover_deployments
+        self.catch_up_blocks = catch_up_blocks
+
+    @classmethod
+    def from_environment(cls) -> "GrabberSettings":
+        """
+        Builds the settings from the environment variables.
+        :return: The settings.
+        """
+
+        chunking = {}
+        for key, var, type_ in [("initial_size", "LOGS_CHUNK_INITIAL_SIZE", int),
+                                ("min_size", "LOGS_CHUNK_MIN_SIZE", int),
+                                ("max_size", "LOGS_CHUNK_MAX_SIZE", int),
+                                ("target_results", "LOGS_CHUNK_TARGET_RESULTS", int),
+                                ("target_seconds", "LOGS_CHUNK_TARGET_SECONDS", float)]:
+            value = _get_env(var, type_)
+            if value is not None:
+                chunking[key] = value
+
+        return cls(
+            chunking=chunking,
+            collection_mode=_get_env("LOGS_COLLECTION_MODE", str, "logs"),
+            collection_workers=_get_env("LOGS_COLLECTION_WORKERS", int, 0),
+            run_mode=_get_env("GRABBER_MODE", str, "once"),
+            poll_min_interval=_get_env("POLL_MIN_INTERVAL", float, 1.0),
+            poll_max_interval=_get_env("POLL_MAX_INTERVAL", float, 30.0),
+            checkpoint_blocks=_get_env("CHECKPOINT_BLOCKS", int, 0),
+            checkpoint_events=_get_env("CHECKPOINT_EVENTS", int, 0),
+            write_buffer_size=_get_env("WRITE_BUFFER_SIZE", int, 5000),
+            metadata_workers=_get_env("METADATA_WORKERS", int, 4),
+            metadata_lease=_get_env("METADATA_LEASE", float, 60.0),
+            metadata_connect_timeout=_get_env("METADATA_CONNECT_TIMEOUT", float, 5.0),
+            metadata_read_timeout=_get_env("METADATA_READ_TIMEOUT", float, 10.0),
+            metadata_host_concurrency=_get_env("METADATA_HOST_CONCURRENCY", int, 2),
+            metadata_breaker_failures=_get_env("METADATA_BREAKER_FAILURES", int, 5),
+            metadata_breaker_reset=_get_env("METADATA_BREAKER_RESET", float, 60.0),
+            metadata_refresh_interval=_get_env("METADATA_REFRESH_INTERVAL", float, 60.0),
+            metadata_refresh_rate=_get_env("METADATA_REFRESH_RATE", float, 1.0),
+            metadata_refresh_base_delay=_get_env("METADATA_REFRESH_BASE_DELAY", float, 300.0),
+            metadata_refresh_max_delay=_get_env("METADATA_REFRESH_MAX_DELAY", float, 86400.0),
+            metadata_claim_batch=_get_env("METADATA_CLAIM_BATCH", int, 8),
+            multicall_address=_get_env("MULTICALL_ADDRESS", str),
+            contracts_verify_interval=_get_env("CONTRACTS_VERIFY_INTERVAL", float, 3600.0),
+            reorg_depth=_get_env("REORG_UNSAFE_DEPTH", int, 0),
+            backfill_processes=_get_env("BACKFILL_PROCESSES", int, 0),
+            backfill_shard_blocks=_get_env("BACKFILL_SHARD_BLOCKS", int, 10000),
+            log_archive_dir=_get_env("LOG_ARCHIVE_DIR", str),
+            rpc_pool_size=_get_env("RPC_POOL_SIZE", int, 10),
+            rpc_timeout=_get_env("RPC_TIMEOUT", float, 30.0),
+            rpc_retries=_get_env("RPC_RETRIES", int, 3),
+            rpc_hedge_percentile=_get_env("RPC_HEDGE_PERCENTILE", float, 0.9),
+            rpc_max_lag=_get_env("RPC_MAX_LAG", int, 3),
+            rpc_head_interval=_get_env("RPC_HEAD_INTERVAL", float, 5.0),
+            pipeline_fetch_ahead=_get_env("PIPELINE_FETCH_AHEAD", int, 4),
+            pipeline_buffer_size=_get_env("PIPELINE_BUFFER_SIZE", int, 1000),
+            discover_deployments=_get_env("DISCOVER_DEPLOYMENTS", lambda value: value == "yes", False),
+            catch_up_blocks=_get_env("CATCH_UP_BLOCKS", int, 100000),
+        )
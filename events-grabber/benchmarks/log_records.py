@@ -0,0 +1,108 @@
+"""
+Measures how much memory each fetched log takes while it waits to be
+decoded, in each of the forms logs were / are kept:
+
+- "web3": the AttributeDict logs of web3's get_logs.
+- "dicts": the eth_getLogs dicts, with numbers parsed and topics / data
+  turned into bytes (what the lean client used to return).
+- "records": the compact LogRecord objects.
+
+Run it from the events-grabber directory:
+
+    python benchmarks/log_records.py [logs]
+"""
+
+import os
+import sys
+import json
+import random
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from web3._utils.method_formatters import log_entry_formatter
+from rpc import LogRecord
+
+
+# TransferSingle(address indexed operator, address indexed from, address indexed to, uint256 id, uint256 value)
+_TOPIC = "0xc3d58168c5ae7397731d063d5bbf3d657854427343f4c083240f7aacaa2d0f62"
+
+
+def _hex(n: int, size: int) -> str:
+    return "0x" + n.to_bytes(size, "big").hex()
+
+
+def make_response(count: int) -> bytes:
+    """
+    Makes the (encoded) eth_getLogs response of many TransferSingle logs.
+    :param count: How many logs.
+    :return: The response body.
+    """
+
+    rnd = random.Random(1)
+    logs = []
+    for index in range(count):
+        block_number = 1000000 + index // 20
+        logs.append({
+            "address": _hex(rnd.getrandbits(160), 20),
+            "topics": [_TOPIC] + [_hex(rnd.getrandbits(160), 32) for _ in range(3)],
+            "data": "0x" + rnd.getrandbits(256).to_bytes(32, "big").hex() + (index + 1).to_bytes(32, "big").hex(),
+            "blockNumber": hex(block_number),
+            "transactionHash": _hex(rnd.getrandbits(256), 32),
+            "transactionIndex": hex(index % 20 // 4),
+            "blockHash": _hex(block_number * 7919, 32),
+            "logIndex": hex(index % 20),
+            "removed": False,
+        })
+    return json.dumps({"jsonrpc": "2.0", "id": 1, "result": logs}).encode()
+
+
+def as_web3(body: bytes) -> list:
+    return [log_entry_formatter(log) for log in json.loads(body)["result"]]
+
+
+def as_dicts(body: bytes) -> list:
+    logs = json.loads(body)["result"]
+    for log in logs:
+        log["blockNumber"] = int(log["blockNumber"], 16)
+        log["transactionIndex"] = int(log["transactionIndex"], 16)
+        log["logIndex"] = int(log["logIndex"], 16)
+        log["topics"] = [bytes.fromhex(topic[2:]) for topic in log["topics"]]
+        log["data"] = bytes.fromhex(log["data"][2:])
+    return logs
+
+
+def as_records(body: bytes) -> list:
+    return [
+        LogRecord(int(log["blockNumber"], 16), int(log["transactionIndex"], 16), int(log["logIndex"], 16),
+                  bytes.fromhex("".join(topic[2:] for topic in log["topics"])), bytes.fromhex(log["data"][2:]))
+        for log in json.loads(body)["result"]
+    ]
+
+
+def measure(parse, body: bytes) -> int:
+    """
+    Tells how many bytes the parsed logs keep allocated.
+    """
+
+    tracemalloc.start()
+    try:
+        logs = parse(body)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del logs
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    body = make_response(count)
+    sizes = {name: measure(parse, body) for name, parse in [
+        ("web3", as_web3), ("dicts", as_dicts), ("records", as_records)
+    ]}
+    print(f"Memory per log, for {count} TransferSingle logs:")
+    for name, size in sizes.items():
+        print(f"  {name:>8}: {size / count:8.1f} bytes ({size / sizes['records']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Local stub servers for the tests: they're served from a background
+thread on a random port of localhost.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+
+class StubError(Exception):
+    """
+    Raised by the functions answering a JSON-RPC method, to answer
+    with an error.
+    """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class StubServer:
+    """
+    An HTTP server answering each request with a function of its
+    method, path, headers and body. The requests are kept, to tell
+    what was asked.
+    """
+
+    def __init__(self, respond: Callable[[str, str, dict, bytes], tuple]):
+        """
+        Creates and starts the server.
+        :param respond: A function of (method, path, headers, body)
+          returning the (status, headers, body) of the response. The
+          body may also be an iterable of chunks, to stream it.
+        """
+
+        stub = self
+        self.requests = []
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub._lock:
+                    stub.requests.append((self.command, self.path, dict(self.headers), body))
+                status, headers, content = respond(self.command, self.path, dict(self.headers), body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if isinstance(content, bytes):
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                    return
+                # Streamed content: each chunk is sent as it comes,
+                # and the end of the content is the end of the
+                # connection.
+                self.end_headers()
+                for chunk in content:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonRpcStub(StubServer):
+    """
+    A JSON-RPC node answering each method with a function of its
+    parameters (which may raise a StubError), perhaps after a delay
+    (per method). Batches are supported. The head is told through
+    eth_blockNumber.
+    """
+
+    def __init__(self, head: int = 0, methods: Optional[Dict[str, Callable]] = None):
+        """
+        Creates and starts the node.
+        :param head: The head.
+        :param methods: The -optional- functions answering each method.
+        """
+
+        self.head = head
+        self.delays = {}
+        self.methods = {"eth_blockNumber": lambda params: hex(self.head), **(methods or {})}
+        super().__init__(self._respond)
+
+    def _answer(self, request: dict) -> dict:
+        method = self.methods.get(request["method"])
+        if method is None:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": "Not found"}}
+        time.sleep(self.delays.get(request["method"], 0))
+        try:
+            return {"jsonrpc": "2.0", "id": request["id"], "result": method(request["params"])}
+        except StubError as e:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": e.code, "message": e.message}}
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        payload = json.loads(body)
+        if isinstance(payload, list):
+            response = [self._answer(request) for request in payload]
+        else:
+            response = self._answer(payload)
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    def calls(self, method: str) -> list:
+        """
+        Tells the parameters of the requests of a method (batched or not).
+        """
+
+        calls = []
+        for _, _, _, body in self.requests:
+            payload = json.loads(body)
+            calls.extend(request["params"] for request in (payload if isinstance(payload, list) else [payload])
+                         if request["method"] == method)
+        return calls
@@ -0,0 +1,114 @@
+"""
+Tests that the writes recorded by backfill shards, once merged and
+replayed, leave the same state as processing the events sequentially.
+Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.balances import BalanceDeltas, from_limbs
+from handlers.streams import pack_position
+from handlers.writes import WriteBuffer, RecordingWriteBuffer
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+# The events of two shards (blocks 1:2 and 3:4). The parameter "k"
+# is updated in the first shard and replaced (upserting) in the
+# second one, and the balance of ("alice", "1") changes in both.
+SHARDS = [
+    [
+        (pack_position(1, 0, 0), "update", ("parameters", {"key": "k"}, {"$set": {"stale": True}}, True)),
+        (pack_position(1, 0, 1), "balance", ("alice", "1", 10)),
+        (pack_position(1, 1, 0), "insert", ("deals", {"index": 1})),
+        (pack_position(2, 0, 0), "update", ("permissions", {"user": "alice"}, {"$set": {"value": True}}, True)),
+        (pack_position(2, 0, 1), "balance", ("bob", "1", 7)),
+    ],
+    [
+        (pack_position(3, 0, 0), "replace", ("parameters", {"key": "k"}, {"key": "k", "value": "3"}, True)),
+        (pack_position(3, 0, 1), "balance", ("alice", "1", -4)),
+        (pack_position(3, 2, 0), "insert", ("deals", {"index": 2})),
+        (pack_position(4, 0, 0), "update", ("permissions", {"user": "alice"}, {"$set": {"value": False}}, True)),
+        (pack_position(4, 0, 1), "update", ("parameters", {"key": "k"}, {"$set": {"extra": 1}}, True)),
+    ],
+]
+
+
+def _process(write_buffer: WriteBuffer, deltas: BalanceDeltas, events: list):
+    """
+    Processes events the way a handler does.
+    """
+
+    for position, kind, args in events:
+        if isinstance(write_buffer, RecordingWriteBuffer):
+            write_buffer.at(position)
+        if kind == "update":
+            write_buffer.update_one(*args)
+        elif kind == "replace":
+            write_buffer.replace_one(*args)
+        elif kind == "insert":
+            write_buffer.insert_one(args[0], dict(args[1]))
+        else:
+            deltas.add(*args)
+
+
+def _dump(db) -> dict:
+    """
+    Gets the contents of the collections, without ids, comparable.
+    """
+
+    contents = {name: sorted(repr(sorted(document.items())) for document in db[name].find({}, {"_id": 0}))
+                for name in ("parameters", "permissions", "deals")}
+    contents["balances"] = sorted((balance["owner"], balance["token"], from_limbs(balance["limbs"]))
+                                  for balance in db["balances"].find())
+    return contents
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class BackfillMergeTest(unittest.TestCase):
+
+    def _sequential(self) -> dict:
+        db = mongomock.MongoClient().db
+        write_buffer = WriteBuffer(db)
+        deltas = BalanceDeltas("balances")
+        write_buffer.attach(deltas)
+        for events in SHARDS:
+            _process(write_buffer, deltas, events)
+        write_buffer.flush()
+        return _dump(db)
+
+    def _sharded(self) -> dict:
+        recorded = []
+        for events in SHARDS:
+            write_buffer = RecordingWriteBuffer()
+            deltas = BalanceDeltas("balances")
+            write_buffer.attach(deltas)
+            _process(write_buffer, deltas, events)
+            recorded.append(write_buffer.take())
+        # The shards may finish in any order.
+        merged = recorded[1]
+        merged.merge(recorded[0])
+        db = mongomock.MongoClient().db
+        write_buffer = WriteBuffer(db)
+        merged.replay(write_buffer)
+        # The update of "k" in the first shard is superseded by the
+        # replace in the second one: 6 operations and 2 balances.
+        self.assertEqual(len(write_buffer), 8)
+        write_buffer.flush()
+        return _dump(db)
+
+    def test_same_state_as_sequential(self):
+        sequential = self._sequential()
+        self.assertEqual(sequential, self._sharded())
+        self.assertEqual(sequential["parameters"], [repr([("extra", 1), ("key", "k"), ("value", "3")])])
+        self.assertEqual(sequential["permissions"], [repr([("user", "alice"), ("value", False)])])
+        self.assertEqual(len(sequential["deals"]), 2)
+        self.assertEqual(sequential["balances"], [("alice", "1", 6), ("bob", "1", 7)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Tests of the balances stored as limbs, and of their migration. Run
+them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.balances import BalanceDeltas, to_limbs, from_limbs, limbs_document, LIMB_FIELDS
+from runner.prepare import migrate_balances
+try:
+    import mongomock
+    from mongomock.collection import Collection
+except ImportError:
+    mongomock = None
+
+
+class LimbsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for value in (0, 1, -1, (1 << 32) - 1, 1 << 32, -(1 << 32) - 5, (1 << 256) - 1, -((1 << 256) - 1)):
+            self.assertEqual(from_limbs(dict(zip(LIMB_FIELDS, to_limbs(value)))), value)
+            self.assertEqual(from_limbs(limbs_document(value)), value)
+
+    def test_signed_limbs_carry(self):
+        # Limbs out of their 32 bits, or negative, still add up.
+        self.assertEqual(from_limbs({"l0": -1, "l1": 1}), (1 << 32) - 1)
+        self.assertEqual(from_limbs({"l0": 1 << 32}), 1 << 32)
+        self.assertEqual(from_limbs({"l0": (1 << 33) + 1, "l1": -2}), 1)
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class BalanceDeltasTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.deltas = BalanceDeltas("balances")
+
+    def _balance(self, owner: str) -> int:
+        return from_limbs(self.db["balances"].find_one({"owner": owner, "token": "1"})["limbs"])
+
+    def _flush(self):
+        original = Collection.bulk_write
+        with mock.patch.object(Collection, "bulk_write", autospec=True, side_effect=original) as bulk_write, \
+                mock.patch.object(Collection, "find", side_effect=AssertionError("balances are not read back")):
+            self.deltas.flush(self.db, {})
+        self.assertEqual(bulk_write.call_count, 1)
+
+    def test_increments_across_limbs(self):
+        self.deltas.add("alice", "1", (1 << 32) - 1, {"extra": True})
+        self.deltas.add("bob", "1", 1 << 255)
+        self._flush()
+        self.deltas.add("alice", "1", 1)
+        self.deltas.add("bob", "1", -1)
+        self._flush()
+        self.assertEqual(self._balance("alice"), 1 << 32)
+        self.assertEqual(self._balance("bob"), (1 << 255) - 1)
+        self.deltas.add("alice", "1", -(1 << 32))
+        self.deltas.add("bob", "1", -((1 << 255) - 1))
+        self._flush()
+        self.assertEqual(self._balance("alice"), 0)
+        self.assertEqual(self._balance("bob"), 0)
+        self.assertTrue(self.db["balances"].find_one({"owner": "alice"})["extra"])
+
+    def test_merged_deltas_are_summed(self):
+        other = BalanceDeltas("balances")
+        self.deltas.add("alice", "1", 5)
+        other.add("alice", "1", -2)
+        other.add("bob", "1", 3)
+        self.deltas.merge(other)
+        self.assertEqual(len(self.deltas), 2)
+        self._flush()
+        self.assertEqual(self._balance("alice"), 3)
+        self.assertEqual(self._balance("bob"), 3)
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MigrateBalancesTest(unittest.TestCase):
+
+    def test_migrates_decimal_amounts(self):
+        client = mongomock.MongoClient()
+        balances = client.db["balances"]
+        big = (1 << 200) + 12345
+        balances.insert_many([
+            {"owner": "alice", "token": "1", "amount": str(big)},
+            {"owner": "bob", "token": "1", "amount": "0"},
+            {"owner": "carol", "token": "1", "amount": "7", "limbs": limbs_document(9)},
+        ])
+        migrate_balances(client, "db")
+        migrated = {balance["owner"]: balance for balance in balances.find()}
+        self.assertEqual(from_limbs(migrated["alice"]["limbs"]), big)
+        self.assertEqual(from_limbs(migrated["bob"]["limbs"]), 0)
+        # Existing limbs are kept, and the stale amount is removed.
+        self.assertEqual(from_limbs(migrated["carol"]["limbs"]), 9)
+        self.assertFalse(any("amount" in balance for balance in migrated.values()))
+        # Migrated balances can be incremented.
+        deltas = BalanceDeltas("balances")
+        deltas.add("alice", "1", -12345)
+        deltas.flush(client.db, {})
+        self.assertEqual(from_limbs(balances.find_one({"owner": "alice"})["limbs"]), 1 << 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests of the per-handler checkpoints, and of resetting handlers.
+Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+from web3 import Web3
+import stubs  # noqa: F401 (makes the app importable)
+from contracts import make_contracts
+from handlers import make_handlers
+from handlers.base import MetaverseRelatedContractEventHandler
+from handlers.journal import ReorgJournal
+from runner.checkpoints import HandlerCheckpoints
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+ADDRESSES = {key: Web3.to_checksum_address("0x" + ("%02x" % index) * 20) for index, key in enumerate([
+    "brand_registry", "economy", "sponsor_registry", "signature_verifier",
+    "currency_definition_plugin", "currency_minting_plugin"
+], 2)}
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class HandlerCheckpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.db = self.client.db
+        contracts = make_contracts(Web3(), Web3.to_checksum_address("0x" + "01" * 20), ADDRESSES)
+        self.handlers = make_handlers(
+            self.client, "db", {}, contracts["metaverse"], contracts["brand_registry"], contracts["economy"],
+            contracts["sponsor_registry"], contracts["currency_definition_plugin"],
+            contracts["currency_minting_plugin"]
+        ).handlers
+        for handler in self.handlers:
+            handler.start_block = 10
+        self.checkpoints = HandlerCheckpoints(self.client, "db")
+
+    def _named(self, name: str):
+        return next(handler for handler in self.handlers if handler.name == name)
+
+    def _blocks(self) -> dict:
+        return {key.split(":")[0]: block for key, block in self.checkpoints.positions(self.handlers, 1000).items()}
+
+    def test_migrates_from_the_global_last_block(self):
+        # No checkpoints: all the handlers are at the global last block.
+        self.assertEqual(set(self._blocks().values()), {9})
+        self.checkpoints.migrate({}, self.handlers, 500)
+        self.assertEqual(set(self._blocks().values()), {500})
+        # Once tracked, the checkpoints are kept (new handlers are new).
+        self.checkpoints.set({}, [self._named("economy")], 300)
+        self.checkpoints.migrate({}, self.handlers, 600)
+        self.assertEqual(self._blocks()["economy"], 300)
+        self.assertEqual(self._blocks()["metaverse"], 500)
+
+    def test_reset_requested_before_the_handler_runs(self):
+        self.checkpoints.set({}, [self._named("metaverse")], 500)
+        self.assertFalse(self.checkpoints.request_reset("sponsor-registry", 100))
+        # The name is matched exactly.
+        self.assertFalse(self.checkpoints.request_reset("sponsor.registry"))
+        others = [handler for handler in self.handlers if handler.name != "sponsor-registry"]
+        self.assertEqual(self.checkpoints.apply_resets({}, others), [])
+        self.assertEqual(self.db["state"].count_documents({"reset_of": {"$exists": True}}), 2)
+        # The request applies when the handler first runs.
+        self.assertEqual(self.checkpoints.apply_resets({}, self.handlers),
+                         [HandlerCheckpoints.key(self._named("sponsor-registry"))])
+        self.assertEqual(self._blocks()["sponsor-registry"], 99)
+        self.assertEqual(self.db["state"].count_documents({"reset_of": "sponsor-registry"}), 0)
+
+    def test_rebuilding_keeps_the_shared_collections(self):
+        brand_registry = self._named("brand-registry")
+        tokens_metadata = MetaverseRelatedContractEventHandler.TOKENS_METADATA
+        # Token metadata is written by the brand registry and the
+        # currency definition handlers: rebuilding one of them must
+        # not clear it.
+        for handler in self.handlers:
+            self.assertNotIn(tokens_metadata, handler.get_collections())
+        for index, handler in enumerate(self.handlers):
+            for other in self.handlers[index + 1:]:
+                if handler.contract is not other.contract:
+                    self.assertFalse(set(handler.get_collections()) & set(other.get_collections()))
+
+        self.db[brand_registry.BRAND_PERMISSIONS].insert_one({"brand": "0x1", "user": "0x2", "value": True})
+        self.db[tokens_metadata].insert_one({"token": "0x1"})
+        self.db["metaverse_permissions"].insert_one({"user": "0x2", "value": True})
+        self.db[ReorgJournal.JOURNAL].insert_one({
+            "from_block": 900, "to_block": 900, "block_hash": "0x00", "inserted": [], "balances": [],
+            "created_balances": [], "tokens": [],
+            "restore": [{"collection": brand_registry.BRAND_PERMISSIONS, "filter": {}, "previous": None},
+                        {"collection": tokens_metadata, "filter": {}, "previous": None}]
+        })
+        self.checkpoints.set({}, self.handlers, 950)
+        self.assertTrue(self.checkpoints.request_reset("brand-registry"))
+        self.checkpoints.apply_resets({}, self.handlers)
+
+        self.assertEqual(self.db[brand_registry.BRAND_PERMISSIONS].count_documents({}), 0)
+        self.assertEqual(self.db[tokens_metadata].count_documents({}), 1)
+        self.assertEqual(self.db["metaverse_permissions"].count_documents({}), 1)
+        [entry] = ReorgJournal.entries(self.db)
+        self.assertEqual([restore["collection"] for restore in entry["restore"]], [tokens_metadata])
+        blocks = self._blocks()
+        self.assertEqual(blocks.pop("brand-registry"), 9)
+        self.assertEqual(set(blocks.values()), {950})
+
+    def test_non_replayable_handlers_are_rebuilt(self):
+        self.checkpoints.set({}, self.handlers, 950)
+        self.db["deals"].insert_one({"index": 1})
+        self.db["sponsors"].insert_one({"brand": "0x1"})
+        self.checkpoints.request_reset("economy", 900)
+        self.checkpoints.request_reset("sponsor-registry", 900)
+        self.checkpoints.apply_resets({}, self.handlers)
+        self.assertEqual(self.db["deals"].count_documents({}), 0)
+        self.assertEqual(self.db["sponsors"].count_documents({}), 1)
+        self.assertEqual(self._blocks()["economy"], 9)
+        self.assertEqual(self._blocks()["sponsor-registry"], 899)
+
+
+if __name__ == "__main__":
+    unittest.main()
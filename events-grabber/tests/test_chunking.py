@@ -0,0 +1,97 @@
+"""
+Tests of the adaptive block range chunker. Run them from the
+events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+import requests
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.chunking import BlockRangeChunker, is_range_error
+
+
+class _Node:
+    """
+    A fake node that rejects the logs queries covering more than a
+    given amount of blocks, and has one entry per block.
+    """
+
+    def __init__(self, max_blocks: int, error: Exception = None):
+        self.max_blocks = max_blocks
+        self.error = error
+        self.queries = []
+
+    def get_logs(self, from_block: int, to_block: int) -> list:
+        self.queries.append((from_block, to_block))
+        if to_block - from_block + 1 > self.max_blocks:
+            raise self.error or ValueError({"code": -32005, "message": "query returned more than 10000 results"})
+        return list(range(from_block, to_block + 1))
+
+
+class RangeErrorsTest(unittest.TestCase):
+
+    def test_range_errors(self):
+        self.assertTrue(is_range_error(ValueError({"code": -32005, "message": "Query returned more than 10000"})))
+        self.assertTrue(is_range_error(ValueError("block range is too wide")))
+        self.assertTrue(is_range_error(requests.exceptions.ReadTimeout()))
+        self.assertTrue(is_range_error(TimeoutError()))
+        self.assertFalse(is_range_error(ValueError("execution reverted")))
+        self.assertFalse(is_range_error(requests.exceptions.ConnectionError("refused")))
+
+
+class BlockRangeChunkerTest(unittest.TestCase):
+
+    def _windows(self, chunker: BlockRangeChunker, node: _Node, start_block: int, end_block: int) -> list:
+        return [(from_block, to_block) for from_block, to_block, entries
+                in chunker.iter_windows(start_block, end_block, node.get_logs, "test")]
+
+    def test_bisects_rejected_ranges(self):
+        chunker = BlockRangeChunker(initial_size=100, target_results=20)
+        node = _Node(max_blocks=20)
+        with self.assertLogs("grabber:chunking", "WARNING") as logs:
+            windows = self._windows(chunker, node, 1, 100)
+        # Halved until accepted (100 -> 50 -> 25 -> 12), then kept.
+        self.assertEqual(node.queries[:5], [(1, 100), (1, 50), (1, 25), (1, 12), (13, 24)])
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(windows, [(from_block, min(100, from_block + 11)) for from_block in range(1, 101, 12)])
+
+    def test_windows_cover_the_range_in_order(self):
+        chunker = BlockRangeChunker(initial_size=64, target_results=1000)
+        node = _Node(max_blocks=10)
+        with self.assertLogs("grabber:chunking", "WARNING"):
+            windows = self._windows(chunker, node, 1000, 1200)
+        self.assertEqual(windows[0][0], 1000)
+        self.assertEqual(windows[-1][1], 1200)
+        for (_, to_block), (from_block, _) in zip(windows, windows[1:]):
+            self.assertEqual(from_block, to_block + 1)
+        self.assertTrue(all(to_block - from_block < 10 for from_block, to_block in windows))
+
+    def test_grows_and_shrinks_with_the_results(self):
+        chunker = BlockRangeChunker(initial_size=10, max_size=40, target_results=50)
+        node = _Node(max_blocks=1000)
+        # Doubled while under half the target, up to the maximum.
+        self.assertEqual(self._windows(chunker, node, 1, 100), [(1, 10), (11, 30), (31, 70), (71, 100)])
+        self.assertEqual(chunker.size, 40)
+        # Halved when over the target.
+        chunker = BlockRangeChunker(initial_size=40, target_results=30)
+        self.assertEqual(self._windows(chunker, node, 1, 40), [(1, 40)])
+        self.assertEqual(chunker.size, 20)
+
+    def test_other_errors_are_raised(self):
+        chunker = BlockRangeChunker(initial_size=100)
+        node = _Node(max_blocks=30, error=ValueError("execution reverted"))
+        with self.assertRaises(ValueError):
+            self._windows(chunker, node, 1, 60)
+        self.assertEqual(node.queries, [(1, 60)])
+
+    def test_rejected_minimal_windows_are_raised(self):
+        chunker = BlockRangeChunker(initial_size=8, min_size=4)
+        node = _Node(max_blocks=2)
+        with self.assertLogs("grabber:chunking", "WARNING"), self.assertRaises(ValueError):
+            self._windows(chunker, node, 1, 60)
+        self.assertEqual(node.queries, [(1, 8), (1, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
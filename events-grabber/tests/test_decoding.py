@@ -0,0 +1,66 @@
+"""
+Tests of the precomputed event topics and of the event decoders. Run
+them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import copy
+import unittest
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+import stubs  # noqa: F401 (makes the app importable)
+from contracts import abi
+from contracts.abi.topics import EVENT_TOPICS
+from handlers.decoding import event_topics, compile_decoders
+from rpc import LogRecord
+
+
+USER = "0x" + "ab" * 20
+SENDER = "0x" + "cd" * 20
+
+
+def _computed(entries: list) -> dict:
+    return {entry["name"]: event_abi_to_log_topic(entry) for entry in entries
+            if entry.get("type") == "event" and not entry.get("anonymous")}
+
+
+class EventTopicsTest(unittest.TestCase):
+
+    def test_shipped_topics_match_the_abis(self):
+        for name in abi.__all__:
+            self.assertEqual(EVENT_TOPICS.get(name, {}), _computed(getattr(abi, name)), name)
+
+    def test_shipped_abis_are_not_hashed(self):
+        self.assertIs(event_topics(abi.METAVERSE_CONTRACT_ABI), EVENT_TOPICS["METAVERSE_CONTRACT_ABI"])
+        # Other ABIs (even equal ones) are hashed.
+        other = copy.deepcopy(abi.METAVERSE_CONTRACT_ABI)
+        self.assertIsNot(event_topics(other), EVENT_TOPICS["METAVERSE_CONTRACT_ABI"])
+        self.assertEqual(event_topics(other), EVENT_TOPICS["METAVERSE_CONTRACT_ABI"])
+
+
+class EventDecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        decoders = compile_decoders(abi.METAVERSE_CONTRACT_ABI, {
+            "PermissionChanged": (None, ["sender", "user", "permission", "set"])
+        })
+        self.topic = EVENT_TOPICS["METAVERSE_CONTRACT_ABI"]["PermissionChanged"]
+        self.assertEqual(list(decoders), [self.topic])
+        self.decoder = decoders[self.topic]
+
+    def test_decodes_topics_and_data(self):
+        permission = b"\x01" * 32
+        log = LogRecord(1, 0, 0, self.topic + permission + encode(["address"], [USER]),
+                        encode(["bool", "address"], [True, SENDER]))
+        # Ordered like the method's arguments, with checksum addresses.
+        self.assertEqual(self.decoder.decode(log),
+                         (to_checksum_address(SENDER), to_checksum_address(USER), permission, True))
+
+    def test_mismatched_topics(self):
+        with self.assertRaises(ValueError):
+            self.decoder.decode(LogRecord(1, 0, 0, self.topic, encode(["bool", "address"], [True, SENDER])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests of the local log archive, and of reindexing from it. Run them
+from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import shutil
+import tempfile
+import unittest
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.archive import LogArchive, LogArchiveGapError
+from rpc import LogRecord
+from runner import run_reindex, _get_last_processed_block_number
+from settings import GrabberSettings
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+ADDRESS = "0x" + "ab" * 20
+METAVERSE = "0x" + "01" * 20
+ADDRESSES = {key: "0x" + ("%02x" % index) * 20 for index, key in enumerate([
+    "brand_registry", "economy", "sponsor_registry", "signature_verifier",
+    "currency_definition_plugin", "currency_minting_plugin"
+], 2)}
+
+
+def _log(block_number: int, log_index: int = 0, data: bytes = b"") -> LogRecord:
+    return LogRecord(block_number, 0, log_index, bytes([block_number % 256]) * 32 + b"\x01" * 32, data)
+
+
+class LogArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = LogArchive(self.directory)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        logs = [_log(10, 0, b"\x00\xff"), _log(10, 1), _log(12)]
+        self.archive.append(ADDRESS, 10, 14, logs)
+        reader = LogArchive(self.directory)
+        self.assertEqual(list(reader.iter_logs(ADDRESS, 10, 14)), logs)
+        self.assertEqual(list(reader.iter_logs(ADDRESS, 11, 14)), logs[2:])
+        self.assertEqual((reader.first_block(ADDRESS), reader.last_block(ADDRESS)), (10, 14))
+        # The addresses are not case-sensitive.
+        self.assertEqual(list(reader.iter_logs(ADDRESS.upper(), 10, 10)), logs[:2])
+        reader.close()
+
+    def test_reads_across_segments(self):
+        # Each archive (e.g. each backfill process) appends its own segment.
+        self.archive.append(ADDRESS, 1, 5, [_log(2), _log(5)])
+        other = LogArchive(self.directory)
+        other.append(ADDRESS, 6, 9, [_log(7)])
+        other.close()
+        self.assertEqual([log.block_number for log in self.archive.iter_logs(ADDRESS, 1, 9)], [2, 5, 7])
+        # Windows appended later are seen by the same reader.
+        self.archive.append(ADDRESS, 10, 10, [_log(10)])
+        self.assertEqual([log.block_number for log in self.archive.iter_logs(ADDRESS, 4, 10)], [5, 7, 10])
+
+    def test_most_recent_window_wins(self):
+        self.archive.append(ADDRESS, 1, 10, [_log(2), _log(5), _log(8)])
+        # Blocks 4:6 fetched again (e.g. after a reorg): block 5 has no logs now.
+        self.archive.append(ADDRESS, 4, 6, [_log(4)])
+        self.assertEqual([log.block_number for log in self.archive.iter_logs(ADDRESS, 1, 10)], [2, 4, 8])
+        # And an older window doesn't win over a newer one starting before.
+        self.archive.append(ADDRESS, 1, 4, [_log(3)])
+        self.assertEqual([log.block_number for log in self.archive.iter_logs(ADDRESS, 1, 10)], [3, 8])
+
+    def test_gaps(self):
+        self.archive.append(ADDRESS, 1, 5, [_log(2)])
+        self.archive.append(ADDRESS, 9, 12, [_log(10)])
+        with self.assertRaises(LogArchiveGapError) as context:
+            list(self.archive.iter_logs(ADDRESS, 1, 12))
+        self.assertEqual((context.exception.from_block, context.exception.to_block), (6, 8))
+        with self.assertRaises(LogArchiveGapError) as context:
+            list(self.archive.iter_logs(ADDRESS, 10, 15))
+        self.assertEqual((context.exception.from_block, context.exception.to_block), (13, 15))
+        self.assertEqual([log.block_number for log in self.archive.iter_logs(ADDRESS, 9, 12)], [10])
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class ReindexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        archive = LogArchive(self.directory)
+        archive.save_contracts(METAVERSE, ADDRESSES)
+        for address in [METAVERSE] + list(ADDRESSES.values()):
+            archive.append(address, 50, 80, [])
+        archive.close()
+        self.settings = GrabberSettings(log_archive_dir=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _reindex(self, start_blocks: dict):
+        archive = LogArchive(self.directory)
+        archive.save_start_blocks({METAVERSE: 50, **{address: 50 for address in ADDRESSES.values()},
+                                   **start_blocks})
+        client = mongomock.MongoClient()
+        run_reindex(client, "db", False, METAVERSE, self.settings)
+        return client
+
+    def test_reindexes_a_complete_archive(self):
+        client = self._reindex({})
+        self.assertEqual(_get_last_processed_block_number(client, "db", {}), 80)
+
+    def test_refuses_an_incomplete_archive(self):
+        # The economy events are collected since block 10, but they're
+        # only archived since block 50.
+        with self.assertRaisesRegex(ValueError, "incomplete"):
+            self._reindex({ADDRESSES["economy"]: 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
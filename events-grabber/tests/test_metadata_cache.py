@@ -0,0 +1,73 @@
+"""
+Tests of the conditional revalidation of metadata documents, against
+a local stub server. Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import json
+import unittest
+from stubs import StubServer
+from metadata import MetadataFetcher, MetadataHttpCache
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MetadataRevalidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {"name": "first"}
+        self.etag = '"v1"'
+        self.last_modified = None
+        self.server = StubServer(self._respond)
+        self.cache = MetadataHttpCache(mongomock.MongoClient().db)
+        self.fetcher = MetadataFetcher(None, self.cache)
+        self.url = self.server.url + "/token.json"
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        validators = {}
+        if self.etag:
+            validators["ETag"] = self.etag
+        if self.last_modified:
+            validators["Last-Modified"] = self.last_modified
+        if (self.etag and headers.get("If-None-Match") == self.etag) or \
+                (not self.etag and self.last_modified and headers.get("If-Modified-Since") == self.last_modified):
+            return 304, validators, b""
+        return 200, {"Content-Type": "application/json", **validators}, json.dumps(self.document).encode()
+
+    def test_revalidates_with_the_etag(self):
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "first"})
+        self.assertEqual(self.cache.get(self.url)["etag"], '"v1"')
+        validated_at = self.cache.get(self.url)["validated_at"]
+        # Not modified: the cached body is used.
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "first"})
+        self.assertEqual(self.server.requests[-1][2].get("If-None-Match"), '"v1"')
+        self.assertEqual(self.fetcher.counters["not_modified"], 1)
+        self.assertGreaterEqual(self.cache.get(self.url)["validated_at"], validated_at)
+        # Modified: the new body is downloaded and cached.
+        self.document, self.etag = {"name": "second"}, '"v2"'
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "second"})
+        self.assertEqual(self.cache.get(self.url)["etag"], '"v2"')
+        self.assertEqual(self.fetcher.counters["not_modified"], 1)
+
+    def test_revalidates_with_the_last_modified_date(self):
+        self.etag, self.last_modified = None, "Mon, 05 Oct 2026 10:00:00 GMT"
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "first"})
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "first"})
+        self.assertEqual(self.server.requests[-1][2].get("If-Modified-Since"), self.last_modified)
+        self.assertEqual(self.fetcher.counters["not_modified"], 1)
+
+    def test_does_not_cache_without_validators(self):
+        self.etag = None
+        self.assertEqual(self.fetcher.get_json(self.url), {"name": "first"})
+        self.assertIsNone(self.cache.get(self.url))
+
+
+if __name__ == "__main__":
+    unittest.main()
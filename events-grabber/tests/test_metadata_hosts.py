@@ -0,0 +1,169 @@
+"""
+Tests of the metadata host policy (circuit breakers and concurrency
+caps) and of the fetcher's deadlines, against local stub servers. Run
+them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import json
+import time
+import threading
+import unittest
+from stubs import StubServer
+from metadata import MetadataFetcher, HostPolicy
+from metadata.fetcher import invalid_metadata
+from metadata.hosts import HostUnavailableError
+
+
+DOCUMENT = {"name": "token"}
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.failing = True
+        self.server = StubServer(self._respond)
+        self.policy = HostPolicy(failure_threshold=2, reset_timeout=0.3)
+        self.fetcher = MetadataFetcher(None, host_policy=self.policy)
+        self.url = self.server.url + "/token.json"
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if self.failing:
+            return 503, {}, b"down"
+        return 200, {"Content-Type": "application/json"}, json.dumps(DOCUMENT).encode()
+
+    def _open(self):
+        for _ in range(2):
+            self.assertEqual(self.fetcher.get_json(self.url), invalid_metadata())
+        with self.assertRaises(HostUnavailableError):
+            self.fetcher.get_json(self.url)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_opens_and_closes(self):
+        self._open()
+        self.assertEqual(self.policy.counters["short_circuited"], 1)
+        self.assertEqual(self.policy.counters["server_error"], 2)
+        time.sleep(0.35)
+        # Half-open: the probe succeeds, so the circuit closes.
+        self.failing = False
+        self.assertEqual(self.fetcher.get_json(self.url), DOCUMENT)
+        self.failing = True
+        self.assertEqual(self.fetcher.get_json(self.url), invalid_metadata())
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_failed_probe_opens_again(self):
+        self._open()
+        time.sleep(0.35)
+        self.assertEqual(self.fetcher.get_json(self.url), invalid_metadata())
+        with self.assertRaises(HostUnavailableError):
+            self.fetcher.get_json(self.url)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_single_probe_while_half_open(self):
+        self._open()
+        time.sleep(0.35)
+        with self.policy.guard("127.0.0.1", 1):
+            with self.assertRaises(HostUnavailableError):
+                with self.policy.guard("127.0.0.1", 1):
+                    pass
+        # Other hosts have their own circuits.
+        with self.policy.guard("localhost", 1):
+            pass
+
+
+class ConcurrencyCapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = StubServer(self._respond)
+        self.policy = HostPolicy(max_concurrency=2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.2)
+        with self.lock:
+            self.active -= 1
+        return 200, {"Content-Type": "application/json"}, json.dumps(DOCUMENT).encode()
+
+    def test_caps_the_requests_per_host(self):
+        fetcher = MetadataFetcher(None, host_policy=self.policy, read_timeout=5)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fetcher.get_json(self.server.url + "/t.json")))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [DOCUMENT] * 5)
+        self.assertEqual(self.max_active, 2)
+
+    def test_busy_host_fails_fast(self):
+        fetcher = MetadataFetcher(None, host_policy=self.policy, read_timeout=0.05)
+        release = threading.Event()
+        entered = threading.Barrier(3)
+
+        def hold():
+            with self.policy.guard("127.0.0.1", 1):
+                entered.wait()
+                release.wait()
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        for holder in holders:
+            holder.start()
+        entered.wait()
+        with self.assertRaises(HostUnavailableError):
+            fetcher.get_json(self.server.url + "/t.json")
+        self.assertEqual(self.policy.counters["busy"], 1)
+        release.set()
+        for holder in holders:
+            holder.join()
+        # Being busy is not a failure of the host.
+        fetcher = MetadataFetcher(None, host_policy=self.policy, read_timeout=5)
+        self.assertEqual(fetcher.get_json(self.server.url + "/t.json"), DOCUMENT)
+
+
+class ReadDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer(self._respond)
+
+    def tearDown(self):
+        self.server.close()
+
+    @staticmethod
+    def _trickle():
+        yield b'{"name": '
+        for _ in range(20):
+            time.sleep(0.1)
+            yield b" "
+        yield b'"token"}'
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        return 200, {"Content-Type": "application/json"}, self._trickle()
+
+    def test_slow_content_is_abandoned(self):
+        policy = HostPolicy()
+        fetcher = MetadataFetcher(None, host_policy=policy, connect_timeout=1, read_timeout=0.5)
+        started = time.monotonic()
+        self.assertEqual(fetcher.get_json(self.server.url + "/t.json"), invalid_metadata())
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(policy.counters["timeout"], 1)
+
+    def test_slow_content_within_the_deadline(self):
+        fetcher = MetadataFetcher(None, connect_timeout=1, read_timeout=5)
+        self.assertEqual(fetcher.get_json(self.server.url + "/t.json"), DOCUMENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests of the metadata queue: claims, leases and versioned completion.
+Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import time
+import unittest
+import stubs  # noqa: F401 (makes the app importable)
+from metadata import MetadataQueue
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MetadataQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.queue = MetadataQueue(self.db)
+
+    def _entries(self) -> dict:
+        return {entry["token"]: entry for entry in self.db[MetadataQueue.QUEUE].find()}
+
+    def test_each_token_is_queued_once(self):
+        self.queue.enqueue([1, 2])
+        self.queue.enqueue([1])
+        entries = self._entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries["0x%064x" % 1]["version"], 2)
+        # The oldest first.
+        self.assertEqual(self.queue.claim()["token"], "0x%064x" % 2)
+        self.assertEqual(self.queue.claim()["token"], "0x%064x" % 1)
+        self.assertIsNone(self.queue.claim())
+
+    def test_complete_removes_the_entry(self):
+        self.queue.enqueue([1])
+        entry = self.queue.claim()
+        self.queue.complete(entry)
+        self.assertEqual(self._entries(), {})
+
+    def test_enqueued_while_claimed_is_done_again(self):
+        self.queue.enqueue([1])
+        entry = self.queue.claim()
+        self.queue.enqueue([1])
+        # Still claimed: nobody else takes it meanwhile.
+        self.assertEqual(self._entries()["0x%064x" % 1]["status"], "claimed")
+        self.assertIsNone(self.queue.claim())
+        self.queue.complete(entry)
+        [stored] = self._entries().values()
+        self.assertEqual((stored["status"], stored["version"]), ("pending", 2))
+        self.assertNotIn("claimed_until", stored)
+        entry = self.queue.claim()
+        self.assertEqual(entry["version"], 2)
+        self.queue.complete(entry)
+        self.assertEqual(self._entries(), {})
+
+    def test_expired_claims_are_claimed_again(self):
+        queue = MetadataQueue(self.db, lease_seconds=0.05)
+        queue.enqueue([1])
+        stale = queue.claim()
+        self.assertIsNone(queue.claim())
+        time.sleep(0.1)
+        queue.enqueue([1])
+        current = queue.claim()
+        self.assertEqual(current["version"], 2)
+        # The stale claim neither removes nor releases the entry.
+        queue.complete(stale)
+        queue.release(stale, 0)
+        [stored] = self._entries().values()
+        self.assertEqual((stored["status"], stored["claimed_until"]), ("claimed", current["claimed_until"]))
+        queue.complete(current)
+        self.assertEqual(self._entries(), {})
+
+    def test_release_delays_the_entry(self):
+        self.queue.enqueue([1])
+        self.queue.release(self.queue.claim(), 60)
+        self.assertEqual(self._entries()["0x%064x" % 1]["status"], "pending")
+        self.assertIsNone(self.queue.claim())
+        self.queue.enqueue([2], delay=60)
+        self.assertIsNone(self.queue.claim())
+
+
+if __name__ == "__main__":
+    unittest.main()
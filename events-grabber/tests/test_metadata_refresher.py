@@ -0,0 +1,84 @@
+"""
+Tests of refreshing the broken (INVALID / UNKNOWN) token metadata,
+against a local stub server. Run them from the events-grabber
+directory:
+
+    python -m unittest discover -s tests
+"""
+
+import json
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from web3 import Web3
+from stubs import StubServer
+from metadata import MetadataFetcher, MetadataQueue, MetadataWorkers, MetadataRefresher
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+TOKENS_METADATA = "tokens_metadata"
+TOKEN = "0x%064x" % 7
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MetadataRefresherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.available = False
+        self.server = StubServer(self._respond)
+        self.db = mongomock.MongoClient().db
+        self.queue = MetadataQueue(self.db)
+        fetcher = MetadataFetcher(SimpleNamespace(w3=Web3()))
+        self.workers = MetadataWorkers(self.db, self.queue, fetcher, TOKENS_METADATA)
+        self.refresher = MetadataRefresher(self.db, self.queue, TOKENS_METADATA, base_delay=300)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if not self.available:
+            return 404, {}, b""
+        return 200, {"Content-Type": "application/json"}, json.dumps({"name": "token"}).encode()
+
+    def _process(self, url: str):
+        entry = self.queue.claim()
+        self.assertEqual(entry["token"], TOKEN)
+        self.workers._process(entry, url)
+
+    def _stored(self) -> dict:
+        return self.db[TOKENS_METADATA].find_one({"token": TOKEN})
+
+    def _refresh(self) -> int:
+        # The next attempt is due right away.
+        self.db[TOKENS_METADATA].update_one({"token": TOKEN, "refresh": {"$exists": True}},
+                                            {"$set": {"refresh.after": datetime.now(timezone.utc)}})
+        self.assertEqual(self.refresher.refresh_once(), 1)
+        return self._stored()["refresh"]["attempts"]
+
+    def test_attempts_survive_placeholders(self):
+        # No URI yet: UNKNOWN.
+        self.queue.enqueue([7])
+        self._process("")
+        self.assertEqual(self._stored()["metadata"]["name"], "UNKNOWN")
+        self.assertEqual(self._refresh(), 1)
+        # A URI that fails: INVALID, another placeholder.
+        self._process(self.server.url + "/7.json")
+        self.assertEqual(self._stored()["metadata"]["name"], "INVALID")
+        self.assertEqual(self._stored()["refresh"]["attempts"], 1)
+        self.assertEqual(self._refresh(), 2)
+        self._process(self.server.url + "/7.json")
+        self.assertEqual(self._refresh(), 3)
+        self.assertEqual(self.refresher._delay(3), 1200)
+        # A good metadata: the attempts are gone.
+        self.available = True
+        self._process(self.server.url + "/7.json")
+        self.assertEqual(self._stored()["metadata"]["name"], "token")
+        self.assertNotIn("refresh", self._stored())
+        self.assertEqual(self.refresher.refresh_once(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
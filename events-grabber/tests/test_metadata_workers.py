@@ -0,0 +1,73 @@
+"""
+Tests of the metadata workers storing the downloaded metadata, against
+a local stub server. Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from web3 import Web3
+from stubs import StubServer
+from metadata import MetadataFetcher, MetadataQueue, MetadataWorkers
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+TOKENS_METADATA = "tokens_metadata"
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class MetadataWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {"name": "first", "description": "", "image": "", "properties": {}}
+        self.server = StubServer(self._respond)
+        self.db = mongomock.MongoClient().db
+        self.queue = MetadataQueue(self.db)
+        fetcher = MetadataFetcher(SimpleNamespace(w3=Web3()))
+        self.workers = MetadataWorkers(self.db, self.queue, fetcher, TOKENS_METADATA)
+        self.url = self.server.url + "/7.json"
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        return 200, {"Content-Type": "application/json"}, json.dumps(self.document).encode()
+
+    def _process(self) -> int:
+        """
+        Enqueues, claims and processes the token, and tells how many
+        times its metadata was written.
+        """
+
+        self.queue.enqueue([7])
+        entry = self.queue.claim()
+        collection = self.workers._tokens_metadata
+        with mock.patch.object(collection, "replace_one", wraps=collection.replace_one) as replace_one:
+            self.workers._process(entry, self.url)
+        self.assertEqual(self.db[MetadataQueue.QUEUE].count_documents({}), 0)
+        return replace_one.call_count
+
+    def test_unchanged_metadata_is_not_written_again(self):
+        self.assertEqual(self._process(), 1)
+        stored = self.db[TOKENS_METADATA].find_one({"token": "0x%064x" % 7})
+        self.assertEqual(stored["metadata"]["name"], "first")
+        self.assertEqual(self._process(), 0)
+        self.assertEqual(self.db[TOKENS_METADATA].find_one({"token": "0x%064x" % 7}), stored)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_changed_metadata_is_written(self):
+        self.assertEqual(self._process(), 1)
+        self.document["name"] = "second"
+        self.assertEqual(self._process(), 1)
+        stored = self.db[TOKENS_METADATA].find_one({"token": "0x%064x" % 7})
+        self.assertEqual(stored["metadata"]["name"], "second")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Tests of the aggregation of contract calls, against a local stub node.
+Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+from eth_abi import decode, encode
+from stubs import JsonRpcStub, StubError
+from contracts.multicall import Multicall, MULTICALL3_ADDRESS
+from rpc import make_web3
+
+
+TARGET = "0x00000000000000000000000000000000000000aa"
+# A view function doubling its argument.
+TARGET_ABI = [{"type": "function", "name": "double", "stateMutability": "view",
+               "inputs": [{"name": "value", "type": "uint256"}], "outputs": [{"name": "", "type": "uint256"}]}]
+
+
+def _double(data: str) -> str:
+    value, = decode(["uint256"], bytes.fromhex(data[10:]))
+    return "0x" + encode(["uint256"], [2 * value]).hex()
+
+
+class MulticallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregate3_fails = False
+        self.node = JsonRpcStub(100, {
+            "eth_chainId": lambda params: "0x1",
+            "eth_getCode": lambda params: "0x6001",
+            "eth_call": self._call,
+        })
+        self.web3 = make_web3(self.node.url)
+        self.contract = self.web3.eth.contract(address=self.web3.to_checksum_address(TARGET), abi=TARGET_ABI)
+
+    def tearDown(self):
+        self.node.close()
+
+    def _call(self, params: list) -> str:
+        to, data = params[0]["to"].lower(), params[0]["data"]
+        if to == TARGET:
+            return _double(data)
+        if to == MULTICALL3_ADDRESS.lower():
+            if self.aggregate3_fails:
+                raise StubError(-32000, "out of gas")
+            calls, = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))
+            results = [(True, bytes.fromhex(_double("0x" + call_data.hex())[2:])) for _, _, call_data in calls]
+            return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+        raise StubError(-32000, "execution reverted")
+
+    def _calls_to(self, address: str) -> list:
+        return [params for params in self.node.calls("eth_call") if params[0]["to"].lower() == address.lower()]
+
+    def _batches(self) -> list:
+        return [body for _, _, _, body in self.node.requests if body.startswith(b"[")]
+
+    def test_aggregates_with_multicall3(self):
+        multicall = Multicall(self.web3)
+        values = multicall.aggregate([self.contract.functions.double(value) for value in range(5)])
+        self.assertEqual(values, [0, 2, 4, 6, 8])
+        self.assertEqual(len(self._calls_to(MULTICALL3_ADDRESS)), 1)
+        self.assertEqual(self._calls_to(TARGET), [])
+
+    def test_falls_back_to_a_batch_when_aggregate3_fails(self):
+        self.aggregate3_fails = True
+        multicall = Multicall(self.web3)
+        values = multicall.aggregate([self.contract.functions.double(value) for value in range(5)], 100)
+        self.assertEqual(values, [0, 2, 4, 6, 8])
+        self.assertEqual(len(self._calls_to(MULTICALL3_ADDRESS)), 1)
+        # The calls went in a single batch, pinned to the same block.
+        self.assertEqual(len(self._batches()), 1)
+        self.assertEqual([params[1] for params in self._calls_to(TARGET)], ["0x64"] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests of the event ingestion pipeline, with handlers fetching from
+memory. Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.pipeline import EventPipeline
+from handlers.streams import pack_position
+
+
+class _Handler:
+    """
+    Fetches its events from memory, in batches of one block, and
+    applies them into a shared list.
+    """
+
+    def __init__(self, name: str, events: dict, applied: list, fail_fetching_at: int = None,
+                 fail_decoding_at: int = None):
+        """
+        :param events: The (block, log index) event positions, by block.
+        """
+
+        self.name = name
+        self._events = events
+        self._applied = applied
+        self._fail_fetching_at = fail_fetching_at
+        self._fail_decoding_at = fail_decoding_at
+
+    def iter_batches(self, start_block: int, end_block: int):
+        for block in range(start_block, end_block + 1):
+            if block == self._fail_fetching_at:
+                raise ConnectionError(f"fetching block {block}")
+            yield [(block, log_index) for log_index in self._events.get(block, [])]
+
+    def decode_batch(self, batch: list):
+        for block, log_index in batch:
+            if block == self._fail_decoding_at:
+                raise ValueError(f"decoding block {block}")
+            yield pack_position(block, 0, log_index), self._applied.append, ((self.name, block, log_index),)
+
+
+class EventPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.applied = []
+
+    def _pipeline(self, *handlers, start_block: int = 1, end_block: int = 10) -> EventPipeline:
+        pipeline = EventPipeline(list(handlers), start_block, end_block, 2, 2, 4)
+        self.addCleanup(pipeline.close)
+        return pipeline
+
+    def test_merges_by_position(self):
+        pipeline = self._pipeline(_Handler("a", {1: [0, 2], 3: [1]}, self.applied),
+                                  _Handler("b", {1: [1], 2: [0], 3: [0]}, self.applied))
+        self.assertEqual(pipeline.process(10), 10)
+        self.assertEqual(self.applied, [("a", 1, 0), ("b", 1, 1), ("a", 1, 2), ("b", 2, 0),
+                                        ("b", 3, 0), ("a", 3, 1)])
+
+    def test_stops_at_a_block_boundary(self):
+        pipeline = self._pipeline(_Handler("a", {2: [0, 1, 2], 4: [0], 5: [0, 1]}, self.applied),
+                                  _Handler("b", {2: [3], 5: [2]}, self.applied))
+        # Block 2 is never split, even if it holds more events.
+        self.assertEqual(pipeline.process(10, 2), 3)
+        self.assertEqual(len(self.applied), 4)
+        self.assertEqual(pipeline.process(10, 1), 4)
+        self.assertEqual(self.applied[-1], ("a", 4, 0))
+        # The processing goes up to the end block, and then on.
+        self.assertEqual(pipeline.process(4), 4)
+        self.assertEqual(pipeline.process(10, 1), 10)
+        self.assertEqual(self.applied[-3:], [("a", 5, 0), ("a", 5, 1), ("b", 5, 2)])
+
+    def test_propagates_fetch_errors(self):
+        pipeline = self._pipeline(_Handler("a", {1: [0], 3: [0], 6: [0]}, self.applied, fail_fetching_at=5),
+                                  _Handler("b", {2: [0]}, self.applied))
+        self.assertEqual(pipeline.process(2), 2)
+        with self.assertRaisesRegex(ConnectionError, "fetching block 5"):
+            pipeline.process(10)
+        self.assertEqual(self.applied, [("a", 1, 0), ("b", 2, 0), ("a", 3, 0)])
+
+    def test_propagates_decode_errors(self):
+        pipeline = self._pipeline(_Handler("a", {1: [0]}, self.applied),
+                                  _Handler("b", {3: [0]}, self.applied, fail_decoding_at=3))
+        with self.assertRaisesRegex(ValueError, "decoding block 3"):
+            pipeline.process(10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests of rolling back the journaled blocks on reorgs. Run them from
+the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+from types import SimpleNamespace
+from eth_utils import encode_hex
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.balances import BalanceDeltas, from_limbs
+from handlers.journal import ReorgJournal
+from handlers.writes import WriteBuffer
+from runner import _rollback_reorgs, _set_last_processed_block, _get_last_processed_block_number
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+def _dump(db) -> dict:
+    """
+    Gets the contents of the written collections, comparable.
+    """
+
+    contents = {name: sorted(repr(sorted(document.items())) for document in db[name].find())
+                for name in ("parameters", "deals")}
+    contents["balances"] = sorted((balance["owner"], balance["token"], from_limbs(balance["limbs"]))
+                                  for balance in db["balances"].find())
+    return contents
+
+
+class _Web3:
+    """
+    Just tells the hashes of the blocks.
+    """
+
+    def __init__(self, hashes: dict):
+        self.eth = SimpleNamespace(get_block=lambda number: {"hash": hashes[number]})
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class JournalRollbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.db = self.client.db
+        self.write_buffer = WriteBuffer(self.db)
+        self.deltas = BalanceDeltas("balances")
+        self.write_buffer.attach(self.deltas)
+        self.write_buffer.replace_one("parameters", {"key": "a"}, {"key": "a", "value": "1"}, True)
+        self.deltas.add("alice", "1", 10)
+        self.write_buffer.flush()
+
+    def _journaled(self, from_block: int, to_block: int, block_hash: str, writes):
+        journal = ReorgJournal(from_block)
+        self.write_buffer.use_journal(journal)
+        writes(journal)
+        self.write_buffer.flush()
+        self.write_buffer.use_journal(None)
+        journal.commit(self.db, {}, to_block, block_hash)
+
+    def _block_5(self, journal: ReorgJournal):
+        self.write_buffer.replace_one("parameters", {"key": "a"}, {"key": "a", "value": "2"}, True)
+        self.write_buffer.update_one("parameters", {"key": "a"}, {"$set": {"extra": True}})
+        self.write_buffer.replace_one("parameters", {"key": "b"}, {"key": "b", "value": "1"}, True)
+        self.write_buffer.insert_one("deals", {"index": 1})
+        self.deltas.add("alice", "1", -3)
+        self.deltas.add("bob", "1", 4)
+        journal.record_metadata([7])
+
+    def test_rollback_restores_the_prior_state(self):
+        before = _dump(self.db)
+        self._journaled(5, 5, "0x05", self._block_5)
+        # Other handlers, processing the same block later, append to
+        # the entry: "a" is captured again, in its already changed state.
+        journal = ReorgJournal(5)
+        self.write_buffer.use_journal(journal)
+        self.write_buffer.update_one("parameters", {"key": "a"}, {"$set": {"value": "3"}})
+        self.deltas.add("alice", "1", 1)
+        self.write_buffer.flush()
+        self.write_buffer.use_journal(None)
+        journal.append_to(self.db, {}, 5)
+        self.assertNotEqual(before, _dump(self.db))
+
+        [entry] = ReorgJournal.entries(self.db)
+        ReorgJournal.rollback(self.db, {}, entry)
+        self.assertEqual(before, _dump(self.db))
+        self.assertEqual(ReorgJournal.entries(self.db), [])
+        queued = self.db["metadata_queue"].find_one({"token": "0x%064x" % 7})
+        self.assertEqual(queued["status"], "pending")
+
+    def _reorg(self, hashes: dict):
+        self._journaled(5, 5, encode_hex(b"5"), self._block_5)
+        self._journaled(6, 6, encode_hex(b"6"), lambda journal: self.deltas.add("carol", "1", 1))
+        _set_last_processed_block(self.client, "db", {}, 6)
+        handlers = SimpleNamespace(handlers=[SimpleNamespace(name="economy"), SimpleNamespace(name="metaverse")])
+        return _rollback_reorgs(self.client, "db", _Web3(hashes), False, handlers)
+
+    def test_rollback_until_the_fork_point(self):
+        self.assertTrue(self._reorg({5: b"5", 6: b"x"}))
+        self.assertEqual([entry["to_block"] for entry in ReorgJournal.entries(self.db)], [5])
+        self.assertEqual(_get_last_processed_block_number(self.client, "db", {}), 5)
+        self.assertIsNone(self.db["state"].find_one({"reset_of": {"$exists": True}}))
+
+    def test_deeper_reorg_rebuilds_the_handlers(self):
+        self.assertTrue(self._reorg({5: b"x", 6: b"y"}))
+        self.assertEqual(ReorgJournal.entries(self.db), [])
+        self.assertEqual(_get_last_processed_block_number(self.client, "db", {}), 4)
+        requests = self.db["state"].find({"reset_of": {"$exists": True}})
+        self.assertEqual(sorted(request["reset_of"] for request in requests), ["economy", "metaverse"])
+
+    def test_no_reorg(self):
+        self.assertFalse(self._reorg({5: b"5", 6: b"6"}))
+        self.assertEqual(len(ReorgJournal.entries(self.db)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
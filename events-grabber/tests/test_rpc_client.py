@@ -0,0 +1,116 @@
+"""
+Tests of the lean JSON-RPC client, against local stub nodes. Run them
+from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import gzip
+import json
+import unittest
+from unittest import mock
+import requests
+from stubs import StubServer, StubError, JsonRpcStub
+from rpc import JsonRpcClient, JsonRpcError, LogRecord
+
+
+def _json(payload) -> tuple:
+    return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode()
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.statuses = [503, 503]
+        self.server = StubServer(self._respond)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if self.statuses:
+            return self.statuses.pop(0), {"Retry-After": "0.05"}, b"busy"
+        request = json.loads(body)
+        return _json({"jsonrpc": "2.0", "id": request["id"], "result": "0x10"})
+
+    def test_retries_transient_failures_with_full_jitter(self):
+        client = JsonRpcClient(self.server.url, retries=3, backoff_base=0.2, backoff_max=1)
+        with mock.patch("rpc.client.random.uniform", return_value=0.0) as uniform, \
+                mock.patch("rpc.client.time.sleep") as sleep:
+            self.assertEqual(client.block_number(), 16)
+        self.assertEqual(len(self.server.requests), 3)
+        # A random delay up to a doubling backoff (but at least what
+        # the node tells).
+        self.assertEqual([call.args for call in uniform.call_args_list], [(0, 0.2), (0, 0.4)])
+        self.assertEqual([call.args for call in sleep.call_args_list], [(0.05,), (0.05,)])
+
+    def test_gives_up_after_the_retries(self):
+        self.statuses = [503] * 3
+        client = JsonRpcClient(self.server.url, retries=1, backoff_base=0.01)
+        with self.assertRaises(requests.HTTPError):
+            client.block_number()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_does_not_retry_other_failures(self):
+        self.statuses = [500]
+        client = JsonRpcClient(self.server.url, retries=3, backoff_base=0.01)
+        with self.assertRaises(requests.HTTPError):
+            client.block_number()
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class ResponsesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.close()
+
+    def test_gzip_responses(self):
+        def respond(method: str, path: str, headers: dict, body: bytes) -> tuple:
+            request = json.loads(body)
+            content = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": "0x2a"}).encode()
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                return 200, {"Content-Type": "application/json", "Content-Encoding": "gzip"}, gzip.compress(content)
+            return 200, {"Content-Type": "application/json"}, content
+
+        self.server = StubServer(respond)
+        self.assertEqual(JsonRpcClient(self.server.url).block_number(), 42)
+        self.assertIn("gzip", self.server.requests[0][2]["Accept-Encoding"])
+
+    def test_batch_responses_out_of_order(self):
+        def respond(method: str, path: str, headers: dict, body: bytes) -> tuple:
+            # Answered in reverse, and the second request is missing.
+            batch = json.loads(body)
+            return _json([{"jsonrpc": "2.0", "id": request["id"], "result": request["params"][0]}
+                          for index, request in reversed(list(enumerate(batch))) if index != 1])
+
+        self.server = StubServer(respond)
+        responses = JsonRpcClient(self.server.url).batch([("echo", ["a"]), ("echo", ["b"]), ("echo", ["c"])])
+        self.assertEqual([response.get("result") for response in responses], ["a", None, "c"])
+        self.assertEqual(responses[1]["error"]["message"], "Missing response")
+
+    def test_node_errors(self):
+        def fail(params):
+            raise StubError(-32000, "header not found")
+
+        self.server = JsonRpcStub(methods={"eth_call": fail})
+        client = JsonRpcClient(self.server.url)
+        with self.assertRaises(JsonRpcError) as context:
+            client.eth_call("0x" + "00" * 20, "0x")
+        self.assertEqual((context.exception.code, context.exception.message), (-32000, "header not found"))
+
+    def test_logs_as_records(self):
+        log = {"blockNumber": "0x10", "transactionIndex": "0x1", "logIndex": "0x2",
+               "topics": ["0x" + "aa" * 32, "0x" + "bb" * 32], "data": "0x0102"}
+        self.server = JsonRpcStub(methods={"eth_getLogs": lambda params: [log]})
+        records = JsonRpcClient(self.server.url).get_logs({"fromBlock": 1, "toBlock": 20, "address": "0x1"})
+        self.assertEqual(records, [LogRecord(16, 1, 2, b"\xaa" * 32 + b"\xbb" * 32, b"\x01\x02")])
+        self.assertEqual(self.server.calls("eth_getLogs"), [[{"fromBlock": "0x1", "toBlock": "0x14",
+                                                              "address": "0x1"}]])
+
+
+if __name__ == "__main__":
+    unittest.main()
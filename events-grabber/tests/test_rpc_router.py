@@ -0,0 +1,93 @@
+"""
+Tests of the routing of JSON-RPC requests among many endpoints. Run
+them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import time
+import unittest
+from stubs import JsonRpcStub
+from rpc import JsonRpcClient, RoutedJsonRpcClient
+
+
+class RoutedJsonRpcClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = []
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.close()
+
+    def _node(self, head: int) -> JsonRpcStub:
+        node = JsonRpcStub(head, {"eth_getLogs": lambda params: [], "eth_chainId": lambda params: "0x1"})
+        self.nodes.append(node)
+        return node
+
+    def _client(self, **kwargs) -> RoutedJsonRpcClient:
+        client = RoutedJsonRpcClient([JsonRpcClient(node.url, retries=0) for node in self.nodes], **kwargs)
+        client._refresh_heads()
+        return client
+
+    def test_skips_lagging_endpoints(self):
+        synced, lagging = self._node(100), self._node(90)
+        client = self._client(max_lag=3)
+        for _ in range(20):
+            client.call("eth_chainId", [])
+        self.assertEqual(len(synced.calls("eth_chainId")), 20)
+        self.assertEqual(lagging.calls("eth_chainId"), [])
+
+    def test_sends_block_bounded_requests_to_endpoints_reaching_the_block(self):
+        ahead, behind = self._node(100), self._node(98)
+        client = self._client(max_lag=3)
+        for _ in range(20):
+            client.get_logs({"fromBlock": 90, "toBlock": 100})
+        self.assertEqual(len(ahead.calls("eth_getLogs")), 20)
+        self.assertEqual(behind.calls("eth_getLogs"), [])
+        # Requests up to a block both endpoints reached may go to any.
+        for _ in range(40):
+            client.get_logs({"fromBlock": 90, "toBlock": 95})
+        self.assertTrue(behind.calls("eth_getLogs"))
+
+    def test_asks_the_heads_again_for_blocks_beyond_them(self):
+        node = self._node(100)
+        client = self._client()
+        node.head = 105
+        client.get_logs({"fromBlock": 101, "toBlock": 105})
+        self.assertEqual(len(node.calls("eth_getLogs")), 1)
+        with self.assertRaises(Exception):
+            client.get_logs({"fromBlock": 101, "toBlock": 110})
+
+    def test_hedges_slow_requests(self):
+        fast, slow, behind = self._node(100), self._node(100), self._node(99)
+        fast.delays["eth_getLogs"] = 0.02
+        client = self._client(hedge_percentile=0.9, max_lag=3)
+        # The slow endpoint answers faster at first, so it's preferred.
+        for _ in range(30):
+            client.get_logs({"fromBlock": 90, "toBlock": 100})
+        slow.delays["eth_getLogs"] = 1.0
+        elapsed = []
+        for _ in range(5):
+            started = time.monotonic()
+            client.get_logs({"fromBlock": 90, "toBlock": 100})
+            elapsed.append(time.monotonic() - started)
+        self.assertLess(max(elapsed), 0.5)
+        self.assertGreater(len(fast.calls("eth_getLogs")), 0)
+        # The hedged copies are bounded to the block as well.
+        self.assertEqual(behind.calls("eth_getLogs"), [])
+
+    def test_does_not_wait_for_slow_heads(self):
+        fast, slow = self._node(100), self._node(100)
+        slow.delays["eth_blockNumber"] = 1.0
+        client = self._client(head_interval=0.5)
+        # The heads are due for a refresh: it must not hold the requests.
+        time.sleep(0.6)
+        for _ in range(5):
+            started = time.monotonic()
+            client.call("eth_chainId", [])
+            self.assertLess(time.monotonic() - started, 0.3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests of the event positions and of merging the handlers' streams.
+Run them from the events-grabber directory:
+
+    python -m unittest discover -s tests
+"""
+
+import random
+import unittest
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.streams import pack_position, unpack_position, merge_streams, batched, BackgroundStream
+
+
+class PositionsTest(unittest.TestCase):
+
+    def test_packed_positions_sort_like_tuples(self):
+        generator = random.Random(7)
+        positions = [(generator.randrange(1 << 30), generator.randrange(1 << 24), generator.randrange(1 << 24))
+                     for _ in range(1000)]
+        # Including the boundaries of each field.
+        positions += [(5, 0, 0), (5, 0, (1 << 24) - 1), (5, (1 << 24) - 1, (1 << 24) - 1), (6, 0, 0)]
+        self.assertEqual(sorted(positions, key=lambda position: pack_position(*position)), sorted(positions))
+        for position in positions:
+            self.assertEqual(unpack_position(pack_position(*position)), position)
+
+
+class MergeStreamsTest(unittest.TestCase):
+
+    @staticmethod
+    def _stream(name: str, positions: list, consumed: list):
+        for position in positions:
+            consumed.append((name, position))
+            yield pack_position(*position), name
+
+    def test_merges_by_position(self):
+        consumed = []
+        first = self._stream("a", [(1, 0, 0), (1, 2, 5), (3, 0, 0)], consumed)
+        second = self._stream("b", [(1, 1, 0), (2, 0, 0), (3, 0, 1)], consumed)
+        third = self._stream("c", [], consumed)
+        merged = [(unpack_position(position), name) for position, name in merge_streams([first, second, third])]
+        self.assertEqual(merged, [((1, 0, 0), "a"), ((1, 1, 0), "b"), ((1, 2, 5), "a"), ((2, 0, 0), "b"),
+                                  ((3, 0, 0), "a"), ((3, 0, 1), "b")])
+
+    def test_keeps_only_the_heads(self):
+        consumed = []
+        merged = merge_streams([self._stream("a", [(1, 0, 0), (4, 0, 0)], consumed),
+                                self._stream("b", [(2, 0, 0), (3, 0, 0)], consumed)])
+        self.assertEqual(next(merged)[1], "a")
+        self.assertEqual(consumed, [("a", (1, 0, 0)), ("b", (2, 0, 0))])
+        self.assertEqual([name for _, name in merged], ["b", "b", "a"])
+
+    def test_equal_positions_keep_the_streams_order(self):
+        merged = merge_streams([[(1, "a"), (2, "a")], [(1, "b"), (2, "b")]])
+        self.assertEqual(list(merged), [(1, "a"), (1, "b"), (2, "a"), (2, "b")])
+
+
+class BatchedTest(unittest.TestCase):
+
+    def test_batches(self):
+        self.assertEqual(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batched([], 3)), [])
+
+
+class BackgroundStreamTest(unittest.TestCase):
+
+    def test_yields_the_items(self):
+        stream = BackgroundStream(lambda: range(100), 4, "test")
+        self.assertEqual(list(stream), list(range(100)))
+
+    def test_errors_reach_the_consumer(self):
+        def produce():
+            yield 1
+            raise ConnectionError("node down")
+
+        stream = BackgroundStream(produce, 4, "test")
+        iterator = iter(stream)
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaises(ConnectionError):
+            next(iterator)
+
+    def test_closed_streams_end(self):
+        stream = BackgroundStream(lambda: iter(int, 1), 2, "test")
+        iterator = iter(stream)
+        self.assertEqual(next(iterator), 0)
+        stream.close()
+        # At most the queued items are left.
+        self.assertLessEqual(len(list(iterator)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
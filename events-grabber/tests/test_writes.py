@@ -0,0 +1,115 @@
+"""
+Tests of the write buffer: ordered bulk writes per collection, and
+the coalesced writes attached to it. Run them from the events-grabber
+directory:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+from unittest import mock
+import stubs  # noqa: F401 (makes the app importable)
+from handlers.writes import WriteBuffer, CoalescedWrites
+try:
+    import mongomock
+    from mongomock.collection import Collection
+except ImportError:
+    mongomock = None
+
+
+class _Counter(CoalescedWrites):
+    """
+    Counts increments in memory, and adds them to a document when
+    flushed.
+    """
+
+    def __init__(self, flushes: list):
+        self.amount = 0
+        self._flushes = flushes
+
+    def __len__(self):
+        return 1 if self.amount else 0
+
+    def add(self, amount: int):
+        self.amount += amount
+
+    def flush(self, db, session_kwargs: dict, journal=None):
+        if self.amount:
+            db["counters"].update_one({"key": "c"}, {"$inc": {"value": self.amount}}, upsert=True, **session_kwargs)
+            self._flushes.append(self.amount)
+        self.amount = 0
+
+    def discard(self):
+        self.amount = 0
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class WriteBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.flushes = []
+        self.counter = _Counter(self.flushes)
+
+    def _buffer(self, max_pending: int = 100) -> WriteBuffer:
+        write_buffer = WriteBuffer(self.db, max_pending)
+        write_buffer.attach(self.counter)
+        return write_buffer
+
+    def _bulk_writes(self):
+        original = Collection.bulk_write
+        return mock.patch.object(Collection, "bulk_write", autospec=True, side_effect=original)
+
+    def test_one_ordered_bulk_write_per_collection(self):
+        write_buffer = self._buffer()
+        write_buffer.update_one("parameters", {"key": "k"}, {"$set": {"value": 1}}, upsert=True)
+        write_buffer.insert_one("deals", {"index": 1})
+        write_buffer.replace_one("parameters", {"key": "k"}, {"key": "k", "value": 2}, upsert=True)
+        write_buffer.update_one("parameters", {"key": "k"}, {"$inc": {"value": 1}})
+        write_buffer.insert_one("deals", {"index": 2})
+        self.assertEqual(len(write_buffer), 5)
+        with self._bulk_writes() as bulk_write:
+            write_buffer.flush()
+        self.assertEqual(len(write_buffer), 0)
+        calls = {call.args[0].name: call for call in bulk_write.call_args_list}
+        self.assertEqual(sorted(calls), ["deals", "parameters"])
+        self.assertEqual([len(call.args[1]) for call in calls.values()], [3, 2])
+        self.assertTrue(all(call.kwargs["ordered"] for call in calls.values()))
+        # Applied in the order they were issued.
+        self.assertEqual(self.db["parameters"].find_one({"key": "k"}, {"_id": 0}), {"key": "k", "value": 3})
+        self.assertEqual([deal["index"] for deal in self.db["deals"].find()], [1, 2])
+        # Nothing pending: nothing is sent.
+        with self._bulk_writes() as bulk_write:
+            write_buffer.flush()
+        self.assertEqual(bulk_write.call_count, 0)
+
+    def test_flushes_when_full(self):
+        write_buffer = self._buffer(max_pending=3)
+        self.counter.add(5)
+        write_buffer.insert_one("deals", {"index": 1})
+        self.assertEqual(self.db["deals"].count_documents({}), 0)
+        # The coalesced writes count as pending as well.
+        write_buffer.insert_one("deals", {"index": 2})
+        self.assertEqual(len(write_buffer), 0)
+        self.assertEqual(self.db["deals"].count_documents({}), 2)
+        self.assertEqual(self.flushes, [5])
+
+    def test_coalesced_writes_are_flushed_and_discarded_along(self):
+        write_buffer = self._buffer()
+        self.counter.add(2)
+        self.counter.add(3)
+        write_buffer.flush()
+        self.assertEqual(self.db["counters"].find_one({"key": "c"})["value"], 5)
+        self.assertEqual(self.flushes, [5])
+        # A new session discards whatever is pending.
+        self.counter.add(4)
+        write_buffer.insert_one("deals", {"index": 1})
+        write_buffer.use_session({})
+        self.assertEqual(len(write_buffer), 0)
+        write_buffer.flush()
+        self.assertEqual(self.db["deals"].count_documents({}), 0)
+        self.assertEqual(self.flushes, [5])
+
+
+if __name__ == "__main__":
+    unittest.main()